@@ -69,7 +69,7 @@ from .rostime import Time, Duration, get_rostime, get_time
 from .service import ServiceException
 
 # - use tcp ros implementation of services
-from .impl.tcpros_service import Service, ServiceProxy, wait_for_service
+from .impl.tcpros_service import Service, ServiceProxy, wait_for_service, wait_for_services
 from .topics import Message, SubscribeListener, Publisher, Subscriber
 
 ## \defgroup validators Validators
@@ -83,6 +83,7 @@ __all__ = [
     'get_master',
     'get_published_topics',
     'wait_for_service',
+    'wait_for_services',
     'on_shutdown',
     'get_param',
     'get_param_cached',
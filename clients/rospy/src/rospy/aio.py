@@ -0,0 +1,478 @@
+# Software License Agreement (BSD License)
+#
+# Copyright (c) 2008, Willow Garage, Inc.
+# All rights reserved.
+#
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions
+# are met:
+#
+#  * Redistributions of source code must retain the above copyright
+#    notice, this list of conditions and the following disclaimer.
+#  * Redistributions in binary form must reproduce the above
+#    copyright notice, this list of conditions and the following
+#    disclaimer in the documentation and/or other materials provided
+#    with the distribution.
+#  * Neither the name of Willow Garage, Inc. nor the names of its
+#    contributors may be used to endorse or promote products derived
+#    from this software without specific prior written permission.
+#
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS
+# "AS IS" AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT
+# LIMITED TO, THE IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS
+# FOR A PARTICULAR PURPOSE ARE DISCLAIMED. IN NO EVENT SHALL THE
+# COPYRIGHT OWNER OR CONTRIBUTORS BE LIABLE FOR ANY DIRECT, INDIRECT,
+# INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL DAMAGES (INCLUDING,
+# BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES;
+# LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER
+# CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT
+# LIABILITY, OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN
+# ANY WAY OUT OF THE USE OF THIS SOFTWARE, EVEN IF ADVISED OF THE
+# POSSIBILITY OF SUCH DAMAGE.
+#
+# Revision $Id$
+
+"""
+asyncio interface to rospy.
+
+Publishers, subscriptions and service calls that can be used from
+coroutines without wrapping callbacks in C{call_soon_threadsafe} or
+service calls in executor threads::
+
+  import rospy, rospy.aio
+
+  async def main():
+      pub = rospy.aio.Publisher('chatter_out', String, queue_size=10)
+      async with rospy.aio.Subscriber('chatter', String) as sub:
+          async for msg in sub:
+              await pub.publish(msg)
+
+  rospy.init_node('relay', disable_signals=True)
+  asyncio.run(main())
+
+Messages are received on rospy's threads by default.  Nodes that call
+L{use_asyncio_transport()} receive all their subscriber connections,
+and flush the queues of their publisher connections, on the event loop
+instead, so a single thread handles any number of connections.
+"""
+
+import asyncio
+import collections
+import struct
+from io import BytesIO
+
+import rosgraph
+import rosgraph.network
+
+import rospy.core
+import rospy.exceptions
+import rospy.impl.reactor
+import rospy.msg
+import rospy.names
+import rospy.topics
+from rospy.impl.reactor import EVENT_READ, EVENT_WRITE
+from rospy.impl.tcpros_service import TCPROSServiceClient, get_service_connection_pool, \
+    wait_for_service as _wait_for_service
+from rospy.service import ServiceException
+
+def _get_running_loop():
+    try:
+        return asyncio.get_running_loop()
+    except RuntimeError:
+        return None
+
+class AsyncioReactor(object):
+    """
+    L{rospy.impl.reactor.Reactor} implementation driven by an asyncio
+    event loop: handlers are called on the loop's thread.
+    """
+
+    def __init__(self, loop):
+        """
+        ctor.
+        @param loop: event loop watching the sockets
+        @type  loop: asyncio.AbstractEventLoop
+        """
+        self.loop = loop
+        self.threads = 1
+        self._handlers = {} # fileno -> (handler, events)
+
+    def _call(self, fn, *args):
+        if _get_running_loop() is self.loop:
+            fn(*args)
+        elif not self.loop.is_closed():
+            self.loop.call_soon_threadsafe(fn, *args)
+
+    def register(self, handler, events=EVENT_READ):
+        self._call(self._register, handler, events)
+
+    def modify(self, handler, events):
+        self._call(self._modify, handler, events)
+
+    def unregister(self, handler):
+        self._call(self._unregister, handler)
+
+    def call_soon(self, handler, fn, *args):
+        self._call(fn, *args)
+
+    def shutdown(self):
+        self._call(self._shutdown)
+
+    def _register(self, handler, events):
+        fileno = handler.fileno()
+        old = self._handlers.get(fileno)
+        if old is not None and old[0] is not handler:
+            # the descriptor of a closed socket has been reused
+            self._unregister(old[0])
+        try:
+            self._watch(fileno, handler, events)
+        except (TypeError, ValueError, OSError) as e:
+            self._handlers.pop(fileno, None)
+            handler.handle_error(e)
+
+    def _watch(self, fileno, handler, events):
+        self.loop.remove_reader(fileno)
+        self.loop.remove_writer(fileno)
+        self._handlers[fileno] = (handler, events)
+        if events & EVENT_READ:
+            self.loop.add_reader(fileno, self._dispatch, handler, handler.handle_read)
+        if events & EVENT_WRITE:
+            self.loop.add_writer(fileno, self._dispatch, handler, handler.handle_write)
+
+    def _modify(self, handler, events):
+        for fileno, (h, _) in list(self._handlers.items()):
+            if h is handler:
+                self._watch(fileno, handler, events)
+
+    def _unregister(self, handler):
+        for fileno, (h, _) in list(self._handlers.items()):
+            if h is handler:
+                del self._handlers[fileno]
+                try:
+                    self.loop.remove_reader(fileno)
+                    self.loop.remove_writer(fileno)
+                except (ValueError, OSError):
+                    pass
+
+    def _dispatch(self, handler, fn):
+        try:
+            fn()
+        except Exception as e:
+            self._unregister(handler)
+            try:
+                handler.handle_error(e)
+            except Exception as e:
+                rospy.core.rospydebug("reactor handler error: %r", e)
+
+    def _shutdown(self):
+        for handler, _ in list(self._handlers.values()):
+            self._unregister(handler)
+
+def use_asyncio_transport(loop=None):
+    """
+    Receive the messages of new subscriber connections on the event
+    loop instead of on threads.  Subscriber callbacks, including the
+    ones of plain L{rospy.Subscriber}s, then run on the loop and must
+    not block.  Call before subscribing.
+    @param loop: event loop [default: the running loop]
+    @type  loop: asyncio.AbstractEventLoop
+    """
+    loop = loop or asyncio.get_event_loop()
+    rospy.impl.reactor.set_reactor(AsyncioReactor(loop))
+
+class Publisher(object):
+    """
+    Publisher whose L{publish()} can be awaited.  Publishing doesn't
+    block the event loop: with a queue_size, messages are queued for
+    the connections' writer threads, otherwise they are written from an
+    executor thread.
+    """
+
+    def __init__(self, name, data_class, **kwds):
+        """
+        ctor.  Arguments are those of L{rospy.Publisher}.
+        """
+        self.pub = rospy.topics.Publisher(name, data_class, **kwds)
+        self.name = self.pub.name
+        self.resolved_name = self.pub.resolved_name
+        self.data_class = data_class
+
+    async def publish(self, *args, **kwds):
+        """
+        Publish message data object.  See L{rospy.Publisher.publish()}.
+        """
+        if self.pub.impl is not None and self.pub.impl.queue_size is not None:
+            self.pub.publish(*args, **kwds)
+        else:
+            await asyncio.get_event_loop().run_in_executor(None, lambda: self.pub.publish(*args, **kwds))
+
+    def get_num_connections(self):
+        """
+        @return: number of subscriber connections
+        @rtype: int
+        """
+        return self.pub.get_num_connections()
+
+    async def wait_for_subscribers(self, count=1, timeout=None, poll_period=0.05):
+        """
+        Wait until the publisher has at least count subscriber connections.
+        @raise asyncio.TimeoutError: if timeout (in seconds) elapses first
+        """
+        async def wait():
+            while self.get_num_connections() < count:
+                await asyncio.sleep(poll_period)
+        await asyncio.wait_for(wait(), timeout)
+
+    def unregister(self):
+        """
+        Stop publishing.
+        """
+        self.pub.unregister()
+
+class Subscriber(object):
+    """
+    Subscription whose messages are consumed by coroutines, either with
+    C{async for msg in sub} or C{msg = await sub.get()}.
+
+    Messages are buffered in a queue of queue_size messages; when it is
+    full, the oldest message is dropped.  The subscription must be
+    created on the thread running the event loop.
+    """
+
+    def __init__(self, name, data_class, queue_size=100, loop=None, **kwds):
+        """
+        ctor.
+        @param name: name of topic to subscribe to
+        @type  name: str
+        @param data_class: data type class to use for messages
+        @type  data_class: L{Message} class
+        @param queue_size: number of messages buffered for the consumer
+        @type  queue_size: int
+        @param loop: event loop consuming the messages [default: the running loop]
+        @type  loop: asyncio.AbstractEventLoop
+        @param kwds: other arguments of L{rospy.Subscriber}
+        """
+        if queue_size < 1:
+            raise ValueError("queue_size must be at least 1")
+        self.loop = loop or asyncio.get_event_loop()
+        self.dropped = 0
+        self.closed = False
+        self._queue = collections.deque()
+        self._queue_size = queue_size
+        self._waiter = None
+        self.sub = rospy.topics.Subscriber(name, data_class, self._callback, **kwds)
+        self.name = self.sub.name
+        self.resolved_name = self.sub.resolved_name
+
+    def _callback(self, msg):
+        if _get_running_loop() is self.loop:
+            self._put(msg)
+        elif not self.loop.is_closed():
+            self.loop.call_soon_threadsafe(self._put, msg)
+
+    def _put(self, msg):
+        if self.closed:
+            return
+        if len(self._queue) >= self._queue_size:
+            self._queue.popleft()
+            self.dropped += 1
+        self._queue.append(msg)
+        self._wake()
+
+    def _wake(self):
+        if self._waiter is not None and not self._waiter.done():
+            self._waiter.set_result(None)
+
+    async def get(self):
+        """
+        Wait for the next message.
+        @return: the oldest queued message
+        @raise StopAsyncIteration: if the subscription has been unregistered
+        """
+        while not self._queue:
+            if self.closed:
+                raise StopAsyncIteration()
+            self._waiter = self.loop.create_future()
+            try:
+                await self._waiter
+            finally:
+                self._waiter = None
+        return self._queue.popleft()
+
+    def get_nowait(self):
+        """
+        @return: the oldest queued message, or None if there are none
+        """
+        return self._queue.popleft() if self._queue else None
+
+    def __aiter__(self):
+        return self
+
+    async def __anext__(self):
+        return await self.get()
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, exc_type, exc_value, tb):
+        self.unregister()
+
+    def get_num_connections(self):
+        """
+        @return: number of publisher connections
+        @rtype: int
+        """
+        return self.sub.get_num_connections()
+
+    def unregister(self):
+        """
+        Unsubscribe.  Consumers waiting for messages stop iterating once
+        the queued messages are consumed.
+        """
+        if not self.closed:
+            self.closed = True
+            self.sub.unregister()
+            if _get_running_loop() is self.loop:
+                self._wake()
+            elif not self.loop.is_closed():
+                self.loop.call_soon_threadsafe(self._wake)
+
+class ServiceProxy(object):
+    """
+    Service client whose calls are awaited.  Requests are sent over
+    asyncio streams, so calls don't occupy a thread while waiting for the
+    response.  Service lookups use the master's XML-RPC API from an
+    executor thread.
+
+    Usage::
+      add_two_ints = rospy.aio.ServiceProxy('add_two_ints', AddTwoInts)
+      resp = await add_two_ints(1, 2)
+
+    Pooled proxies send their calls with
+    L{rospy.ServiceProxy.call_async()} over the process-wide pool of
+    service connections, so concurrent calls do not wait for each other
+    and cancelling the awaiting task cancels the call::
+
+      add_two_ints = rospy.aio.ServiceProxy('add_two_ints', AddTwoInts, pooled=True)
+      sums = await asyncio.gather(*[add_two_ints(i, i) for i in range(100)])
+    """
+
+    def __init__(self, name, service_class, persistent=False, headers=None, pooled=False):
+        """
+        ctor.  Arguments are those of L{rospy.ServiceProxy}.  Calls on a
+        persistent proxy are sent one at a time over its connection.
+        """
+        self.resolved_name = rospy.names.resolve_name(name)
+        self.service_class = service_class
+        self.request_class = service_class._request_class
+        self.response_class = service_class._response_class
+        self.persistent = persistent
+        self.pooled = pooled
+        self.headers = dict(headers) if headers else None
+        if persistent:
+            headers = dict(headers or {})
+            headers['persistent'] = '1'
+        self.protocol = TCPROSServiceClient(self.resolved_name, service_class, headers=headers)
+        self.seq = 0
+        self._streams = None # (reader, writer) of the persistent connection
+        self._lock = asyncio.Lock()
+
+    async def wait_for_service(self, timeout=None):
+        """
+        Wait for the service to be available.  See L{rospy.wait_for_service()}.
+        """
+        await asyncio.get_event_loop().run_in_executor(None, _wait_for_service, self.resolved_name, timeout)
+
+    async def _lookup_service(self):
+        def lookup():
+            try:
+                master = rosgraph.Master(rospy.names.get_caller_id())
+                return master.lookupService(self.resolved_name)
+            except rosgraph.MasterError:
+                raise ServiceException("service [%s] unavailable"%self.resolved_name)
+            except (IOError, OSError):
+                raise ServiceException("unable to contact master")
+        uri = await asyncio.get_event_loop().run_in_executor(None, lookup)
+        try:
+            return rospy.core.parse_rosrpc_uri(uri)
+        except Exception:
+            raise ServiceException("master returned invalid ROSRPC URI: %s"%uri)
+
+    async def _connect(self):
+        dest_addr, dest_port = await self._lookup_service()
+        try:
+            reader, writer = await asyncio.open_connection(dest_addr, dest_port)
+        except (IOError, OSError) as e:
+            raise ServiceException("unable to connect to service: %s"%e)
+        try:
+            writer.write(rosgraph.network.encode_ros_handshake_header(self.protocol.get_header_fields()))
+            (size,) = struct.unpack('<I', await reader.readexactly(4))
+            header = rosgraph.network.decode_ros_handshake_header(struct.pack('<I', size) + await reader.readexactly(size))
+        except (asyncio.IncompleteReadError, IOError, OSError) as e:
+            writer.close()
+            raise ServiceException("unable to connect to service: %s"%e)
+        if 'error' in header:
+            writer.close()
+            raise ServiceException("unable to connect to service: remote error reported: %s"%header['error'])
+        return reader, writer
+
+    async def __call__(self, *args, **kwds):
+        """
+        Call the service.  See L{rospy.ServiceProxy.call()}.
+        """
+        return await self.call(*args, **kwds)
+
+    async def call(self, *args, **kwds):
+        """
+        Call the service. This accepts either a request message instance,
+        or you can call directly with arguments to create a new request instance.
+        @return: the response message
+        @raise TypeError: if request is not of the valid type (Message)
+        @raise ServiceException: if communication with remote service fails
+        """
+        request = rospy.msg.args_kwds_to_message(self.request_class, args, kwds)
+        if not self.request_class._type == request._type:
+            raise TypeError("request object type [%s] does not match service type [%s]"%(request.__class__, self.request_class))
+
+        if self.pooled:
+            return await asyncio.wrap_future(get_service_connection_pool().call_async(
+                self.resolved_name, self.service_class, request, headers=self.headers))
+
+        async with self._lock:
+            if self._streams is None:
+                self._streams = await self._connect()
+            reader, writer = self._streams
+            try:
+                self.seq += 1
+                b = BytesIO()
+                rospy.msg.serialize_message(b, self.seq, request)
+                writer.write(b.getvalue())
+                ok, size = struct.unpack('<BI', await reader.readexactly(5))
+                data = await reader.readexactly(size)
+            except (asyncio.IncompleteReadError, IOError, OSError) as e:
+                self._close()
+                if rospy.core.is_shutdown():
+                    raise rospy.exceptions.ROSInterruptException("node shutdown interrupted service call")
+                raise ServiceException("transport error completing service call: %s"%e)
+            except BaseException:
+                # cancelled mid-call: the connection is in an unknown state
+                self._close()
+                raise
+            finally:
+                if not self.persistent:
+                    self._close()
+
+        if not ok:
+            raise ServiceException("service [%s] responded with an error: %s"%(self.resolved_name, data.decode('utf-8', 'replace')))
+        response = self.response_class()
+        response.deserialize(data)
+        return response
+
+    def _close(self):
+        if self._streams is not None:
+            self._streams[1].close()
+            self._streams = None
+
+    def close(self):
+        """Close this ServiceProxy. This only has an effect on persistent ServiceProxy instances."""
+        self._close()
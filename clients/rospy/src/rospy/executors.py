@@ -0,0 +1,283 @@
+# Software License Agreement (BSD License)
+#
+# Copyright (c) 2008, Willow Garage, Inc.
+# All rights reserved.
+#
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions
+# are met:
+#
+#  * Redistributions of source code must retain the above copyright
+#    notice, this list of conditions and the following disclaimer.
+#  * Redistributions in binary form must reproduce the above
+#    copyright notice, this list of conditions and the following
+#    disclaimer in the documentation and/or other materials provided
+#    with the distribution.
+#  * Neither the name of Willow Garage, Inc. nor the names of its
+#    contributors may be used to endorse or promote products derived
+#    from this software without specific prior written permission.
+#
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS
+# "AS IS" AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT
+# LIMITED TO, THE IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS
+# FOR A PARTICULAR PURPOSE ARE DISCLAIMED. IN NO EVENT SHALL THE
+# COPYRIGHT OWNER OR CONTRIBUTORS BE LIABLE FOR ANY DIRECT, INDIRECT,
+# INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL DAMAGES (INCLUDING,
+# BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES;
+# LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER
+# CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT
+# LIABILITY, OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN
+# ANY WAY OUT OF THE USE OF THIS SOFTWARE, EVEN IF ADVISED OF THE
+# POSSIBILITY OF SUCH DAMAGE.
+#
+# Revision $Id$
+
+"""
+Callback executors for subscribers.
+
+By default, subscriber callbacks run on the thread that received the
+message (L{InlineExecutor}), so a slow callback stalls the reads of its
+connection.  Subscribers given another executor hand their messages to
+a bounded per-subscriber L{CallbackQueue} instead, whose callbacks run
+on the executor's threads::
+
+  pool = rospy.executors.ThreadPoolExecutor(threads=4)
+  rospy.Subscriber('points', PointCloud2, process, executor=pool,
+                   callback_queue_size=10, max_concurrency=2)
+
+When a callback queue is full, its oldest message is dropped.
+L{set_default_executor()} sets the executor of the subscribers that
+do not specify one, e.g. for a whole node.
+"""
+
+import collections
+import threading
+import traceback
+
+from rospy.core import add_shutdown_hook, is_shutdown, rospyerr
+
+#: L{CallbackQueue} overflow policy: drop the oldest waiting item
+DROP_OLDEST = 'drop_oldest'
+#: L{CallbackQueue} overflow policy: drop the item being queued
+DROP_NEWEST = 'drop_newest'
+
+class Executor(object):
+    """
+    Interface of callback executors.
+    """
+
+    def execute(self, fn, *args):
+        """
+        Run fn(*args), possibly on another thread.
+        @param fn: function to run
+        @type  fn: fn(*args)
+        """
+        raise NotImplementedError
+
+    def shutdown(self):
+        """
+        Stop running functions and release resources.
+        """
+        pass
+
+class InlineExecutor(Executor):
+    """
+    Run callbacks on the thread that received the message.
+    """
+
+    def execute(self, fn, *args):
+        fn(*args)
+
+class ThreadPoolExecutor(Executor):
+    """
+    Run callbacks on a pool of threads, which can be shared by
+    many subscribers.  Functions are run in the order they were
+    submitted.
+    """
+
+    def __init__(self, threads=4, name='rospy-executor'):
+        """
+        ctor.
+        @param threads: number of threads
+        @type  threads: int
+        @param name: thread name prefix
+        @type  name: str
+        @raise ValueError: if threads is less than 1
+        """
+        if threads < 1:
+            raise ValueError("threads must be at least 1")
+        self._tasks = collections.deque()
+        self._cond = threading.Condition()
+        self.done = False
+        self._threads = [threading.Thread(target=self._run, name='%s-%d' % (name, i)) for i in range(threads)]
+        for t in self._threads:
+            t.daemon = True
+            t.start()
+        add_shutdown_hook(self.shutdown)
+
+    @property
+    def threads(self):
+        """
+        Number of threads.
+        """
+        return len(self._threads)
+
+    def execute(self, fn, *args):
+        with self._cond:
+            self._tasks.append((fn, args))
+            self._cond.notify()
+
+    def _run(self):
+        while True:
+            with self._cond:
+                while not self._tasks and not self.done:
+                    self._cond.wait()
+                if self.done:
+                    return
+                fn, args = self._tasks.popleft()
+            try:
+                fn(*args)
+            except Exception:
+                if not is_shutdown():
+                    rospyerr("executor task failed:\n%s", traceback.format_exc())
+
+    def shutdown(self, reason=None):
+        with self._cond:
+            self.done = True
+            self._tasks.clear()
+            self._cond.notify_all()
+
+class SingleThreadedExecutor(ThreadPoolExecutor):
+    """
+    Run callbacks one at a time, in the order their messages were
+    received, on a dedicated thread.
+    """
+
+    def __init__(self, name='rospy-executor'):
+        super(SingleThreadedExecutor, self).__init__(threads=1, name=name)
+
+class CallbackQueue(object):
+    """
+    Bounded queue of the items of one subscriber or service waiting for
+    an L{Executor}.  At most concurrency items are handled at a time, in
+    order if concurrency is 1, and the oldest item is dropped when the
+    queue is full.  Each handled item is submitted to the executor
+    separately so that the queues sharing an executor take turns.
+    """
+
+    def __init__(self, executor, handler, queue_size=None, concurrency=1,
+                 overflow=DROP_OLDEST, dropped_callback=None):
+        """
+        ctor.
+        @param executor: executor running the handler
+        @type  executor: L{Executor}
+        @param handler: function handling an item
+        @type  handler: fn(item)
+        @param queue_size: maximum number of waiting items, or None
+        for no limit
+        @type  queue_size: int
+        @param concurrency: maximum number of items handled at a time
+        @type  concurrency: int
+        @param overflow: item dropped when the queue is full,
+        L{DROP_OLDEST} or L{DROP_NEWEST}
+        @type  overflow: str
+        @param dropped_callback: function called with each dropped item
+        @type  dropped_callback: fn(item)
+        @raise ValueError: if queue_size or concurrency is less than 1,
+        or overflow is invalid
+        """
+        if queue_size is not None and queue_size < 1:
+            raise ValueError("queue_size must be at least 1")
+        if concurrency < 1:
+            raise ValueError("concurrency must be at least 1")
+        if overflow not in (DROP_OLDEST, DROP_NEWEST):
+            raise ValueError("invalid overflow policy: %s"%overflow)
+        self.executor = executor
+        self.handler = handler
+        self.queue_size = queue_size
+        self.concurrency = concurrency
+        self.overflow = overflow
+        self.dropped_callback = dropped_callback
+        self._items = collections.deque()
+        self._lock = threading.Lock()
+        self._active = 0
+        self.closed = False
+        #STATS
+        self.dropped = 0
+
+    def __len__(self):
+        return len(self._items)
+
+    def put(self, item):
+        """
+        Queue item, dropping an item if the queue is full.
+        @return: False if item was dropped
+        @rtype: bool
+        """
+        dropped = None
+        with self._lock:
+            if self.closed:
+                return False
+            if self.queue_size is not None and len(self._items) >= self.queue_size:
+                self.dropped += 1
+                if self.overflow == DROP_NEWEST:
+                    dropped = item
+                else:
+                    dropped = self._items.popleft()
+            start = dropped is not item and self._active < self.concurrency
+            if dropped is not item:
+                self._items.append(item)
+            if start:
+                self._active += 1
+        if dropped is not None and self.dropped_callback is not None:
+            self.dropped_callback(dropped)
+        if start:
+            self.executor.execute(self._handle_next)
+        return dropped is not item
+
+    def _handle_next(self):
+        with self._lock:
+            if not self._items:
+                self._active -= 1
+                return
+            item = self._items.popleft()
+        try:
+            self.handler(item)
+        finally:
+            with self._lock:
+                again = bool(self._items) and not self.closed
+                if not again:
+                    self._active -= 1
+            if again:
+                self.executor.execute(self._handle_next)
+
+    def close(self):
+        """
+        Drop the waiting items and stop accepting new ones.
+        @return: the dropped items
+        @rtype: [item]
+        """
+        with self._lock:
+            self.closed = True
+            items = list(self._items)
+            self._items.clear()
+        return items
+
+_default_executor = InlineExecutor()
+
+def set_default_executor(executor):
+    """
+    Set the executor of the subscribers created afterwards without
+    an executor.
+    @param executor: executor, or None to run callbacks inline
+    @type  executor: L{Executor}
+    """
+    global _default_executor
+    _default_executor = executor if executor is not None else InlineExecutor()
+
+def get_default_executor():
+    """
+    @return: the executor of subscribers created without an executor
+    @rtype: L{Executor}
+    """
+    return _default_executor
@@ -0,0 +1,217 @@
+# Software License Agreement (BSD License)
+#
+# Copyright (c) 2008, Willow Garage, Inc.
+# All rights reserved.
+#
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions
+# are met:
+#
+#  * Redistributions of source code must retain the above copyright
+#    notice, this list of conditions and the following disclaimer.
+#  * Redistributions in binary form must reproduce the above
+#    copyright notice, this list of conditions and the following
+#    disclaimer in the documentation and/or other materials provided
+#    with the distribution.
+#  * Neither the name of Willow Garage, Inc. nor the names of its
+#    contributors may be used to endorse or promote products derived
+#    from this software without specific prior written permission.
+#
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS
+# "AS IS" AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT
+# LIMITED TO, THE IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS
+# FOR A PARTICULAR PURPOSE ARE DISCLAIMED. IN NO EVENT SHALL THE
+# COPYRIGHT OWNER OR CONTRIBUTORS BE LIABLE FOR ANY DIRECT, INDIRECT,
+# INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL DAMAGES (INCLUDING,
+# BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES;
+# LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER
+# CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT
+# LIABILITY, OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN
+# ANY WAY OUT OF THE USE OF THIS SOFTWARE, EVEN IF ADVISED OF THE
+# POSSIBILITY OF SUCH DAMAGE.
+#
+# Revision $Id$
+
+"""
+Internal use: intra-process transport for topics whose publisher and
+subscriber live in the same process.  Published messages are copied
+and the copies are handed to the subscriber callbacks without
+serialization or sockets.  The subscribers of a topic share the copy,
+so callbacks must treat it as read-only.
+"""
+
+import collections
+import os
+import threading
+import traceback
+
+from rospy.core import logdebug, rospyerr
+from rospy.exceptions import TransportTerminated
+
+from rospy.impl.tcpros_pubsub import TCPROSPub
+from rospy.impl.transport import Transport, INBOUND, OUTBOUND
+
+## name of the transport, as reported by getBusInfo()
+INTRAPROCESS = 'INTRAPROCESS'
+
+## environment variable disabling the intra-process transport when set to 0
+ROSPY_INTRAPROCESS = 'ROSPY_INTRAPROCESS'
+
+def is_intraprocess_enabled():
+    """
+    @return: True if publishers and subscribers in the same process
+    connect with the intra-process transport (the default)
+    @rtype: bool
+    """
+    return os.environ.get(ROSPY_INTRAPROCESS, '1') != '0'
+
+class IntraProcessTransport(Transport):
+    """
+    Base of the two ends of an intra-process connection.
+    """
+    transport_type = INTRAPROCESS
+
+    def __init__(self, direction, name, endpoint_id, header):
+        """
+        ctor.
+        @param direction: INBOUND or OUTBOUND
+        @type  direction: str
+        @param name: resolved topic name
+        @type  name: str
+        @param endpoint_id: publisher URI for the subscriber end,
+        caller ID for the publisher end
+        @type  endpoint_id: str
+        @param header: connection header of the publisher
+        @type  header: dict
+        """
+        super(IntraProcessTransport, self).__init__(direction, name=name)
+        self.endpoint_id = endpoint_id
+        self.header = header
+        self.callerid_pub = header['callerid']
+        self.is_latched = header.get('latching', '0') == '1'
+        self.latch = None
+
+    def get_transport_info(self):
+        """
+        Get detailed connection information.
+        """
+        return "%s connection to [%s]" % (self.transport_type, self.endpoint_id)
+
+class IntraProcessPub(IntraProcessTransport):
+    """
+    Publisher end of an intra-process connection.
+    """
+
+    def __init__(self, name, endpoint_id, header, sub_conn):
+        super(IntraProcessPub, self).__init__(OUTBOUND, name, endpoint_id, header)
+        self.sub_conn = sub_conn
+
+    def write_message(self, msg):
+        """
+        Queue msg for the subscriber.
+        @param msg: message to deliver
+        @type  msg: L{Message}
+        @raise TransportTerminated: if the connection was closed
+        """
+        if self.done:
+            raise TransportTerminated("connection closed")
+        self.sub_conn.deliver(msg)
+        self.stat_num_msg += 1
+
+    def close(self):
+        if not self.done:
+            super(IntraProcessPub, self).close()
+            # the subscriber end closes itself on its delivery thread
+            self.sub_conn.wake()
+
+class IntraProcessSub(IntraProcessTransport):
+    """
+    Subscriber end of an intra-process connection. Messages are queued
+    and passed to the subscriber callbacks on a delivery thread, so
+    publishing does not block on callbacks.
+    """
+
+    def __init__(self, name, endpoint_id, header, sub):
+        """
+        @param sub: subscription the messages are delivered to
+        @type  sub: L{rospy.topics._SubscriberImpl}
+        """
+        super(IntraProcessSub, self).__init__(INBOUND, name, endpoint_id, header)
+        self.sub = sub
+        self.pub_conn = None
+        self._cond = threading.Condition()
+        self._queue = collections.deque()
+        self._thread = None
+
+    def start(self, pub_conn):
+        """
+        Start delivering the messages written to pub_conn.
+        @param pub_conn: publisher end of the connection
+        @type  pub_conn: L{IntraProcessPub}
+        """
+        self.pub_conn = pub_conn
+        self._thread = threading.Thread(target=self._run, name='intraprocess-%s' % self.name)
+        self._thread.daemon = True
+        self._thread.start()
+
+    def deliver(self, msg):
+        with self._cond:
+            # same policy as TCPROS: only keep the newest queue_size messages
+            queue_size = self.sub.queue_size
+            if queue_size and len(self._queue) >= queue_size:
+                self._queue.popleft()
+            self._queue.append(msg)
+            self._cond.notify()
+
+    def wake(self):
+        with self._cond:
+            self._cond.notify()
+
+    def close(self):
+        if not self.done:
+            super(IntraProcessSub, self).close()
+            self.wake()
+
+    def _run(self):
+        pub_conn = self.pub_conn
+        try:
+            while True:
+                with self._cond:
+                    while not self._queue and not self.done and not pub_conn.done:
+                        self._cond.wait()
+                    if self.done or pub_conn.done:
+                        break
+                    msgs = list(self._queue)
+                    self._queue.clear()
+                self.stat_num_msg += len(msgs)
+                for m in msgs:
+                    m._connection_header = self.header
+                if self.is_latched:
+                    self.latch = msgs[-1]
+                self.sub.receive_callback(msgs, self)
+        except Exception:
+            if not self.done:
+                rospyerr("intra-process delivery on [%s] failed:\n%s", self.name, traceback.format_exc())
+        finally:
+            # close both ends from this thread, which holds no topic locks
+            logdebug("closing intra-process connection on [%s]", self.name)
+            self.close()
+            pub_conn.close()
+
+def create_intraprocess_connection(pub, sub, pub_uri):
+    """
+    Connect a publication to a subscription of the same process.
+    @param pub: publication
+    @type  pub: L{rospy.topics._PublisherImpl}
+    @param sub: subscription to the same topic
+    @type  sub: L{rospy.topics._SubscriberImpl}
+    @param pub_uri: XML-RPC URI of this node
+    @type  pub_uri: str
+    @return: subscriber end and publisher end of the connection
+    @rtype: (L{IntraProcessSub}, L{IntraProcessPub})
+    """
+    header = TCPROSPub(pub.resolved_name, pub.data_class, is_latch=pub.is_latch, headers=pub.headers).get_header_fields()
+    sub_conn = IntraProcessSub(sub.resolved_name, pub_uri, header, sub)
+    pub_conn = IntraProcessPub(pub.resolved_name, header['callerid'], header, sub_conn)
+    sub_conn.start(pub_conn)
+    return sub_conn, pub_conn
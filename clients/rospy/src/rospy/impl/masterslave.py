@@ -189,6 +189,12 @@ class ROSHandler(XmlRpcHandler):
 
         # initialize protocol handlers. The master will not have any.
         self.protocol_handlers = []
+        # UDPROS is only offered by subscriptions that asked for it
+        self.protocol_handlers.append(rospy.impl.tcpros.get_udpros_handler())
+        # SHMROS next: it is preferred for publishers on the same host
+        handler = rospy.impl.tcpros.get_shmros_handler()
+        if handler is not None:
+            self.protocol_handlers.append(handler)
         handler = rospy.impl.tcpros.get_tcpros_handler()
         if handler is not None:
             self.protocol_handlers.append(handler)
@@ -413,18 +419,38 @@ class ROSHandler(XmlRpcHandler):
            of subscribers connected to the topic.
         @rtype: [int, str, int]
         """
-        caller_id = rospy.names.get_caller_id()
         sub = get_topic_manager().get_subscriber_impl(topic)
         if not sub:
             return -1, "No subscriber for topic [%s]"%topic, 0
         elif sub.has_connection(pub_uri):
             return 1, "_connect_topic[%s]: subscriber already connected to publisher [%s]"%(topic, pub_uri), 0
+
+        # publications of this node are connected without serialization
+        if pub_uri == self.uri:
+            conn = get_topic_manager().connect_intraprocess(topic, pub_uri)
+            if conn is not None:
+                return 1, "Connected topic[%s]. Transport impl[%s]"%(topic, conn.__class__.__name__), conn.id
         
+        try:
+            return self._negotiate_topic(topic, pub_uri)
+        finally:
+            # e.g. close the UDPROS socket if TCPROS was selected
+            for h in self.protocol_handlers:
+                h.release_topic(topic, pub_uri)
+
+    def _negotiate_topic(self, topic, pub_uri):
+        """
+        Negotiate the protocol of a connection with a topic publisher
+        and create the connection.
+        @return: [code, msg, numConnects]
+        @rtype: [int, str, int]
+        """
+        caller_id = rospy.names.get_caller_id()
         #Negotiate with source for connection
         # - collect supported protocols
         protocols = []
-        for h in self.protocol_handlers: #currently only TCPROS
-            protocols.extend(h.get_supported())
+        for h in self.protocol_handlers:
+            protocols.extend(h.get_topic_supported(topic, pub_uri))
         if not protocols:
             return 0, "ERROR: no available protocol handlers", 0
 
@@ -538,11 +564,16 @@ class ROSHandler(XmlRpcHandler):
         """
         if not get_topic_manager().has_publication(topic):
             return -1, "Not a publisher of [%s]"%topic, []
+        result = 0, "no supported protocol implementations", []
         for protocol in protocols: #simple for now: select first implementation 
             protocol_id = protocol[0]
             for h in self.protocol_handlers:
                 if h.supports(protocol_id):
                     _logger.debug("requestTopic[%s]: choosing protocol %s", topic, protocol_id)
-                    return h.init_publisher(topic, protocol)
-        return 0, "no supported protocol implementations", []
+                    result = h.init_publisher(topic, protocol)
+                    if result[0] == 1:
+                        return result
+                    # e.g. SHMROS from another host: try the next protocol
+                    break
+        return result
 
@@ -0,0 +1,386 @@
+# Software License Agreement (BSD License)
+#
+# Copyright (c) 2008, Willow Garage, Inc.
+# All rights reserved.
+#
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions
+# are met:
+#
+#  * Redistributions of source code must retain the above copyright
+#    notice, this list of conditions and the following disclaimer.
+#  * Redistributions in binary form must reproduce the above
+#    copyright notice, this list of conditions and the following
+#    disclaimer in the documentation and/or other materials provided
+#    with the distribution.
+#  * Neither the name of Willow Garage, Inc. nor the names of its
+#    contributors may be used to endorse or promote products derived
+#    from this software without specific prior written permission.
+#
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS
+# "AS IS" AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT
+# LIMITED TO, THE IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS
+# FOR A PARTICULAR PURPOSE ARE DISCLAIMED. IN NO EVENT SHALL THE
+# COPYRIGHT OWNER OR CONTRIBUTORS BE LIABLE FOR ANY DIRECT, INDIRECT,
+# INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL DAMAGES (INCLUDING,
+# BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES;
+# LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER
+# CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT
+# LIABILITY, OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN
+# ANY WAY OUT OF THE USE OF THIS SOFTWARE, EVEN IF ADVISED OF THE
+# POSSIBILITY OF SUCH DAMAGE.
+#
+# Revision $Id$
+
+"""Internal use: I/O threads multiplexing nonblocking sockets with selectors"""
+
+import os
+import socket
+import threading
+import traceback
+
+try:
+    import selectors  # Python 3.4+
+except ImportError:
+    selectors = None
+
+from rospy.core import logwarn, rospydebug, rospyerr, add_shutdown_hook
+
+## environment variable enabling the reactor for processes that don't configure it
+ROSPY_REACTOR_THREADS = 'ROSPY_REACTOR_THREADS'
+
+EVENT_READ = selectors.EVENT_READ if selectors else 1
+EVENT_WRITE = selectors.EVENT_WRITE if selectors else 2
+
+class ReactorHandler(object):
+    """
+    Interface of the objects registered with a L{Reactor}.  The handler
+    methods are called on the I/O thread the handler is assigned to.
+    """
+
+    def fileno(self):
+        """
+        @return: descriptor of the nonblocking socket to watch
+        @rtype: int
+        """
+        raise NotImplementedError
+
+    def handle_read(self):
+        """
+        Called when the socket is readable.
+        """
+        pass
+
+    def handle_write(self):
+        """
+        Called when the socket is writable, if write events were requested.
+        """
+        pass
+
+    def handle_error(self, e):
+        """
+        Called when handle_read() or handle_write() raised. The handler
+        has been unregistered.
+        @param e: the exception raised
+        @type  e: Exception
+        """
+        pass
+
+class _ReactorThread(threading.Thread):
+    """
+    I/O thread running a selector over its share of the handlers.
+    """
+
+    def __init__(self, name):
+        super(_ReactorThread, self).__init__(name=name)
+        self.daemon = True
+        self.selector = selectors.DefaultSelector()
+        self.handlers = {} # fileno -> handler
+        self.done = False
+
+        self._lock = threading.Lock()
+        self._calls = []
+        self._wake_r, self._wake_w = socket.socketpair()
+        self._wake_r.setblocking(0)
+        self._wake_w.setblocking(0)
+        self.selector.register(self._wake_r, EVENT_READ, None)
+
+    def call(self, fn, *args):
+        """
+        Run fn(*args) on this thread.
+        """
+        with self._lock:
+            self._calls.append((fn, args))
+        self.wake()
+
+    def wake(self):
+        try:
+            self._wake_w.send(b'\0')
+        except socket.error:
+            pass # wakeup already pending
+
+    def register(self, handler, events):
+        fileno = handler.fileno()
+        old = self.handlers.get(fileno)
+        if old is not None and old is not handler:
+            # the descriptor of a closed socket has been reused
+            self._unregister(old)
+        try:
+            self.selector.register(fileno, events, handler)
+        except (KeyError, TypeError, ValueError, OSError, socket.error) as e:
+            # closed before it could be registered
+            handler.handle_error(e)
+            return
+        self.handlers[fileno] = handler
+
+    def modify(self, handler, events):
+        fileno = handler.fileno()
+        if self.handlers.get(fileno) is handler:
+            self.selector.modify(fileno, events, handler)
+
+    def _unregister(self, handler):
+        for fileno, h in list(self.handlers.items()):
+            if h is handler:
+                del self.handlers[fileno]
+                try:
+                    self.selector.unregister(fileno)
+                except (KeyError, ValueError, OSError):
+                    pass
+
+    def unregister(self, handler):
+        self._unregister(handler)
+
+    def _run_calls(self):
+        with self._lock:
+            calls, self._calls = self._calls, []
+        for fn, args in calls:
+            try:
+                fn(*args)
+            except Exception:
+                rospyerr("reactor call failed:\n%s", traceback.format_exc())
+
+    def run(self):
+        try:
+            while not self.done:
+                self._run_calls()
+                try:
+                    events = self.selector.select()
+                except (OSError, ValueError, socket.error):
+                    # a socket closed underneath us: drop the handlers of closed sockets
+                    for handler in list(self.handlers.values()):
+                        try:
+                            fileno = handler.fileno()
+                        except Exception:
+                            fileno = None
+                        if fileno is None or fileno < 0:
+                            self._unregister(handler)
+                    continue
+                # apply registration changes made while selecting before dispatching
+                self._run_calls()
+                for key, mask in events:
+                    handler = key.data
+                    if handler is None:
+                        try:
+                            while self._wake_r.recv(4096):
+                                pass
+                        except socket.error:
+                            pass
+                        continue
+                    if self.handlers.get(key.fd) is not handler:
+                        continue
+                    try:
+                        if mask & EVENT_READ:
+                            handler.handle_read()
+                        if mask & EVENT_WRITE and self.handlers.get(key.fd) is handler:
+                            handler.handle_write()
+                    except Exception as e:
+                        self._unregister(handler)
+                        try:
+                            handler.handle_error(e)
+                        except Exception:
+                            rospydebug("reactor handler error: %s", traceback.format_exc())
+        finally:
+            self.selector.close()
+            self._wake_r.close()
+            self._wake_w.close()
+
+class Reactor(object):
+    """
+    Pool of I/O threads, each multiplexing the sockets of its share of
+    L{ReactorHandler}s with a selector (epoll/kqueue/poll/select, as
+    available).  Handlers are called on their I/O thread and must not
+    block.
+    """
+
+    def __init__(self, threads=1, name='rospy-reactor'):
+        """
+        ctor.
+        @param threads: number of I/O threads
+        @type  threads: int
+        @param name: thread name prefix
+        @type  name: str
+        @raise ValueError: if threads is less than 1 or selectors are unavailable
+        """
+        if selectors is None:
+            raise ValueError("the reactor requires the selectors module")
+        if threads < 1:
+            raise ValueError("threads must be at least 1")
+        self._lock = threading.Lock()
+        self._threads = [_ReactorThread('%s-%d' % (name, i)) for i in range(threads)]
+        self._assignments = {} # handler id -> thread
+        for t in self._threads:
+            t.start()
+
+    @property
+    def threads(self):
+        """
+        Number of I/O threads.
+        """
+        return len(self._threads)
+
+    def _get_thread(self, handler):
+        with self._lock:
+            t = self._assignments.get(id(handler))
+            if t is None:
+                # least loaded thread
+                counts = dict((id(t), 0) for t in self._threads)
+                for assigned in self._assignments.values():
+                    counts[id(assigned)] += 1
+                t = min(self._threads, key=lambda t: counts[id(t)])
+                self._assignments[id(handler)] = t
+            return t
+
+    def register(self, handler, events=EVENT_READ):
+        """
+        Start watching the socket of handler.
+        @param handler: handler to register
+        @type  handler: L{ReactorHandler}
+        @param events: EVENT_READ and/or EVENT_WRITE
+        @type  events: int
+        """
+        t = self._get_thread(handler)
+        t.call(t.register, handler, events)
+
+    def modify(self, handler, events):
+        """
+        Change the events watched for handler.
+        @param handler: registered handler
+        @type  handler: L{ReactorHandler}
+        @param events: EVENT_READ and/or EVENT_WRITE
+        @type  events: int
+        """
+        t = self._get_thread(handler)
+        t.call(t.modify, handler, events)
+
+    def unregister(self, handler):
+        """
+        Stop watching the socket of handler. Safe to call from any thread
+        and more than once.
+        @param handler: handler to unregister
+        @type  handler: L{ReactorHandler}
+        """
+        with self._lock:
+            t = self._assignments.pop(id(handler), None)
+        if t is not None:
+            if t is threading.current_thread():
+                t.unregister(handler)
+            else:
+                t.call(t.unregister, handler)
+
+    def call_soon(self, handler, fn, *args):
+        """
+        Run fn(*args) on the I/O thread of handler.
+        """
+        t = self._get_thread(handler)
+        t.call(fn, *args)
+
+    def shutdown(self):
+        """
+        Stop the I/O threads.
+        """
+        for t in self._threads:
+            t.done = True
+            t.wake()
+
+_reactor = None
+_reactor_threads = None
+_retired_reactors = [] # replaced reactors, still serving their connections
+_reactor_lock = threading.Lock()
+_shutdown_hook_added = False
+
+def set_reactor_threads(threads):
+    """
+    Configure the process-wide reactor used by new subscriber
+    connections and by the queued connections of new publisher
+    connections.  Must be called before subscribing/advertising.
+    @param threads: number of I/O threads, or 0 to give each
+    connection its own thread
+    @type  threads: int
+    """
+    global _reactor, _reactor_threads
+    with _reactor_lock:
+        if threads and selectors is None:
+            logwarn("selectors module not available, using a thread per connection")
+            threads = 0
+        if _reactor is not None and _reactor.threads != threads:
+            # connections already registered stay on the previous
+            # reactor, which is shut down with rospy
+            _retired_reactors.append(_reactor)
+            _reactor = None
+        _reactor_threads = threads
+
+def set_reactor(reactor):
+    """
+    Install the process-wide reactor used by new subscriber and
+    publisher connections, e.g. one driven by an asyncio event loop.
+    @param reactor: reactor implementing the L{Reactor} API, or None
+    to give each connection its own thread
+    @type  reactor: L{Reactor}
+    """
+    global _reactor, _reactor_threads
+    with _reactor_lock:
+        if _reactor is not None and _reactor is not reactor:
+            _reactor.shutdown()
+        _reactor = reactor
+        _reactor_threads = reactor.threads if reactor is not None else 0
+        _add_shutdown_hook()
+
+def _add_shutdown_hook():
+    global _shutdown_hook_added
+    if not _shutdown_hook_added:
+        add_shutdown_hook(_shutdown_reactor)
+        _shutdown_hook_added = True
+
+def get_reactor():
+    """
+    @return: the process-wide reactor, or None if connections are
+    received on their own threads (the default)
+    @rtype: L{Reactor}
+    """
+    global _reactor, _reactor_threads
+    with _reactor_lock:
+        if _reactor_threads is None:
+            try:
+                _reactor_threads = int(os.environ.get(ROSPY_REACTOR_THREADS, 0))
+            except ValueError:
+                logwarn("invalid %s, using a thread per connection", ROSPY_REACTOR_THREADS)
+                _reactor_threads = 0
+            if _reactor_threads and selectors is None:
+                _reactor_threads = 0
+        if _reactor is not None:
+            return _reactor
+        if not _reactor_threads:
+            return None
+        _reactor = Reactor(_reactor_threads)
+        _add_shutdown_hook()
+        return _reactor
+
+def _shutdown_reactor(reason=None):
+    global _reactor
+    with _reactor_lock:
+        if _reactor is not None:
+            _reactor.shutdown()
+            _reactor = None
+        for reactor in _retired_reactors:
+            reactor.shutdown()
+        del _retired_reactors[:]
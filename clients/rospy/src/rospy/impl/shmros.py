@@ -0,0 +1,425 @@
+# Software License Agreement (BSD License)
+#
+# Copyright (c) 2008, Willow Garage, Inc.
+# All rights reserved.
+#
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions
+# are met:
+#
+#  * Redistributions of source code must retain the above copyright
+#    notice, this list of conditions and the following disclaimer.
+#  * Redistributions in binary form must reproduce the above
+#    copyright notice, this list of conditions and the following
+#    disclaimer in the documentation and/or other materials provided
+#    with the distribution.
+#  * Neither the name of Willow Garage, Inc. nor the names of its
+#    contributors may be used to endorse or promote products derived
+#    from this software without specific prior written permission.
+#
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS
+# "AS IS" AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT
+# LIMITED TO, THE IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS
+# FOR A PARTICULAR PURPOSE ARE DISCLAIMED. IN NO EVENT SHALL THE
+# COPYRIGHT OWNER OR CONTRIBUTORS BE LIABLE FOR ANY DIRECT, INDIRECT,
+# INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL DAMAGES (INCLUDING,
+# BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES;
+# LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER
+# CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT
+# LIABILITY, OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN
+# ANY WAY OUT OF THE USE OF THIS SOFTWARE, EVEN IF ADVISED OF THE
+# POSSIBILITY OF SUCH DAMAGE.
+#
+# Revision $Id$
+
+"""
+Internal use: SHMROS, a shared memory transport for topics between
+processes of the same host.
+
+SHMROS connections are TCPROS connections whose subscriber asked for
+the SHMROS transport in its handshake header.  The publisher of each
+connection creates a shared memory ring, announced in its handshake
+header, and copies serialized messages into it.  The TCP socket then
+only carries small control records (sequence number, ring position,
+size) from the publisher and the ring position up to which messages
+have been read from the subscriber.  Messages that don't fit in the
+free part of the ring, and small messages, are sent inline on the
+socket instead.
+
+SHMROS is negotiated in requestTopic() before TCPROS: publishers that
+don't support it, or that are on another host, pick TCPROS instead.
+It is disabled unless the ROSPY_SHMROS environment variable is set to
+1 in the subscriber process, as each connection allocates a ring of
+ROSPY_SHMROS_SIZE bytes (default: 16MB) in shared memory.
+"""
+
+import errno
+import os
+import select
+import socket
+import struct
+import threading
+
+try:
+    from multiprocessing import shared_memory # Python 3.8+
+except ImportError:
+    shared_memory = None
+
+from genpy import DeserializationError
+
+import rospy.impl.registration
+import rospy.impl.transport
+from rospy.core import logwarn
+from rospy.exceptions import TransportInitError, TransportTerminated
+
+from rospy.impl.tcpros_base import TCPROSTransport, get_tcpros_server_address, start_tcpros_server
+from rospy.impl.tcpros_pubsub import TCPROSPub, TCPROSSub, robust_connect_subscriber
+
+## name of the protocol in topic negotiation and in connection headers
+SHMROS = 'SHMROS'
+
+## environment variable enabling SHMROS for the subscriptions of a process
+ROSPY_SHMROS = 'ROSPY_SHMROS'
+## environment variable setting the size of the rings created by publishers
+ROSPY_SHMROS_SIZE = 'ROSPY_SHMROS_SIZE'
+
+DEFAULT_RING_SIZE = 16 * 1024 * 1024
+
+## messages smaller than this are sent inline on the socket
+MIN_RING_MESSAGE_SIZE = 16 * 1024
+
+# control records are TCPROS framed: (seq, ring position[, size])
+_RECORD = struct.Struct('<QQ')
+_RING_RECORD = struct.Struct('<IQQI')
+_INLINE_RECORD = struct.Struct('<IQQ')
+_INLINE = 0xffffffffffffffff
+_ACK = struct.Struct('<Q')
+
+def get_host_id():
+    """
+    @return: identifier shared by the processes that can map each
+    other's shared memory
+    @rtype: str
+    """
+    try:
+        with open('/proc/sys/kernel/random/boot_id') as f:
+            boot_id = f.read().strip()
+    except (IOError, OSError):
+        boot_id = ''
+    return '%s/%s' % (socket.gethostname(), boot_id)
+
+def _get_ring_size():
+    try:
+        return int(os.environ.get(ROSPY_SHMROS_SIZE, DEFAULT_RING_SIZE))
+    except ValueError:
+        logwarn("invalid %s, using %s", ROSPY_SHMROS_SIZE, DEFAULT_RING_SIZE)
+        return DEFAULT_RING_SIZE
+
+# names of the rings created by this process
+_created = set()
+
+def _attach(name):
+    try:
+        return shared_memory.SharedMemory(name=name, track=False) # Python 3.13+
+    except TypeError:
+        shm = shared_memory.SharedMemory(name=name)
+        if name not in _created:
+            # the publisher owns the segment: don't unlink it when this process exits
+            from multiprocessing import resource_tracker
+            resource_tracker.unregister(shm._name, 'shared_memory')
+        return shm
+
+class SHMROSPub(TCPROSPub):
+    """
+    Publisher protocol of SHMROS connections, owning the ring.
+    """
+
+    def __init__(self, resolved_name, pub_data_class, is_latch=False, headers=None, ring_size=DEFAULT_RING_SIZE):
+        super(SHMROSPub, self).__init__(resolved_name, pub_data_class, is_latch=is_latch, headers=headers)
+        self.shm = shared_memory.SharedMemory(create=True, size=ring_size)
+        self.ring_size = ring_size
+        _created.add(self.shm.name)
+
+    def get_header_fields(self):
+        fields = super(SHMROSPub, self).get_header_fields()
+        fields['shm_name'] = self.shm.name
+        fields['shm_size'] = str(self.ring_size)
+        return fields
+
+    def close(self):
+        _created.discard(self.shm.name)
+        try:
+            self.shm.close()
+            self.shm.unlink()
+        except (OSError, BufferError):
+            pass
+
+class SHMROSSub(TCPROSSub):
+    """
+    Subscriber protocol of SHMROS connections, reading the control
+    records and copying messages out of the publisher's ring.
+    """
+
+    def __init__(self, *args, **kwds):
+        super(SHMROSSub, self).__init__(*args, **kwds)
+        self.shm = None
+        self.ring_size = 0
+        self.seq = 0
+        self._ack = b''
+
+    def get_header_fields(self):
+        fields = super(SHMROSSub, self).get_header_fields()
+        fields['transport'] = SHMROS
+        return fields
+
+    def attach(self, header):
+        """
+        Map the ring announced in the publisher's header.
+        @param header: publisher handshake header
+        @type  header: dict
+        @raise TransportInitError: if the ring cannot be mapped
+        """
+        self.close()
+        try:
+            self.shm = _attach(header['shm_name'])
+            self.ring_size = int(header['shm_size'])
+        except (KeyError, ValueError, OSError) as e:
+            raise TransportInitError("cannot map SHMROS ring: %s" % e)
+        self.seq = 0
+        self._ack = b''
+
+    def close(self):
+        if self.shm is not None:
+            try:
+                self.shm.close()
+            except BufferError:
+                pass
+            self.shm = None
+
+    def read_messages(self, b, msg_queue, sock):
+        ack = None
+        queue = []
+        for frame in b.read_frames():
+            seq, pos = _RECORD.unpack_from(frame)
+            if seq != self.seq + 1:
+                raise DeserializationError("SHMROS record %s received after %s" % (seq, self.seq))
+            self.seq = seq
+            if pos == _INLINE:
+                queue.append(frame[_RECORD.size:])
+            else:
+                (size,) = struct.unpack_from('<I', frame, _RECORD.size)
+                offset = pos % self.ring_size
+                # copy the message out of the ring before it can be reused
+                queue.append(self.shm.buf[offset:offset + size].tobytes())
+                ack = pos + size
+        if self.queue_size is not None:
+            queue = queue[-self.queue_size:]
+        try:
+            for data in queue:
+                msg_queue.append(self.recv_data_class().deserialize(data))
+        except Exception as e:
+            raise DeserializationError("cannot deserialize: %s" % e)
+        if ack is not None:
+            # acks are cumulative, so only the latest one is sent, after
+            # completing any partially sent one
+            self._ack = self._ack[:len(self._ack) % _ACK.size] + _ACK.pack(ack)
+        if self._ack:
+            try:
+                n = sock.send(self._ack)
+                self._ack = self._ack[n:]
+            except socket.error as e:
+                if e.errno not in (errno.EAGAIN, errno.EWOULDBLOCK, errno.EINTR):
+                    raise
+
+class SHMROSTransport(TCPROSTransport):
+    """
+    TCPROS connection carrying SHMROS control records.
+    """
+    transport_type = SHMROS
+
+    def __init__(self, protocol, name, header=None):
+        super(SHMROSTransport, self).__init__(protocol, name, header=header)
+        self.seq = 0
+        self.write_pos = 0 # ring position of the next message
+        self.read_pos = 0 # ring position acknowledged by the subscriber
+        self._ack = b''
+        self._poller = None
+
+    def _validate_header(self, header):
+        super(SHMROSTransport, self)._validate_header(header)
+        if isinstance(self.protocol, SHMROSSub):
+            self.protocol.attach(header)
+
+    def _ack_ready(self, sock):
+        if not hasattr(select, 'poll'):
+            return select.select([sock], [], [], 0)[0]
+        # select() is limited to file descriptors below FD_SETSIZE
+        if self._poller is None:
+            self._poller = select.poll()
+            self._poller.register(sock, select.POLLIN)
+        return self._poller.poll(0)
+
+    def _read_acks(self):
+        sock = self.socket
+        while self._ack_ready(sock):
+            data = sock.recv(4096)
+            if not data:
+                raise socket.error(errno.ECONNRESET, "connection closed by subscriber")
+            data = self._ack + data
+            n = len(data) - len(data) % _ACK.size
+            if n:
+                (self.read_pos,) = _ACK.unpack_from(data, n - _ACK.size)
+            self._ack = data[n:]
+
+    def write_data(self, data):
+        """
+        Write a serialized message, as framed by
+        L{rospy.msg.serialize_message()}, to the ring or inline.
+        @raise TransportInitialiationError: could not be initialized
+        @raise TransportTerminated: no longer open for publishing
+        """
+        if not self.socket or self.protocol is None:
+            return super(SHMROSTransport, self).write_data(data)
+        try:
+            self._read_acks()
+        except (socket.error, ValueError) as e:
+            self.close()
+            raise TransportTerminated(str(e))
+
+        self.seq += 1
+        body = memoryview(data)[4:]
+        size = len(body)
+        ring_size = self.protocol.ring_size
+        pos = self.write_pos
+        offset = pos % ring_size
+        if offset + size > ring_size:
+            # messages are contiguous in the ring: skip its end
+            pos += ring_size - offset
+            offset = 0
+        if size >= MIN_RING_MESSAGE_SIZE and pos + size - self.read_pos <= ring_size:
+            self.protocol.shm.buf[offset:offset + size] = body
+            self.write_pos = pos + size
+            record = _RING_RECORD.pack(_RING_RECORD.size - 4, self.seq, pos, size)
+            self.stat_bytes += size
+        else:
+            record = _INLINE_RECORD.pack(_INLINE_RECORD.size - 4 + size, self.seq, _INLINE)
+            # the record and the message are gathered into one system call
+            self._send_buffers([record, body])
+            self.stat_num_msg += 1
+            return True
+        return super(SHMROSTransport, self).write_data(record)
+
+    def write_frames(self, frames):
+        """
+        Write several serialized messages, see L{write_data()}.
+        """
+        for data in frames:
+            self.write_data(data)
+        return True
+
+    def close(self):
+        protocol = self.protocol
+        super(SHMROSTransport, self).close()
+        if protocol is not None:
+            protocol.close()
+
+class SHMROSHandler(rospy.impl.transport.ProtocolHandler):
+    """
+    ROS Protocol handler for SHMROS. Connections are accepted by the
+    TCPROS server, which hands the ones asking for SHMROS to
+    L{create_publisher_transport()}.
+    """
+
+    def __init__(self, tcpros_handler):
+        """
+        ctor.
+        @param tcpros_handler: handler of the TCPROS server
+        @type  tcpros_handler: L{rospy.impl.tcpros_pubsub.TCPROSHandler}
+        """
+        self.host_id = get_host_id()
+        tcpros_handler.transport_factories[SHMROS] = self.create_publisher_transport
+
+    def supports(self, protocol):
+        """
+        @param protocol: name of protocol
+        @type protocol: str
+        @return: True if protocol is supported
+        @rtype: bool
+        """
+        return protocol == SHMROS
+
+    def get_supported(self):
+        """
+        Get supported protocols: SHMROS, if enabled, for publishers on
+        the same host.
+        """
+        if os.environ.get(ROSPY_SHMROS, '0') != '1':
+            return []
+        return [[SHMROS, self.host_id]]
+
+    def init_publisher(self, resolved_name, protocol):
+        """
+        Accept SHMROS for subscribers on this host.
+        @param resolved_name: topic name
+        @type  resolved__name: str
+        @param protocol: requested protocol parameters: [SHMROS, host id]
+        @type  protocol: [str, value*]
+        @return: (code, msg, [SHMROS, addr, port])
+        @rtype: (int, str, list)
+        """
+        if protocol[0] != SHMROS:
+            return 0, "Internal error: protocol does not match SHMROS: %s"%protocol, []
+        if len(protocol) != 2 or protocol[1] != self.host_id:
+            return 0, "SHMROS subscriber is not on this host", []
+        start_tcpros_server()
+        addr, port = get_tcpros_server_address()
+        return 1, "ready on %s:%s"%(addr, port), [SHMROS, addr, port]
+
+    def create_transport(self, resolved_name, pub_uri, protocol_params):
+        """
+        Connect to topic resolved_name on Publisher pub_uri using SHMROS.
+        @param resolved_name str: resolved topic name
+        @type  resolved_name: str
+        @param pub_uri: XML-RPC URI of publisher
+        @type  pub_uri: str
+        @param protocol_params: protocol parameters to use for connecting
+        @type protocol_params: [XmlRpcLegal]
+        @return: code, message, debug
+        @rtype: (int, str, int)
+        """
+        if type(protocol_params) != list or len(protocol_params) != 3:
+            return 0, "ERROR: invalid SHMROS parameters", 0
+        if protocol_params[0] != SHMROS:
+            return 0, "INTERNAL ERROR: protocol id is not SHMROS: %s"%protocol_params[0], 0
+        id, dest_addr, dest_port = protocol_params
+
+        sub = rospy.impl.registration.get_topic_manager().get_subscriber_impl(resolved_name)
+        protocol = SHMROSSub(resolved_name, sub.data_class,
+                             queue_size=sub.queue_size, buff_size=sub.buff_size,
+                             tcp_nodelay=True)
+        conn = SHMROSTransport(protocol, resolved_name)
+        conn.set_endpoint_id(pub_uri)
+
+        t = threading.Thread(name=resolved_name, target=robust_connect_subscriber, args=(conn, dest_addr, dest_port, pub_uri, sub.receive_callback, resolved_name))
+        if sub.add_connection(conn):
+            t.start()
+            return 1, "Connected topic[%s]. Transport impl[%s]"%(resolved_name, conn.__class__.__name__), dest_port
+        else:
+            conn.close()
+            return 0, "ERROR: Race condition failure creating topic subscriber [%s]"%(resolved_name), 0
+
+    def create_publisher_transport(self, resolved_name, topic, header):
+        """
+        Create the publisher end of a connection that asked for SHMROS.
+        @param resolved_name: resolved topic name
+        @type  resolved_name: str
+        @param topic: publication
+        @type  topic: L{rospy.topics._PublisherImpl}
+        @param header: subscriber handshake header
+        @type  header: dict
+        @return: transport, with its ring created
+        @rtype: L{SHMROSTransport}
+        """
+        protocol = SHMROSPub(resolved_name, topic.data_class, is_latch=topic.is_latch,
+                             headers=topic.headers, ring_size=_get_ring_size())
+        return SHMROSTransport(protocol, resolved_name)
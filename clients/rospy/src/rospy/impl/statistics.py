@@ -42,6 +42,49 @@ import rospy
 _logger = logging.getLogger('rospy.impl.statistics')
 
 
+class StreamingStatistics():
+    """
+    Fixed-size aggregate of a stream of values: count, mean, standard
+    deviation, min and max are updated in constant time and memory
+    with Welford's algorithm, however many values are added.
+    """
+
+    __slots__ = ['count', 'mean', 'min', 'max', '_m2']
+
+    def __init__(self):
+        self.reset()
+
+    def reset(self):
+        self.count = 0
+        self.mean = 0.0
+        self.min = None
+        self.max = None
+        self._m2 = 0.0
+
+    def add(self, value):
+        """
+        @param value: new value
+        @type  value: float
+        """
+        self.count += 1
+        delta = value - self.mean
+        self.mean += delta / self.count
+        self._m2 += delta * (value - self.mean)
+        if self.max is None or value > self.max:
+            self.max = value
+        if self.min is None or value < self.min:
+            self.min = value
+
+    def stddev(self):
+        """
+        @return: population standard deviation of the values
+        @rtype: float
+        """
+        if self.count == 0:
+            return 0.0
+        return sqrt(self._m2 / self.count)
+
+
 class SubscriberStatisticsLogger():
     """
     Class that monitors each subscriber.
@@ -78,6 +121,14 @@ class SubscriberStatisticsLogger():
         self.min_window = rospy.get_param("/statistics_window_min_size", 4)
         self.max_window = rospy.get_param("/statistics_window_max_size", 64)
 
+        # Fraction of the messages whose age and period are measured.
+        # Messages are still counted, and checked for drops, one by one.
+        sample_ratio = rospy.get_param("/statistics_sample_ratio", 1.0)
+        if not 0 < sample_ratio <= 1:
+            rospy.logwarn("invalid /statistics_sample_ratio %s, measuring all messages", sample_ratio)
+            sample_ratio = 1.0
+        self.sample_stride = max(1, int(round(1.0 / sample_ratio)))
+
     def callback(self, msg, publisher, stat_bytes):
         """
         This method is called for every message that has been received.
@@ -122,6 +173,11 @@ class ConnectionStatisticsLogger():
     is created whenever a subscriber is created.
     is destroyed whenever its parent subscriber is destroyed.
     its lifecycle is therefore bound to its parent subscriber.
+
+    Message ages and periods are kept in L{StreamingStatistics}, so
+    the cost of a window does not grow with the message rate.  With a
+    sample stride of n, only every n-th message is timed: its age is
+    measured, and its period is measured up to the next message.
     """
 
     def __init__(self, topic, subscriber, publisher):
@@ -142,14 +198,19 @@ class ConnectionStatisticsLogger():
         self.pub = rospy.Publisher("/statistics", TopicStatistics, queue_size=10)
 
         # reset window
-        self.last_pub_time = rospy.Time(0)
-        self.pub_frequency = rospy.Duration(1.0)
+        self.next_pub_time_ = 0.0
+        self.pub_frequency = 1.0 # Hz
 
         # timestamp age
-        self.age_list_ = []
+        self.age_ = StreamingStatistics()
 
         # period calculations
-        self.arrival_time_list_ = []
+        self.period_ = StreamingStatistics()
+        self.period_start_ = None
+
+        # messages left before the next timed message
+        self.skip_ = 0
+        self.delivered_msgs_ = 0
 
         self.last_seq_ = 0
         self.dropped_msgs_ = 0
@@ -179,27 +240,26 @@ class ConnectionStatisticsLogger():
         # Calculate bytes since last message
         msg.traffic = self.stat_bytes_window_ - self.stat_bytes_last_
 
-        msg.delivered_msgs = len(self.arrival_time_list_)
+        msg.delivered_msgs = self.delivered_msgs_
         msg.dropped_msgs = self.dropped_msgs_
 
         # we can only calculate message age if the messages did contain Header fields.
-        if len(self.age_list_) > 0:
-            msg.stamp_age_mean = rospy.Duration(sum(self.age_list_, rospy.Duration(0)).to_sec() / len(self.age_list_))
-            variance = sum((rospy.Duration((msg.stamp_age_mean - value).to_sec() ** 2) for value in self.age_list_), rospy.Duration(0)) / len(self.age_list_)
-            msg.stamp_age_stddev = rospy.Duration(sqrt(variance.to_sec()))
-            msg.stamp_age_max = max(self.age_list_)
+        age = self.age_
+        if age.count > 0:
+            msg.stamp_age_mean = rospy.Duration.from_sec(age.mean)
+            msg.stamp_age_stddev = rospy.Duration.from_sec(age.stddev())
+            msg.stamp_age_max = rospy.Duration.from_sec(age.max)
         else:
             msg.stamp_age_mean = rospy.Duration(0)
             msg.stamp_age_stddev = rospy.Duration(0)
             msg.stamp_age_max = rospy.Duration(0)
 
         # computer period/frequency. we need at least two messages within the window to do this.
-        if len(self.arrival_time_list_) > 1:
-            periods = [j - i for i, j in zip(self.arrival_time_list_[:-1], self.arrival_time_list_[1:])]
-            msg.period_mean = rospy.Duration(sum(periods, rospy.Duration(0)).to_sec() / len(periods))
-            variance = sum((rospy.Duration((msg.period_mean - value).to_sec() ** 2) for value in periods), rospy.Duration(0)) / len(periods)
-            msg.period_stddev = rospy.Duration(sqrt(variance.to_sec()))
-            msg.period_max = max(periods)
+        period = self.period_
+        if period.count > 0:
+            msg.period_mean = rospy.Duration.from_sec(period.mean)
+            msg.period_stddev = rospy.Duration.from_sec(period.stddev())
+            msg.period_max = rospy.Duration.from_sec(period.max)
         else:
             msg.period_mean = rospy.Duration(0)
             msg.period_stddev = rospy.Duration(0)
@@ -208,15 +268,16 @@ class ConnectionStatisticsLogger():
         self.pub.publish(msg)
 
         # adjust window, if message count is not appropriate.
-        pub_period = 1.0 / self.pub_frequency.to_sec()
-        if len(self.arrival_time_list_) > subscriber_statistics_logger.max_elements and pub_period / 2 >= subscriber_statistics_logger.min_window:
+        pub_period = 1.0 / self.pub_frequency
+        if self.delivered_msgs_ > subscriber_statistics_logger.max_elements and pub_period / 2 >= subscriber_statistics_logger.min_window:
             self.pub_frequency *= 2
-        if len(self.arrival_time_list_) < subscriber_statistics_logger.min_elements and pub_period * 2 <= subscriber_statistics_logger.max_window:
+        if self.delivered_msgs_ < subscriber_statistics_logger.min_elements and pub_period * 2 <= subscriber_statistics_logger.max_window:
             self.pub_frequency /= 2
 
         # clear collected stats, start new window.
-        self.age_list_ = []
-        self.arrival_time_list_ = []
+        self.age_.reset()
+        self.period_.reset()
+        self.delivered_msgs_ = 0
         self.dropped_msgs_ = 0
 
         self.window_start = curtime
@@ -241,25 +302,37 @@ class ConnectionStatisticsLogger():
         callback has to return before the message is delivered to the user.
         """
 
-        arrival_time = rospy.Time.now()
-
-        self.arrival_time_list_.append(arrival_time)
-
+        self.delivered_msgs_ += 1
         self.stat_bytes_window_ = stat_bytes
 
         # rospy has the feature to subscribe a topic with AnyMsg which aren't deserialized.
         # Those subscribers won't have a header. But as these subscribers are rather rare
         # ("rostopic hz" is the only one I know of), I'm gonna ignore them.
-        if msg._has_header:
-            self.age_list_.append(arrival_time - msg.header.stamp)
-
-            if self.last_seq_ + 1 != msg.header.seq:
+        has_header = msg._has_header
+        if has_header:
+            seq = msg.header.seq
+            if self.last_seq_ + 1 != seq:
                 self.dropped_msgs_ = self.dropped_msgs_ + 1
-            self.last_seq_ = msg.header.seq
+            self.last_seq_ = seq
+
+        # only timed messages, and the ones that follow them, read the clock
+        self.skip_ -= 1
+        if self.skip_ > 0 and self.period_start_ is None:
+            return
+        arrival_time = rospy.get_time()
+        if self.period_start_ is not None:
+            self.period_.add(arrival_time - self.period_start_)
+            self.period_start_ = None
+        if self.skip_ > 0:
+            return
+        self.skip_ = subscriber_statistics_logger.sample_stride
+        self.period_start_ = arrival_time
+        if has_header:
+            self.age_.add(arrival_time - msg.header.stamp.to_sec())
 
         # send out statistics with a certain frequency
-        if self.last_pub_time + rospy.Duration(1.0 / self.pub_frequency.to_sec()) < arrival_time:
-            self.last_pub_time = arrival_time
+        if self.next_pub_time_ < arrival_time:
+            self.next_pub_time_ = arrival_time + 1.0 / self.pub_frequency
             self.sendStatistics(subscriber_statistics_logger)
 
     def shutdown(self):
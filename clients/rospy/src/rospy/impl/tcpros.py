@@ -46,8 +46,13 @@ import rospy.impl.tcpros_service
 
 from rospy.impl.tcpros_base import init_tcpros_server, DEFAULT_BUFF_SIZE
 from rospy.impl.tcpros_pubsub import TCPROSHandler
+import rospy.impl.shmros
+import rospy.impl.udpros
 
 _handler = TCPROSHandler()
+_shmros_handler = rospy.impl.shmros.SHMROSHandler(_handler) \
+    if rospy.impl.shmros.shared_memory is not None else None
+_udpros_handler = rospy.impl.udpros.UDPROSHandler()
 
 def init_tcpros(port=0):
     """
@@ -60,3 +65,18 @@ def init_tcpros(port=0):
 
 def get_tcpros_handler():
     return _handler
+
+def get_shmros_handler():
+    """
+    @return: SHMROS protocol handler, or None if shared memory is not
+    supported by this Python
+    @rtype: L{rospy.impl.shmros.SHMROSHandler}
+    """
+    return _shmros_handler
+
+def get_udpros_handler():
+    """
+    @return: UDPROS protocol handler
+    @rtype: L{rospy.impl.udpros.UDPROSHandler}
+    """
+    return _udpros_handler
@@ -42,6 +42,7 @@ except ImportError:
     from io import StringIO, BytesIO #Python 3.x
     python3 = 1
 import errno
+import os
 import socket
 import logging
 
@@ -59,9 +60,10 @@ from rosgraph.network import read_ros_handshake_header, write_ros_handshake_head
 from rospy.core import *
 from rospy.core import logwarn, loginfo, logerr, logdebug, rospydebug, rospyerr, rospywarn
 from rospy.exceptions import ROSInternalException, TransportException, TransportTerminated, TransportInitError
-from rospy.msg import deserialize_messages, serialize_message
+from rospy.msg import deserialize_messages, serialize_message, ReceiveBuffer
 from rospy.service import ServiceException
 
+from rospy.impl.reactor import ReactorHandler
 from rospy.impl.transport import Transport, BIDIRECTIONAL
 from errno import EAGAIN, EWOULDBLOCK
 
@@ -73,6 +75,14 @@ DEFAULT_BUFF_SIZE = 65536
 ## name of our customized TCP protocol for accepting flows over server socket
 TCPROS = "TCPROS" 
 
+## maximum number of buffers passed to a single sendmsg() call
+try:
+    IOV_MAX = os.sysconf('SC_IOV_MAX')
+except (AttributeError, ValueError, OSError):
+    IOV_MAX = 16
+if IOV_MAX <= 0:
+    IOV_MAX = 16
+
 _PARAM_TCP_KEEPALIVE = '/tcp_keepalive'
 _use_tcp_keepalive = None
 _use_tcp_keepalive_lock = threading.Lock()
@@ -96,13 +106,18 @@ def recv_buff(sock, b, buff_size):
     @param sock: socket to read from
     @type  sock: socket.socket
     @param b: buffer to receive into
-    @type  b: StringIO
+    @type  b: StringIO or L{ReceiveBuffer}
     @param buff_size: recv read size
     @type  buff_size: int
     @return: number of bytes read
     @rtype: int
     """
     try:
+        if isinstance(b, ReceiveBuffer):
+            n = b.recv_into(sock, buff_size)
+            if n:
+                return n
+            raise TransportTerminated("unable to receive data from sender, check sender's logs for details")
         d = sock.recv(buff_size)
         if d:
             b.write(d)
@@ -403,6 +418,18 @@ class TCPROSTransportProtocol(object):
         """
         # default implementation
         deserialize_messages(b, msg_queue, self.recv_data_class, queue_size=self.queue_size)
+
+    def init_read_buffer(self, b):
+        """
+        Called once the handshake header has been read to select the
+        buffer messages are received into.
+        @param b: handshake read buffer, holding any data received
+        after the header
+        @type  b: StringIO
+        @return: read buffer for the connection
+        @rtype: StringIO or L{ReceiveBuffer}
+        """
+        return b
         
     def get_header_fields(self):
         """
@@ -660,8 +687,12 @@ class TCPROSTransport(Transport):
         if sock is None:
             return
         sock.setblocking(1)
+        if isinstance(self.read_buff, ReceiveBuffer):
+            # reconnecting: the handshake is read into a plain buffer
+            self.read_buff = StringIO() if python3 == 0 else BytesIO()
         # TODO: add bytes received to self.stat_bytes
         self._validate_header(read_ros_handshake_header(sock, self.read_buff, self.protocol.buff_size))
+        self.read_buff = self.protocol.init_read_buffer(self.read_buff)
                 
     def send_message(self, msg, seq):
         """
@@ -721,6 +752,54 @@ class TCPROSTransport(Transport):
                 self.close()
                 raise TransportTerminated(str(se_errno)+' '+msg)
         return True
+
+    def write_frames(self, frames):
+        """
+        Write several chunks of raw data to transport, gathering them
+        with sendmsg() so that they are sent with as few system calls
+        as possible and without being concatenated first.
+        @param frames: serialized messages
+        @type  frames: [bytes]
+        @raise TransportInitialiationError: could not be initialized
+        @raise TransportTerminated: no longer open for publishing
+        """
+        self._send_buffers(frames)
+        self.stat_num_msg += len(frames)
+        return True
+
+    def _send_buffers(self, buffers):
+        """
+        Send buffers with sendmsg() if available.
+        @raise TransportInitialiationError: could not be initialized
+        @raise TransportTerminated: no longer open for publishing
+        """
+        if not self.socket:
+            raise TransportInitError("TCPROS transport was not successfully initialized")
+        if self.done:
+            raise TransportTerminated("connection closed")
+        sendmsg = getattr(self.socket, 'sendmsg', None)
+        if sendmsg is None:
+            # Python 2.x, Windows
+            buffers = [b''.join(buffers)]
+        views = [memoryview(b) for b in buffers if len(b)]
+        try:
+            while views:
+                if sendmsg is None:
+                    self.socket.sendall(views[0])
+                    n = len(views[0])
+                else:
+                    n = sendmsg(views[:IOV_MAX])
+                self.stat_bytes += n
+                # drop the buffers that were sent, slice the one sent partially
+                while n:
+                    if n < len(views[0]):
+                        views[0] = views[0][n:]
+                        break
+                    n -= len(views.pop(0))
+        except socket.error as se:
+            logdebug("[%s]: closing connection [%s] due to socket error: %s", self.name, self.endpoint_id, se)
+            self.close()
+            raise TransportTerminated(str(se))
     
     def receive_once(self):
         """
@@ -742,16 +821,7 @@ class TCPROSTransport(Transport):
                     p.read_messages(b, msg_queue, sock) 
                 if not msg_queue:
                     self.stat_bytes += recv_buff(sock, b, p.buff_size)
-            self.stat_num_msg += len(msg_queue) #STATS
-            # set the _connection_header field
-            for m in msg_queue:
-                m._connection_header = self.header
-                
-            # #1852: keep track of last latched message
-            if self.is_latched and msg_queue:
-                self.latch = msg_queue[-1]
-            
-            return msg_queue
+            return self._received(msg_queue)
 
         except DeserializationError as e:
             rospyerr(traceback.format_exc())            
@@ -764,6 +834,49 @@ class TCPROSTransport(Transport):
             rospyerr(traceback.format_exc())
             raise TransportException("receive_once[%s]: unexpected error %s"%(self.name, str(e)))
         return retval
+
+    def receive_available(self):
+        """
+        Read the data available on the nonblocking socket, without
+        blocking, and deserialize the complete messages received.
+        @return: list of newly received messages, possibly empty
+        @rtype: [Msg]
+        @raise TransportException: if unable to receive message due to error
+        """
+        sock = self.socket
+        if sock is None:
+            raise TransportException("connection not initialized")
+        b = self.read_buff
+        msg_queue = []
+        p = self.protocol
+        try:
+            self.stat_bytes += recv_buff(sock, b, p.buff_size)
+            if b.tell() >= 4:
+                p.read_messages(b, msg_queue, sock)
+            return self._received(msg_queue)
+
+        except DeserializationError as e:
+            rospyerr(traceback.format_exc())
+            raise TransportException("receive_available[%s]: DeserializationError %s"%(self.name, str(e)))
+        except TransportTerminated as e:
+            raise #reraise
+        except Exception as e:
+            if self.done:
+                raise TransportTerminated("connection closed")
+            rospyerr(traceback.format_exc())
+            raise TransportException("receive_available[%s]: unexpected error %s"%(self.name, str(e)))
+
+    def _received(self, msg_queue):
+        self.stat_num_msg += len(msg_queue) #STATS
+        # set the _connection_header field
+        for m in msg_queue:
+            m._connection_header = self.header
+
+        # #1852: keep track of last latched message
+        if self.is_latched and msg_queue:
+            self.latch = msg_queue[-1]
+
+        return msg_queue
         
     def _reconnect(self):
         # This reconnection logic is very hacky right now.  I need to
@@ -845,6 +958,27 @@ class TCPROSTransport(Transport):
             if not self.done:
                 self.close()
 
+    def receive_reactor(self, msgs_callback, reactor):
+        """
+        Receive messages on the I/O threads of reactor instead of a
+        thread of our own. Returns immediately; the connection is
+        closed when the remote end closes it, and reconnected on
+        errors, like in L{receive_loop()}.
+        @param msgs_callback: callback to invoke for new messages received, on the I/O thread
+        @type  msgs_callback: fn([msg], TCPROSTransport)
+        @param reactor: reactor to register with
+        @type  reactor: L{rospy.impl.reactor.Reactor}
+        """
+        logger.debug("receive_reactor for [%s]", self.name)
+        receiver = _TCPROSReceiver(self, msgs_callback, reactor)
+        previous_callback = self.cleanup_cb
+        def cleanup_cb(transport):
+            reactor.unregister(receiver)
+            if previous_callback:
+                previous_callback(transport)
+        self.set_cleanup_callback(cleanup_cb)
+        receiver.start()
+
     def close(self):
         """close i/o and release resources"""
         if not self.done:
@@ -866,3 +1000,60 @@ class TCPROSTransport(Transport):
             finally:
                 self.socket = self.read_buff = self.write_buff = self.protocol = None
                 super(TCPROSTransport, self).close()
+
+class _TCPROSReceiver(ReactorHandler):
+    """
+    Reactor handler receiving the messages of a L{TCPROSTransport}.
+    """
+
+    def __init__(self, transport, msgs_callback, reactor):
+        self.transport = transport
+        self.msgs_callback = msgs_callback
+        self.reactor = reactor
+        self._fileno = None
+
+    def start(self):
+        sock = self.transport.socket
+        if sock is None or self.transport.done:
+            return
+        sock.setblocking(0)
+        self._fileno = sock.fileno()
+        self.reactor.register(self)
+
+    def fileno(self):
+        return self._fileno
+
+    def handle_read(self):
+        transport = self.transport
+        if transport.done or is_shutdown():
+            raise TransportTerminated("connection closed")
+        msgs = transport.receive_available()
+        if msgs and not transport.done and not is_shutdown():
+            self.msgs_callback(msgs, transport)
+
+    def handle_error(self, e):
+        transport = self.transport
+        if isinstance(e, TransportTerminated) or transport.done or is_shutdown():
+            logdebug("[%s] failed to receive incoming message : %s" % (transport.name, str(e)))
+            if not transport.done:
+                transport.close()
+        elif isinstance(e, TransportException):
+            # close the socket and reconnect on a thread of its own, as in receive_loop()
+            try:
+                if transport.socket is not None:
+                    transport.socket.close()
+            except:
+                pass
+            transport.socket = None
+            t = threading.Thread(name=transport.name, target=self._reconnect)
+            t.daemon = True
+            t.start()
+        else:
+            rospydebug("exception in receive handler for [%s], may be normal. Exception is %r", transport.name, e)
+            if not transport.done:
+                transport.close()
+
+    def _reconnect(self):
+        self.transport._reconnect()
+        if not self.transport.done:
+            self.start()
@@ -34,6 +34,9 @@
 
 """Internal use: Topic-specific extensions for TCPROS support"""
 
+import collections
+import errno
+import itertools
 import socket
 import threading
 import time
@@ -46,13 +49,15 @@ except ImportError:
 from rospy.core import logwarn, logerr, logdebug, rospyerr
 import rospy.exceptions
 import rospy.names
+from rospy.msg import ReceiveBuffer
 
+import rospy.impl.reactor
 import rospy.impl.registration
 import rospy.impl.transport
 
 from rospy.impl.tcpros_base import TCPROSTransport, TCPROSTransportProtocol, \
     get_tcpros_server_address, start_tcpros_server,\
-    DEFAULT_BUFF_SIZE, TCPROS
+    DEFAULT_BUFF_SIZE, TCPROS, IOV_MAX
 
 class TCPROSSub(TCPROSTransportProtocol):
     """
@@ -98,6 +103,18 @@ class TCPROSSub(TCPROSTransportProtocol):
                 'type': self.recv_data_class._type,
                 'callerid': rospy.names.get_caller_id()}        
 
+    def init_read_buffer(self, b):
+        """
+        Topic data is received into a L{ReceiveBuffer}, which slices
+        messages out of a reused bytearray instead of copying the
+        unread remainder of the stream after every read.
+        @param b: handshake read buffer
+        @type  b: StringIO
+        @return: read buffer for the connection
+        @rtype: L{ReceiveBuffer}
+        """
+        return ReceiveBuffer(self.buff_size, b.getvalue()[:b.tell()])
+
 # Separate method for easier testing
 def _configure_pub_socket(sock, is_tcp_nodelay):
     """
@@ -156,7 +173,8 @@ class TCPROSPub(TCPROSTransportProtocol):
 
 def robust_connect_subscriber(conn, dest_addr, dest_port, pub_uri, receive_cb, resolved_topic_name):
     """
-    Keeps trying to create connection for subscriber.  Then passes off to receive_loop once connected.
+    Keeps trying to create connection for subscriber.  Then passes off to receive_loop once connected,
+    or to the reactor if one is enabled (see L{rospy.impl.reactor.set_reactor_threads()}).
     """
     # kwc: this logic is not very elegant.  I am waiting to rewrite
     # the I/O loop with async i/o to clean this up.
@@ -182,7 +200,11 @@ def robust_connect_subscriber(conn, dest_addr, dest_port, pub_uri, receive_cb, r
             conn.done = not check_if_still_publisher(resolved_topic_name, pub_uri)
 
     if not conn.done:
-        conn.receive_loop(receive_cb)	    
+        reactor = rospy.impl.reactor.get_reactor()
+        if reactor is not None:
+            conn.receive_reactor(receive_cb, reactor)
+        else:
+            conn.receive_loop(receive_cb)
 
 def check_if_still_publisher(resolved_topic_name, pub_uri):
     try:
@@ -206,6 +228,9 @@ class TCPROSHandler(rospy.impl.transport.ProtocolHandler):
     def __init__(self):
         """ctor"""
         self.tcp_nodelay_map = {} # { topic : tcp_nodelay}
+        # { 'transport' header value : fn(resolved_name, topic, header) }
+        # for connections asking for another transport over TCPROS
+        self.transport_factories = {}
     
     def set_tcp_nodelay(self, resolved_name, tcp_nodelay):
         """
@@ -359,32 +384,62 @@ class TCPROSHandler(rospy.impl.transport.ProtocolHandler):
                     tcp_nodelay = self.tcp_nodelay_map.get(resolved_topic_name, False)
 
                 _configure_pub_socket(sock, tcp_nodelay)
-                protocol = TCPROSPub(resolved_topic_name, topic.data_class, is_latch=topic.is_latch, headers=topic.headers)
-                transport = TCPROSTransport(protocol, resolved_topic_name)
+                factory = self.transport_factories.get(header.get('transport'))
+                if factory is not None:
+                    transport = factory(resolved_topic_name, topic, header)
+                else:
+                    protocol = TCPROSPub(resolved_topic_name, topic.data_class, is_latch=topic.is_latch, headers=topic.headers)
+                    transport = TCPROSTransport(protocol, resolved_topic_name)
                 transport.set_socket(sock, header['callerid'])
                 transport.remote_endpoint = client_addr
                 transport.write_header()
                 topic.add_connection(transport)
             
 
+## maximum number of bytes held back by the coalescing window
+COALESCE_MAX_BYTES = 65536
+
+def is_tcp_nodelay(sock):
+    """
+    @param sock: socket of a connection
+    @type  sock: socket.socket
+    @return: True if TCP_NODELAY is set on sock
+    @rtype: bool
+    """
+    try:
+        return bool(sock.getsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY))
+    except (AttributeError, socket.error):
+        return False
+
 class QueuedConnection(object):
     """
     It wraps a Transport instance and behaves like one
     but it queues the data written to it and relays them
     asynchronously to the wrapped instance.
+
+    The data queued at once is relayed in a single write_frames()
+    call if the wrapped instance supports it. With a coalescing
+    window, data is held back until the window has elapsed since the
+    first message was queued, or COALESCE_MAX_BYTES are queued, so
+    that many small messages are sent with one system call.
     """
 
-    def __init__(self, connection, queue_size):
+    def __init__(self, connection, queue_size, coalesce_window=None):
         """
         ctor.
         @param connection: the wrapped transport instance
         @type  connection: Transport
         @param queue_size: the maximum size of the queue, zero means infinite
         @type  queue_size: int
+        @param coalesce_window: maximum time (in seconds) data is held
+        back to be sent with later data, or None
+        @type  coalesce_window: float
         """
         super(QueuedConnection, self).__init__()
         self._connection = connection
         self._queue_size = queue_size
+        self._coalesce_window = coalesce_window
+        self._queued_bytes = 0
 
         self._lock = threading.Lock()
         self._cond_data_available = threading.Condition(self._lock)
@@ -413,28 +468,180 @@ class QueuedConnection(object):
                 raise error
             # pop oldest data if queue limit is reached
             if self._queue_size > 0 and len(self._queue) == self._queue_size:
+                self._queued_bytes -= len(self._queue[0])
                 del self._queue[0]
             self._queue.append(data)
+            self._queued_bytes += len(data)
             self._cond_data_available.notify()
-        # effectively yields the rest of the thread quantum
-        time.sleep(0)
+        if self._coalesce_window is None:
+            # effectively yields the rest of the thread quantum
+            time.sleep(0)
         return True
 
     def _run(self):
+        write_frames = getattr(self._connection, 'write_frames', None)
         while not self._connection.done:
             queue = []
             with self._lock:
                 # wait for available data
                 while not self._queue and not self._connection.done:
                     self._cond_data_available.wait()
+                if self._coalesce_window is not None:
+                    # wait for more data to send it at once
+                    deadline = time.time() + self._coalesce_window
+                    while self._queued_bytes < COALESCE_MAX_BYTES and not self._connection.done:
+                        timeout = deadline - time.time()
+                        if timeout <= 0:
+                            break
+                        self._cond_data_available.wait(timeout)
                 # take all data from queue for processing outside of the lock
                 if self._queue:
                     queue = self._queue
                     self._queue = []
+                    self._queued_bytes = 0
             # relay all data
-            for data in queue:
-                try:
-                    self._connection.write_data(data)
-                except Exception as e:
-                    with self._lock:
-                        self._error = e
+            try:
+                if write_frames is not None and len(queue) > 1:
+                    write_frames(queue)
+                else:
+                    for data in queue:
+                        self._connection.write_data(data)
+            except Exception as e:
+                with self._lock:
+                    self._error = e
+
+class ReactorQueuedConnection(rospy.impl.reactor.ReactorHandler):
+    """
+    Nonblocking counterpart of L{QueuedConnection} used when a reactor
+    is configured.  Data is sent from the publishing thread as long as
+    the socket accepts it; whatever is left is queued and flushed by the
+    reactor once the socket becomes writable again.  Connections thus
+    share the reactor's I/O threads instead of running one thread each,
+    and a slow subscriber only fills its own queue.
+    """
+
+    def __init__(self, connection, queue_size, reactor):
+        """
+        ctor.
+        @param connection: the wrapped transport instance
+        @type  connection: L{TCPROSTransport}
+        @param queue_size: the maximum size of the queue, zero means infinite
+        @type  queue_size: int
+        @param reactor: reactor flushing the queue
+        @type  reactor: L{rospy.impl.reactor.Reactor}
+        """
+        super(ReactorQueuedConnection, self).__init__()
+        self._connection = connection
+        self._queue_size = queue_size
+        self._reactor = reactor
+
+        self._lock = threading.Lock()
+        self._queue = collections.deque()
+        self._pending = None # memoryview of partially sent data
+        self._writing = False
+
+        connection.socket.setblocking(0)
+        self._previous_cleanup_cb = connection.cleanup_cb
+        self._connection.set_cleanup_callback(self._closed_connection_callback)
+        reactor.register(self, rospy.impl.reactor.EVENT_READ)
+
+    def _closed_connection_callback(self, connection):
+        self._reactor.unregister(self)
+        with self._lock:
+            self._queue.clear()
+            self._pending = None
+        if self._previous_cleanup_cb:
+            self._previous_cleanup_cb(connection)
+
+    def __getattr__(self, name):
+        if name.startswith('__'):
+            raise AttributeError(name)
+        return getattr(self._connection, name)
+
+    def fileno(self):
+        return self._connection.fileno()
+
+    def write_data(self, data):
+        try:
+            with self._lock:
+                if self._connection.done:
+                    raise rospy.exceptions.TransportTerminated("connection closed")
+                if self._pending is None and not self._queue:
+                    self._pending = memoryview(data)
+                    self._flush()
+                else:
+                    # pop oldest data if queue limit is reached
+                    if self._queue_size > 0 and len(self._queue) == self._queue_size:
+                        self._queue.popleft()
+                    self._queue.append(data)
+        except rospy.exceptions.TransportTerminated:
+            self._connection.close()
+            raise
+        return True
+
+    def _flush(self):
+        """
+        Send queued data until the socket would block. Must be called
+        with the lock held.
+        @raise rospy.exceptions.TransportTerminated: if the connection failed
+        """
+        conn = self._connection
+        sock = conn.socket
+        if sock is None:
+            raise rospy.exceptions.TransportTerminated("connection closed")
+        sendmsg = getattr(sock, 'sendmsg', None)
+        try:
+            while self._pending is not None or self._queue:
+                if self._pending is None:
+                    self._pending = memoryview(self._queue.popleft())
+                if self._queue and sendmsg is not None:
+                    # gather the backlog into one system call
+                    n = sendmsg([self._pending] + list(itertools.islice(self._queue, IOV_MAX - 1)))
+                else:
+                    n = sock.send(self._pending)
+                conn.stat_bytes += n
+                # consume what was sent, keeping the rest of a partial send
+                while n >= len(self._pending):
+                    n -= len(self._pending)
+                    self._pending = None
+                    conn.stat_num_msg += 1
+                    if not n:
+                        break
+                    self._pending = memoryview(self._queue.popleft())
+                if self._pending is not None:
+                    self._pending = self._pending[n:]
+                    break
+        except socket.error as e:
+            if e.errno not in (errno.EAGAIN, errno.EWOULDBLOCK, errno.EINTR):
+                logdebug("[%s]: closing connection [%s]: %s", conn.name, conn.endpoint_id, e)
+                raise rospy.exceptions.TransportTerminated(str(e))
+        # only wait for the socket to become writable while data is left
+        writing = self._pending is not None
+        if writing != self._writing:
+            self._writing = writing
+            events = rospy.impl.reactor.EVENT_READ
+            if writing:
+                events |= rospy.impl.reactor.EVENT_WRITE
+            self._reactor.modify(self, events)
+
+    def handle_read(self):
+        # subscribers don't send data after the handshake: this
+        # detects that the subscriber closed the connection
+        sock = self._connection.socket
+        if sock is None:
+            raise rospy.exceptions.TransportTerminated("connection closed")
+        try:
+            if not sock.recv(4096):
+                raise rospy.exceptions.TransportTerminated("connection closed by subscriber")
+        except socket.error as e:
+            if e.errno not in (errno.EAGAIN, errno.EWOULDBLOCK, errno.EINTR):
+                raise rospy.exceptions.TransportTerminated(str(e))
+
+    def handle_write(self):
+        with self._lock:
+            self._flush()
+
+    def handle_error(self, e):
+        if not isinstance(e, rospy.exceptions.TransportTerminated):
+            rospyerr("publisher connection [%s] failed: %s", self._connection.endpoint_id, e)
+        self._connection.close()
@@ -32,15 +32,28 @@
 
 """Internal use: Service-specific extensions for TCPROS support"""
 
+import functools
+import heapq
 import io
+import select
 import socket
 import struct
 import sys
 import logging
-
+import random
 import time
 import traceback
 
+try:
+    import concurrent.futures as futures
+except ImportError:
+    futures = None # Python 2 without the futures backport
+
+try:
+    import xmlrpc.client as xmlrpcclient
+except ImportError:
+    import xmlrpclib as xmlrpcclient
+
 import genpy
 
 import rosgraph
@@ -50,6 +63,7 @@ import rosgraph.network
 from rospy.exceptions import TransportInitError, TransportTerminated, ROSException, ROSInterruptException
 from rospy.service import _Service, ServiceException
 
+from rospy.impl.reactor import Reactor, ReactorHandler, get_reactor
 from rospy.impl.registration import get_service_manager
 from rospy.impl.tcpros_base import TCPROSTransport, TCPROSTransportProtocol, \
     get_tcpros_server_address, start_tcpros_server, recv_buff, \
@@ -57,6 +71,7 @@ from rospy.impl.tcpros_base import TCPROSTransport, TCPROSTransportProtocol, \
 
 from rospy.core import logwarn, loginfo, logerr, logdebug
 import rospy.core
+import rospy.executors
 import rospy.msg
 import rospy.names
 
@@ -76,6 +91,141 @@ logger = logging.getLogger('rospy.service')
 #########################################################
 # Service helpers
 
+_service_reactor = None
+_service_reactor_lock = threading.Lock()
+
+def _get_service_reactor():
+    """
+    @return: reactor receiving the responses of asynchronous service
+    calls and the requests of services with a worker pool: the
+    process-wide reactor if connections use one, otherwise a
+    dedicated I/O thread
+    @rtype: L{Reactor}
+    """
+    global _service_reactor
+    reactor = get_reactor()
+    if reactor is not None:
+        return reactor
+    with _service_reactor_lock:
+        if _service_reactor is None:
+            _service_reactor = Reactor(1, name='rospy-service-reactor')
+            rospy.core.add_shutdown_hook(_shutdown_service_reactor)
+        return _service_reactor
+
+def _shutdown_service_reactor(reason=None):
+    global _service_reactor
+    with _service_reactor_lock:
+        if _service_reactor is not None:
+            _service_reactor.shutdown()
+            _service_reactor = None
+
+#: initial delay (in seconds) between master lookups in L{wait_for_services()}
+WAIT_FOR_SERVICE_MIN_DELAY = 0.05
+#: maximum delay (in seconds) between master lookups in L{wait_for_services()}
+WAIT_FOR_SERVICE_MAX_DELAY = 1.0
+
+def _probe_service(resolved_name, uri, timeout=10.0):
+    """
+    Connect to a service and send a probe handshake, which the service
+    answers by closing the connection.
+    @raise socket.error: if the service cannot be contacted
+    """
+    addr = rospy.core.parse_rosrpc_uri(uri)
+    if rosgraph.network.use_ipv6():
+        s = socket.socket(socket.AF_INET6, socket.SOCK_STREAM)
+    else:
+        s = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+    try:
+        # we always want to timeout just in case we're connecting
+        # to a down service.
+        s.settimeout(timeout)
+        logdebug('connecting to ' + str(addr))
+        s.connect(addr)
+        h = { 'probe' : '1', 'md5sum' : '*',
+              'callerid' : rospy.core.get_caller_id(),
+              'service': resolved_name }
+        rosgraph.network.write_ros_handshake_header(s, h)
+    finally:
+        s.close()
+
+def _lookup_services(master, resolved_names):
+    """
+    Look up services with a single request to the master.
+    @return: { resolved_name : uri } of the registered services
+    @rtype: dict
+    """
+    multi = xmlrpcclient.MultiCall(master.handle)
+    for resolved_name in resolved_names:
+        multi.lookupService(master.caller_id, resolved_name)
+    uris = {}
+    for resolved_name, (code, msg, uri) in zip(resolved_names, multi()):
+        if code == 1:
+            uris[resolved_name] = uri
+    return uris
+
+def wait_for_services(services, timeout=None):
+    """
+    Blocks until all the services are available.  The master is asked
+    for all the missing services at once, with exponentially
+    increasing delays (with jitter) between lookups, and the services
+    the master reports registered are contacted after each lookup
+    until they respond.
+    @param services: names of services
+    @type  services: [str]
+    @param timeout: timeout time in seconds or Duration, None for no
+    timeout.
+    @type  timeout: double|rospy.Duration
+    @raise ROSException: if specified timeout is exceeded
+    @raise ROSInterruptException: if shutdown interrupts wait
+    """
+    if timeout is not None and isinstance(timeout, rospy.Duration):
+        timeout = timeout.to_sec()
+    if timeout == 0.:
+        raise ValueError("timeout must be non-zero")
+    timeout_t = time.time() + timeout if timeout else None
+    pending = [rospy.names.resolve_name(service) for service in services]
+    failed = set() # services registered but not responding
+    master = rosgraph.Master(rospy.names.get_caller_id())
+    delay = WAIT_FOR_SERVICE_MIN_DELAY
+    while pending and not rospy.core.is_shutdown():
+        try:
+            uris = _lookup_services(master, pending)
+        except KeyboardInterrupt:
+            # re-raise
+            rospy.core.logdebug("wait_for_service: received keyboard interrupt, assuming signals disabled and re-raising")
+            raise
+        except Exception as e: # master not up
+            rospy.core.logwarn_throttle(10, "wait_for_service: failed to contact master (%s), will keep trying"%e)
+            uris = {}
+        for resolved_name, uri in uris.items():
+            try:
+                probe_timeout = 10.0 if timeout_t is None else max(timeout_t - time.time(), 0.01)
+                _probe_service(resolved_name, uri, probe_timeout)
+            except KeyboardInterrupt:
+                raise
+            except Exception: # registered, but not actually up
+                failed.add(resolved_name)
+                rospy.core.logwarn_throttle(10, "wait_for_service(%s): failed to contact, will keep trying"%resolved_name)
+                continue
+            if resolved_name in failed:
+                rospy.core.loginfo("wait_for_service(%s): finally were able to contact [%s]"%(resolved_name, uri))
+            pending.remove(resolved_name)
+            delay = WAIT_FOR_SERVICE_MIN_DELAY
+        if not pending:
+            return
+
+        sleep = delay * random.uniform(0.5, 1.5)
+        if timeout_t is not None:
+            if time.time() >= timeout_t:
+                break
+            sleep = min(sleep, timeout_t - time.time())
+        time.sleep(max(sleep, 0.))
+        delay = min(2 * delay, WAIT_FOR_SERVICE_MAX_DELAY)
+    if rospy.core.is_shutdown():
+        raise ROSInterruptException("rospy shutdown")
+    elif pending:
+        raise ROSException("timeout exceeded while waiting for service %s"%', '.join(pending))
+
 def wait_for_service(service, timeout=None):
     """
     Blocks until service is available. Use this in
@@ -93,78 +243,7 @@ def wait_for_service(service, timeout=None):
     @raise ROSException: if specified timeout is exceeded
     @raise ROSInterruptException: if shutdown interrupts wait
     """
-    master = rosgraph.Master(rospy.names.get_caller_id())
-    def contact_service(resolved_name, timeout=10.0):
-        try:
-            uri = master.lookupService(resolved_name)
-        except rosgraph.MasterException:
-            return False
-
-        addr = rospy.core.parse_rosrpc_uri(uri)
-        if rosgraph.network.use_ipv6():
-            s = socket.socket(socket.AF_INET6, socket.SOCK_STREAM)
-        else:
-            s = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
-        try:
-            # we always want to timeout just in case we're connecting
-            # to a down service.
-            s.settimeout(timeout)
-            logdebug('connecting to ' + str(addr))
-            s.connect(addr)
-            h = { 'probe' : '1', 'md5sum' : '*',
-                  'callerid' : rospy.core.get_caller_id(),
-                  'service': resolved_name }
-            rosgraph.network.write_ros_handshake_header(s, h)
-            return uri
-        finally:
-            if s is not None:
-                s.close()
-    if timeout is not None and isinstance(timeout, rospy.Duration):
-        timeout = timeout.to_sec()
-    if timeout == 0.:
-        raise ValueError("timeout must be non-zero")
-    resolved_name = rospy.names.resolve_name(service)
-    contact_failed = False
-    if timeout:
-        timeout_t = time.time() + timeout
-        while not rospy.core.is_shutdown() and time.time() < timeout_t:
-            try:
-                uri = contact_service(resolved_name, timeout_t - time.time())
-                if uri:
-                    if contact_failed:
-                        rospy.core.loginfo("wait_for_service(%s): finally were able to contact [%s]"%(resolved_name, uri))
-                    return
-            except KeyboardInterrupt:
-                # re-raise
-                rospy.core.logdebug("wait_for_service: received keyboard interrupt, assuming signals disabled and re-raising")
-                raise 
-            except: # service not actually up
-                contact_failed = True
-                rospy.core.logwarn_throttle(10, "wait_for_service(%s): failed to contact, will keep trying"%resolved_name)
-            time.sleep(0.3)
-        if rospy.core.is_shutdown():
-            raise ROSInterruptException("rospy shutdown")
-        else:
-            raise ROSException("timeout exceeded while waiting for service %s"%resolved_name)
-    else:
-        while not rospy.core.is_shutdown():
-            try:
-                uri = contact_service(resolved_name)
-                if uri:
-                    if contact_failed:
-                        rospy.core.loginfo("wait_for_service(%s): finally were able to contact [%s]"%(resolved_name, uri))
-                    return
-            except KeyboardInterrupt:
-                # re-raise
-                rospy.core.logdebug("wait_for_service: received keyboard interrupt, assuming signals disabled and re-raising")
-                raise 
-            except: # service not actually up
-                contact_failed = True
-                rospy.core.logwarn_throttle(10, "wait_for_service(%s): failed to contact, will keep trying"%resolved_name)
-            time.sleep(0.3)
-        if rospy.core.is_shutdown():
-            raise ROSInterruptException("rospy shutdown")
-    
+    wait_for_services([service], timeout)
 
 def convert_return_to_response(response, response_class):
     """
@@ -249,6 +328,11 @@ def service_connection_handler(sock, client_addr, header):
             transport = TCPROSTransport(service.protocol, service_name, header=header)
             transport.set_socket(sock, header['callerid'])
             transport.write_header()
+            if getattr(service, 'request_queue', None) is not None:
+                # requests are received on the reactor and handled by
+                # the service's executor
+                service.handle_queued(transport, header)
+                return
             # using threadpool reduced performance by an order of
             # magnitude, need to investigate better
             t = threading.Thread(target=service.handle, args=(transport, header))
@@ -383,6 +467,552 @@ class TCPROSServiceClient(TCPROSTransportProtocol):
         bval = b.getvalue()
         return struct.unpack('<%ss'%length, bval[5:5+length])[0] # ready in len byte
 
+class _ServiceTransportError(ServiceException):
+    """
+    ServiceException raised when the connection to the service fails,
+    as opposed to the service returning an error.
+    """
+    pass
+
+def _receive_response(transport, resolved_name):
+    """
+    Read the response of a service call from transport.
+    @return: response message
+    @rtype: genpy.Message
+    @raise ServiceException: if communication with remote service fails
+    @raise ROSInterruptException: if node shutdown interrupts service call
+    """
+    try:
+        responses = transport.receive_once()
+        if len(responses) == 0:
+            raise ServiceException("service [%s] returned no response"%resolved_name)
+        elif len(responses) > 1:
+            raise ServiceException("service [%s] returned multiple responses: %s"%(resolved_name, len(responses)))
+    except rospy.exceptions.TransportException as e:
+        # convert lower-level exception to exposed type
+        if rospy.core.is_shutdown():
+            raise rospy.exceptions.ROSInterruptException("node shutdown interrupted service call")
+        else:
+            raise _ServiceTransportError("transport error completing service call: %s"%(str(e)))
+    return responses[0]
+
+def lookup_service_uri(resolved_name):
+    """
+    Look up the ROSRPC URI of a service with the master.
+    @param resolved_name: resolved service name
+    @type  resolved_name: str
+    @return: service URI
+    @rtype: str
+    @raise ServiceException: if the service is not available
+    """
+    try:
+        master = rosgraph.Master(rospy.names.get_caller_id())
+        uri = master.lookupService(resolved_name)
+    except socket.error:
+        raise ServiceException("unable to contact master")
+    except rosgraph.MasterError as e:
+        logger.error("[%s]: lookup service failed with message [%s]", resolved_name, str(e))
+        raise ServiceException("service [%s] unavailable"%resolved_name)
+    # validate
+    try:
+        rospy.core.parse_rosrpc_uri(uri)
+    except rospy.impl.validators.ParameterInvalid:
+        raise ServiceException("master returned invalid ROSRPC URI: %s"%uri)
+    return uri
+
+class ServiceConnectionPool(object):
+    """
+    Process-wide pool of persistent service connections, keyed by
+    service URI, md5sum and connection headers.  Each connection runs
+    one call at a time and concurrent calls get separate connections.
+    Service URIs are cached: a failed connection attempt, or the
+    failure of a call on a connection taken from the pool, looks the
+    service up again and retries once, as the service has most likely
+    been restarted.
+    """
+
+    def __init__(self, max_connections=16, idle_timeout=60.):
+        """
+        ctor.
+        @param max_connections: maximum number of connections per
+        service, calls beyond it wait for a connection to be released
+        @type  max_connections: int
+        @param idle_timeout: time (in seconds) after which idle
+        connections are closed
+        @type  idle_timeout: float
+        """
+        self.max_connections = max_connections
+        self.idle_timeout = idle_timeout
+        self._cond = threading.Condition()
+        self._idle = {} # { key : [(transport, release time)] }
+        self._active = {} # { key : number of connections in use }
+        self._uris = {} # { resolved_name : uri }
+        self._waiters = {} # { key : [fn] }, asynchronous calls waiting for a connection
+        self._seq = 0
+        self.closed = False
+
+        # asynchronous calls: lookups and connections run on a few
+        # threads, responses are received on a reactor
+        self._executor = None
+        self._reactor = None
+        self._calls = set() # asynchronous calls in progress
+        self._deadlines = [] # heap of (deadline, id, call)
+        self._timeout_thread = None
+
+    def lookup(self, resolved_name, refresh=False):
+        """
+        @param refresh: if True, ignore the cached URI
+        @type  refresh: bool
+        @return: URI of the service
+        @rtype: str
+        @raise ServiceException: if the service is not available
+        """
+        with self._cond:
+            uri = None if refresh else self._uris.get(resolved_name)
+        if uri is None:
+            uri = lookup_service_uri(resolved_name)
+            with self._cond:
+                self._uris[resolved_name] = uri
+        return uri
+
+    def _key(self, uri, service_class, headers):
+        return (uri, service_class._md5sum, tuple(sorted((headers or {}).items())))
+
+    def _is_alive(self, transport):
+        """
+        Check an idle connection: the service does not send anything
+        between calls, so a readable socket was closed by the service.
+        """
+        sock = transport.socket
+        if transport.done or sock is None:
+            return False
+        try:
+            if hasattr(select, 'poll'):
+                # select() is limited to file descriptors below FD_SETSIZE
+                poller = select.poll()
+                poller.register(sock, select.POLLIN)
+                return not poller.poll(0)
+            return not select.select([sock], [], [], 0)[0]
+        except (socket.error, select.error, ValueError):
+            return False
+
+    def _sweep_idle(self, now):
+        """
+        Take the connections idle for more than idle_timeout out of the
+        pool. Must be called with the lock held.
+        @return: connections to close
+        @rtype: [L{TCPROSTransport}]
+        """
+        expired = []
+        for k, idle in list(self._idle.items()):
+            while idle and now - idle[0][1] > self.idle_timeout:
+                expired.append(idle.pop(0)[0])
+            if not idle:
+                del self._idle[k]
+        return expired
+
+    def _next_seq(self):
+        with self._cond:
+            self._seq += 1
+            return self._seq
+
+    def acquire(self, resolved_name, service_class, headers=None, buff_size=DEFAULT_BUFF_SIZE, refresh=False, waiter=None):
+        """
+        Take an idle connection to the service, or connect a new one.
+        @param resolved_name: resolved service name
+        @type  resolved_name: str
+        @param service_class: service class
+        @type  service_class: Service class
+        @param headers: additional connection headers
+        @type  headers: dict
+        @param refresh: if True, look the service up again
+        @type  refresh: bool
+        @param waiter: if set and the service has max_connections
+        connections in use, waiter(key) is called once one of them is
+        released instead of blocking, and None is returned.  waiter
+        returns False if it no longer needs the connection
+        @type  waiter: fn(tuple) -> bool
+        @return: (key, transport, reused), to pass to L{release()}.
+        reused is True if the connection was used before
+        @rtype: (tuple, L{TCPROSTransport}, bool)
+        @raise ServiceException: if unable to connect to the service
+        """
+        uri = self.lookup(resolved_name, refresh)
+        key = self._key(uri, service_class, headers)
+        stale = []
+        try:
+            with self._cond:
+                while True:
+                    if self.closed:
+                        raise ServiceException("service connection pool is closed")
+                    stale.extend(self._sweep_idle(time.time()))
+                    idle = self._idle.get(key)
+                    while idle:
+                        transport, _ = idle.pop()
+                        if self._is_alive(transport):
+                            self._active[key] = self._active.get(key, 0) + 1
+                            return key, transport, True
+                        stale.append(transport)
+                    if self._active.get(key, 0) < self.max_connections:
+                        self._active[key] = self._active.get(key, 0) + 1
+                        break
+                    if waiter is not None:
+                        self._waiters.setdefault(key, []).append(waiter)
+                        return None
+                    self._cond.wait(1.)
+                    if rospy.core.is_shutdown():
+                        raise ROSInterruptException("rospy shutdown")
+        finally:
+            for transport in stale:
+                transport.close()
+
+        connection_headers = dict(headers or {})
+        connection_headers['persistent'] = '1'
+        transport = TCPROSTransport(TCPROSServiceClient(resolved_name, service_class, headers=connection_headers), resolved_name)
+        transport.buff_size = buff_size
+        try:
+            dest_addr, dest_port = rospy.core.parse_rosrpc_uri(uri)
+            transport.connect(dest_addr, dest_port, uri)
+        except TransportInitError as e:
+            self.release(key, transport, False)
+            if not refresh:
+                # the service may have moved
+                return self.acquire(resolved_name, service_class, headers, buff_size, True, waiter)
+            # can be a connection or md5sum mismatch
+            raise ServiceException("unable to connect to service: %s"%e)
+        return key, transport, False
+
+    def release(self, key, transport, healthy=True):
+        """
+        Return a connection taken with L{acquire()}.
+        @param healthy: if False, the connection is closed
+        @type  healthy: bool
+        """
+        now = time.time()
+        expired = []
+        with self._cond:
+            self._active[key] -= 1
+            if healthy and not self.closed and not transport.done:
+                self._idle.setdefault(key, []).append((transport, now))
+            else:
+                expired.append(transport)
+            expired.extend(self._sweep_idle(now))
+            self._cond.notify()
+        for t in expired:
+            t.close()
+        self._wake_waiter(key)
+
+    def _wake_waiter(self, key):
+        """
+        Hand a released connection of key to the first asynchronous
+        call still waiting for one.
+        """
+        while True:
+            with self._cond:
+                waiters = self._waiters.get(key)
+                if not waiters:
+                    return
+                waiter = waiters.pop(0)
+                if not waiters:
+                    del self._waiters[key]
+            if waiter(key):
+                return
+
+    def _remove_waiter(self, waiter):
+        """
+        Forget a waiter passed to L{acquire()}. Must be called with the
+        lock held.
+        """
+        for key, waiters in list(self._waiters.items()):
+            if waiter in waiters:
+                waiters.remove(waiter)
+                if not waiters:
+                    del self._waiters[key]
+
+    def call(self, resolved_name, service_class, request, headers=None, buff_size=DEFAULT_BUFF_SIZE):
+        """
+        Call a service over a pooled connection.
+        @param request: request message
+        @type  request: genpy.Message
+        @return: response message
+        @rtype: genpy.Message
+        @raise ServiceException: if communication with remote service fails
+        @raise ROSInterruptException: if node shutdown interrupts service call
+        """
+        refresh = False
+        while True:
+            key, transport, reused = self.acquire(resolved_name, service_class, headers, buff_size, refresh)
+            healthy = False
+            try:
+                transport.send_message(request, self._next_seq())
+                response = _receive_response(transport, resolved_name)
+                healthy = True
+            except (rospy.exceptions.TransportException, _ServiceTransportError) as e:
+                if rospy.core.is_shutdown():
+                    raise ROSInterruptException("node shutdown interrupted service call")
+                if reused and not refresh:
+                    # the pooled connection went stale, most likely
+                    # because the service was restarted: look it up again
+                    logdebug("[%s]: pooled connection failed (%s), retrying", resolved_name, e)
+                    refresh = True
+                    continue
+                if isinstance(e, ServiceException):
+                    raise
+                raise ServiceException("transport error completing service call: %s"%(str(e)))
+            except ServiceException:
+                # the service responded with an error: the connection
+                # is still usable
+                healthy = True
+                raise
+            finally:
+                self.release(key, transport, healthy)
+            return response
+
+    def close(self, reason=None):
+        """
+        Close all idle connections and stop pooling.
+        """
+        with self._cond:
+            self.closed = True
+            idle, self._idle = self._idle, {}
+            self._waiters = {}
+            calls, self._calls = self._calls, set()
+            self._deadlines = []
+            self._cond.notify_all()
+        for connections in idle.values():
+            for transport, _ in connections:
+                transport.close()
+        # pending asynchronous calls fail
+        for call in calls:
+            call.finish(exception=ROSInterruptException("service connection pool closed"))
+
+    def call_async(self, resolved_name, service_class, request, headers=None, buff_size=DEFAULT_BUFF_SIZE, timeout=None):
+        """
+        Call a service over a pooled connection without blocking.  The
+        request is sent from a small pool of threads, which also do the
+        service lookups and connect new connections, and the response is
+        received on a reactor: any number of calls can be in flight
+        without a thread each.  Cancelling the returned future, or the
+        timeout expiring, closes the connection of the call.
+        @param request: request message
+        @type  request: genpy.Message
+        @param timeout: time (in seconds) after which the call fails
+        with a ROSException, or None
+        @type  timeout: float
+        @return: future of the response message.  Its exception is a
+        ServiceException if communication with the remote service fails.
+        @rtype: concurrent.futures.Future
+        @raise ROSException: if concurrent.futures is not available
+        """
+        if futures is None:
+            raise ROSException("asynchronous service calls require concurrent.futures")
+        future = futures.Future()
+        call = _AsyncServiceCall(self, resolved_name, service_class, request, headers, buff_size, future)
+        with self._cond:
+            if self.closed:
+                raise ServiceException("service connection pool is closed")
+            self._calls.add(call)
+            if self._executor is None:
+                self._executor = rospy.executors.ThreadPoolExecutor(threads=4, name='rospy-service-call')
+                self._reactor = _get_service_reactor()
+            if timeout is not None:
+                heapq.heappush(self._deadlines, (time.time() + timeout, id(call), call))
+                if self._timeout_thread is None:
+                    self._timeout_thread = threading.Thread(target=self._run_timeouts, name='rospy-service-timeouts')
+                    self._timeout_thread.daemon = True
+                    self._timeout_thread.start()
+                self._cond.notify_all()
+        future.add_done_callback(call.cancelled)
+        self._executor.execute(call.start)
+        return future
+
+    def _run_timeouts(self):
+        expired = []
+        with self._cond:
+            while not self.closed and not rospy.core.is_shutdown():
+                now = time.time()
+                while self._deadlines and (self._deadlines[0][0] <= now or self._deadlines[0][2].future.done()):
+                    expired.append(heapq.heappop(self._deadlines)[2])
+                if expired:
+                    self._cond.release()
+                    try:
+                        for call in expired:
+                            call.finish(exception=ROSException("timeout exceeded while waiting for service [%s]"%call.resolved_name))
+                    finally:
+                        self._cond.acquire()
+                    expired = []
+                    continue
+                self._cond.wait(min(self._deadlines[0][0] - now, 1.) if self._deadlines else 1.)
+            self._timeout_thread = None
+
+class _AsyncServiceCall(ReactorHandler):
+    """
+    Service call started by L{ServiceConnectionPool.call_async()}: the
+    request is sent on a thread of the pool's executor and the response
+    is received on its reactor.
+    """
+
+    def __init__(self, pool, resolved_name, service_class, request, headers, buff_size, future):
+        self.pool = pool
+        self.resolved_name = resolved_name
+        self.service_class = service_class
+        self.request = request
+        self.headers = headers
+        self.buff_size = buff_size
+        self.future = future
+        self.refresh = False
+        self.reused = False
+        self.key = self.transport = None
+        self._fileno = None
+        self._buff = bytearray()
+        self._lock = threading.Lock()
+        self._finished = False
+
+    def start(self, woken_key=None):
+        """
+        Acquire a connection and send the request.
+        @param woken_key: key of the released connection this call was
+        woken for, passed on to the next waiter if the call does not
+        take it
+        @type  woken_key: tuple
+        """
+        if self._finished:
+            if woken_key is not None:
+                self.pool._wake_waiter(woken_key)
+            return
+        try:
+            conn = self.pool.acquire(self.resolved_name, self.service_class, self.headers, self.buff_size,
+                                     self.refresh, waiter=self._wake)
+        except Exception as e:
+            if woken_key is not None:
+                self.pool._wake_waiter(woken_key)
+            self.finish(exception=e)
+            return
+        if conn is None:
+            return # all the connections to the service are busy
+        with self._lock:
+            if self._finished:
+                self.pool.release(conn[0], conn[1])
+                return
+            self.key, transport, self.reused = conn
+            self.transport = transport
+            self._buff = bytearray()
+        try:
+            sock = transport.socket
+            sock.setblocking(1)
+            transport.send_message(self.request, self.pool._next_seq())
+            sock.setblocking(0)
+            self._fileno = sock.fileno()
+        except (rospy.exceptions.TransportException, socket.error, AttributeError) as e:
+            # AttributeError: closed by a concurrent cancellation
+            self.failed(e)
+            return
+        self.pool._reactor.register(self)
+
+    def _wake(self, key):
+        if self._finished:
+            return False
+        self.pool._executor.execute(functools.partial(self.start, key))
+        return True
+
+    def fileno(self):
+        return self._fileno
+
+    def handle_read(self):
+        if self._finished:
+            raise TransportTerminated("call finished")
+        d = self.transport.socket.recv(65536)
+        if not d:
+            raise TransportTerminated("connection closed by service")
+        b = self._buff
+        b.extend(d)
+        # OK byte, then the length-prefixed response or error message
+        if len(b) < 5:
+            return
+        ok, size = struct.unpack_from('<BI', b)
+        if len(b) < 5 + size:
+            return
+        data = bytes(b[5:5 + size])
+        if not ok:
+            self.finish(exception=ServiceException("service [%s] responded with an error: %s"%(self.resolved_name, data.decode('utf-8', 'replace'))), healthy=True)
+            return
+        try:
+            response = self.service_class._response_class()
+            response.deserialize(data)
+            response._connection_header = self.transport.header
+        except Exception as e:
+            self.finish(exception=ServiceException("cannot deserialize response of service [%s]: %s"%(self.resolved_name, e)))
+            return
+        self.finish(result=response, healthy=True)
+
+    def handle_error(self, e):
+        self.failed(e)
+
+    def failed(self, e):
+        """
+        The connection failed: a reused connection is most likely stale,
+        retry once after looking up the service again.
+        """
+        with self._lock:
+            if self._finished:
+                return
+            key, transport, self.key, self.transport = self.key, self.transport, None, None
+        if transport is not None:
+            self.pool._reactor.unregister(self)
+            self.pool.release(key, transport, False)
+        if rospy.core.is_shutdown():
+            self.finish(exception=ROSInterruptException("node shutdown interrupted service call"))
+        elif self.reused and not self.refresh:
+            logdebug("[%s]: pooled connection failed (%s), retrying", self.resolved_name, e)
+            self.refresh = True
+            self.pool._executor.execute(self.start)
+        else:
+            self.finish(exception=ServiceException("transport error completing service call: %s"%(str(e))))
+
+    def cancelled(self, future):
+        if future.cancelled():
+            self.finish()
+
+    def finish(self, result=None, exception=None, healthy=False):
+        """
+        Complete the call and return its connection to the pool.  The
+        connection is closed unless healthy is set.
+        """
+        with self._lock:
+            if self._finished:
+                return
+            self._finished = True
+            key, transport, self.key, self.transport = self.key, self.transport, None, None
+        with self.pool._cond:
+            self.pool._calls.discard(self)
+            self.pool._remove_waiter(self._wake)
+        if transport is not None:
+            self.pool._reactor.unregister(self)
+            if healthy:
+                transport.socket.setblocking(1)
+            self.pool.release(key, transport, healthy)
+        try:
+            if exception is not None:
+                self.future.set_exception(exception)
+            elif not self.future.done():
+                self.future.set_result(result)
+        except Exception:
+            pass # cancelled meanwhile
+
+_pool = None
+_pool_lock = threading.Lock()
+
+def get_service_connection_pool():
+    """
+    @return: the process-wide pool of service connections
+    @rtype: L{ServiceConnectionPool}
+    """
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            _pool = ServiceConnectionPool()
+            rospy.core.add_shutdown_hook(_pool.close)
+        return _pool
     
 class ServiceProxy(_Service):
     """
@@ -393,7 +1023,7 @@ class ServiceProxy(_Service):
       resp = add_two_ints(1, 2)
     """
     
-    def __init__(self, name, service_class, persistent=False, headers=None):
+    def __init__(self, name, service_class, persistent=False, headers=None, pooled=False):
         """
         ctor.
         @param name: name of service to call
@@ -407,12 +1037,19 @@ class ServiceProxy(_Service):
         @type  persistent: bool
         @param headers: (optional) arbitrary headers 
         @type  headers: dict
+        @param pooled: (optional) if True, calls use the persistent
+        connections of a process-wide pool, see
+        L{ServiceConnectionPool}. Pooled proxies can be called from
+        several threads at once.
+        @type  pooled: bool
         """
         super(ServiceProxy, self).__init__(name, service_class)
         self.uri = None
         self.seq = 0
         self.buff_size = DEFAULT_BUFF_SIZE
         self.persistent = persistent
+        self.pooled = pooled
+        self.headers = dict(headers) if headers else None
         if persistent:
             if not headers:
                 headers = {}
@@ -441,6 +1078,34 @@ class ServiceProxy(_Service):
         """
         return self.call(*args, **kwds)
     
+    def call_async(self, request, timeout=None):
+        """
+        Call the service without blocking.  Asynchronous calls always go
+        through the connections of the process-wide pool (see
+        L{ServiceConnectionPool}), so many calls can be in flight with
+        a few threads::
+
+          futures = [add_two_ints.call_async(AddTwoIntsRequest(i, i)) for i in range(100)]
+          sums = [f.result().sum for f in futures]
+
+        Calls can be cancelled with the future's cancel() method while
+        their response has not been received.
+        @param request: request message, or the value of its single field
+        @type  request: genpy.Message
+        @param timeout: time (in seconds) after which the call fails
+        with a ROSException, or None
+        @type  timeout: float
+        @return: future of the response message.  Its exception is a
+        ServiceException if communication with the remote service fails.
+        @rtype: concurrent.futures.Future
+        @raise TypeError: if request is not of the valid type (Message)
+        """
+        request = rospy.msg.args_kwds_to_message(self.request_class, (request,), {})
+        if not isinstance(request, genpy.Message) or self.request_class._type != request._type:
+            raise TypeError("request object type [%s] does not match service type [%s]"%(request.__class__, self.request_class))
+        return get_service_connection_pool().call_async(self.resolved_name, self.service_class, request,
+                                                        headers=self.headers, buff_size=self.buff_size, timeout=timeout)
+
     def _get_service_uri(self, request):
         """
         private routine for getting URI of service to call
@@ -460,20 +1125,7 @@ class ServiceProxy(_Service):
         #if self.uri is None:
         if 1: #always do lookup for now, in the future we need to optimize
             try:
-                try:
-                    master = rosgraph.Master(rospy.names.get_caller_id())
-                    self.uri = master.lookupService(self.resolved_name)
-                except socket.error:
-                    raise ServiceException("unable to contact master")
-                except rosgraph.MasterError as e:
-                    logger.error("[%s]: lookup service failed with message [%s]", self.resolved_name, str(e))
-                    raise ServiceException("service [%s] unavailable"%self.resolved_name)
-                
-                # validate
-                try:
-                    rospy.core.parse_rosrpc_uri(self.uri)
-                except rospy.impl.validators.ParameterInvalid:
-                    raise ServiceException("master returned invalid ROSRPC URI: %s"%self.uri)
+                self.uri = lookup_service_uri(self.resolved_name)
             except socket.error as e:
                 logger.error("[%s]: socket error contacting service, master is probably unavailable",self.resolved_name)
         return self.uri
@@ -496,6 +1148,12 @@ class ServiceProxy(_Service):
 
         # convert args/kwds to request message class
         request = rospy.msg.args_kwds_to_message(self.request_class, args, kwds) 
+
+        if self.pooled:
+            if not isinstance(request, genpy.Message) or self.request_class._type != request._type:
+                raise TypeError("request object type [%s] does not match service type [%s]"%(request.__class__, self.request_class))
+            return get_service_connection_pool().call(self.resolved_name, self.service_class, request,
+                                                      headers=self.headers, buff_size=self.buff_size)
             
         # initialize transport
         if self.transport is None:
@@ -520,22 +1178,11 @@ class ServiceProxy(_Service):
         transport.send_message(request, self.seq)
 
         try:
-            responses = transport.receive_once()
-            if len(responses) == 0:
-                raise ServiceException("service [%s] returned no response"%self.resolved_name)
-            elif len(responses) > 1:
-                raise ServiceException("service [%s] returned multiple responses: %s"%(self.resolved_name, len(responses)))
-        except rospy.exceptions.TransportException as e:
-            # convert lower-level exception to exposed type
-            if rospy.core.is_shutdown():
-                raise rospy.exceptions.ROSInterruptException("node shutdown interrupted service call")
-            else:
-                raise ServiceException("transport error completing service call: %s"%(str(e)))
+            return _receive_response(transport, self.resolved_name)
         finally:
             if not self.persistent:
                 transport.close()
                 self.transport = None
-        return responses[0]
 
     
     def close(self):
@@ -548,7 +1195,8 @@ class ServiceImpl(_Service):
     Implementation of ROS Service. This intermediary class allows for more configuration of behavior than the Service class.
     """
     
-    def __init__(self, name, service_class, handler, buff_size=DEFAULT_BUFF_SIZE, error_handler=None):
+    def __init__(self, name, service_class, handler, buff_size=DEFAULT_BUFF_SIZE, error_handler=None,
+                 max_concurrency=None, queue_size=None, executor=None, overflow=rospy.executors.DROP_NEWEST):
         super(ServiceImpl, self).__init__(name, service_class)
 
         if not name or not isstring(name):
@@ -564,6 +1212,7 @@ class ServiceImpl(_Service):
             self.error_handler = error_handler
         self.registered = False
         self.seq = 0
+        self._seq_lock = threading.Lock()
         self.done = False
         self.buff_size=buff_size
 
@@ -574,6 +1223,21 @@ class ServiceImpl(_Service):
 
         self.protocol = TCPService(self.resolved_name, service_class, self.buff_size)
 
+        # requests are handled on a thread per connection, unless the
+        # concurrency is bounded
+        self.request_queue = None
+        self._own_executor = None
+        if max_concurrency is not None or queue_size is not None or executor is not None:
+            if max_concurrency is None:
+                max_concurrency = getattr(executor, 'threads', 1)
+            if executor is None:
+                if max_concurrency < 1:
+                    raise ValueError("max_concurrency must be at least 1")
+                executor = self._own_executor = rospy.executors.ThreadPoolExecutor(
+                    threads=max_concurrency, name='rospy-service%s'%self.resolved_name.replace('/', '-'))
+            self.request_queue = rospy.executors.CallbackQueue(executor, self._handle_queued_request, queue_size,
+                                                               max_concurrency, overflow, self._reject_request)
+
         logdebug("[%s]: new Service instance"%self.resolved_name)
 
     # TODO: should consider renaming to unregister
@@ -589,6 +1253,17 @@ class ServiceImpl(_Service):
         """
         self.done = True
         logdebug('[%s].shutdown: reason [%s]'%(self.resolved_name, reason))
+        if self.request_queue is not None:
+            # the clients of the queued requests get an error
+            for connection, _ in self.request_queue.close():
+                try:
+                    connection.transport.socket.setblocking(1)
+                    self._write_service_error(connection.transport, "service [%s] shut down"%self.resolved_name)
+                except (rospy.exceptions.TransportException, socket.error, AttributeError):
+                    pass
+                connection.transport.close()
+        if self._own_executor is not None:
+            self._own_executor.shutdown()
         try:
             #TODO: make service manager configurable            
             get_service_manager().unregister(self.resolved_name, self)
@@ -631,10 +1306,13 @@ class ServiceImpl(_Service):
         try:
             # convert return type to response Message instance
             response = convert_return_to_response(self.handler(request), self.response_class)
-            self.seq += 1
+            # requests can be handled on several threads
+            with self._seq_lock:
+                self.seq += 1
+                seq = self.seq
             # ok byte
             transport.write_buff.write(struct.pack('<B', 1))
-            transport.send_message(response, self.seq)
+            transport.send_message(response, seq)
         except ServiceException as e:
             rospy.core.rospydebug("handler raised ServiceException: %s"%(e))
             self._write_service_error(transport, "service cannot process request: %s"%e)
@@ -677,6 +1355,98 @@ class ServiceImpl(_Service):
                 handle_done = True
         transport.close()
 
+    def handle_queued(self, transport, header):
+        """
+        Receive the requests of a connection on the service reactor and
+        queue them for the executor of the service.  Returns
+        immediately.
+        @param transport: transport instance
+        @type  transport: L{TCPROSTransport}
+        @param header: headers from client
+        @type  header: dict
+        """
+        if header.get('probe', None) == '1':
+            transport.close()
+            return
+        persistent = header.get('persistent', '').lower() in ['1', 'true']
+        _ServiceConnection(self, transport, persistent, _get_service_reactor()).start()
+
+    def _handle_queued_request(self, item):
+        connection, request = item
+        try:
+            connection.transport.socket.setblocking(1)
+            self._handle_request(connection.transport, request)
+        except (rospy.exceptions.TransportException, socket.error, AttributeError) as e:
+            # AttributeError: closed meanwhile
+            logdebug("service[%s]: transport terminated: %s"%(self.resolved_name, e))
+            connection.transport.close()
+            return
+        connection.next()
+
+    def _reject_request(self, item):
+        """
+        Respond to a request dropped from the full request queue with a
+        service error.
+        """
+        connection, request = item
+        logdebug("service[%s]: request queue full, rejecting request"%self.resolved_name)
+        try:
+            connection.transport.socket.setblocking(1)
+            self._write_service_error(connection.transport, "service [%s] is busy, request rejected"%self.resolved_name)
+        except (rospy.exceptions.TransportException, socket.error, AttributeError):
+            connection.transport.close()
+            return
+        connection.next()
+
+class _ServiceConnection(ReactorHandler):
+    """
+    Connection to a service with a request queue: requests are
+    received on a reactor, which stops watching the connection while
+    its request is queued or handled.
+    """
+
+    def __init__(self, service, transport, persistent, reactor):
+        self.service = service
+        self.transport = transport
+        self.persistent = persistent
+        self.reactor = reactor
+        self._fileno = transport.socket.fileno()
+
+    def start(self):
+        sock = self.transport.socket
+        if sock is None or self.transport.done:
+            return
+        sock.setblocking(0)
+        self.reactor.register(self)
+
+    def next(self):
+        """
+        Wait for the next request, after a response.
+        """
+        if self.persistent and not self.service.done:
+            self.start()
+        else:
+            self.transport.close()
+
+    def fileno(self):
+        return self._fileno
+
+    def handle_read(self):
+        transport = self.transport
+        if transport.done or self.service.done or rospy.core.is_shutdown():
+            raise TransportTerminated("connection closed")
+        requests = transport.receive_available()
+        if not requests:
+            return
+        # clients send one request at a time
+        self.reactor.unregister(self)
+        if not self.service.request_queue.put((self, requests[0])) and self.service.request_queue.closed:
+            transport.close()
+
+    def handle_error(self, e):
+        logdebug("service[%s]: transport terminated: %s"%(self.service.resolved_name, e))
+        self.transport.close()
+
 
 class Service(ServiceImpl):
     """
@@ -688,7 +1458,9 @@ class Service(ServiceImpl):
     """
     
     def __init__(self, name, service_class, handler,
-                 buff_size=DEFAULT_BUFF_SIZE, error_handler=None):
+                 buff_size=DEFAULT_BUFF_SIZE, error_handler=None,
+                 max_concurrency=None, queue_size=None, executor=None,
+                 overflow=rospy.executors.DROP_NEWEST):
         """
         ctor.
 
@@ -714,9 +1486,33 @@ class Service(ServiceImpl):
         @param error_handler: callback function for handling errors
         raised in the service code.
         @type  error_handler: fn(exception, exception_type, exception_value, traceback)->None
+
+        @param max_concurrency: maximum number of requests handled at
+        a time. By default, each connection is handled by a thread of
+        its own. If max_concurrency, queue_size or executor is set,
+        requests are received on a shared I/O thread and handled by the
+        executor instead, whatever the number of connections.
+        @type  max_concurrency: int
+
+        @param queue_size: maximum number of requests waiting to be
+        handled, or None for no limit. Requests that do not fit are
+        rejected with a service error, see overflow.
+        @type  queue_size: int
+
+        @param executor: executor running the handler, e.g. a
+        L{rospy.executors.ThreadPoolExecutor} shared by several
+        services. By default, the service gets max_concurrency
+        threads of its own.
+        @type  executor: L{rospy.executors.Executor}
+
+        @param overflow: request rejected when the queue is full:
+        L{rospy.executors.DROP_NEWEST} (the incoming request) or
+        L{rospy.executors.DROP_OLDEST} (the request that waited longest)
+        @type  overflow: str
         """
         super(Service, self).__init__(name, service_class, handler, buff_size,
-                                      error_handler)
+                                      error_handler, max_concurrency, queue_size,
+                                      executor, overflow)
 
         #TODO: make service manager configurable
         get_service_manager().register(self.resolved_name, self)
@@ -194,6 +194,26 @@ class ProtocolHandler(object): #interface
     ##     list where the first element is the string identifier for the protocol.
     def get_supported(self):
         return []
+
+    ## This method is called on subscribers when connecting to the
+    ## Publisher \a pub_uri, and returns the protocol list for this
+    ## connection. Protocols whose parameters are specific to each
+    ## connection override this method.
+    ## @param self
+    ## @param topic str: resolved topic name
+    ## @param pub_uri str: publisher API URI
+    ## @return [[str, val*]]: list of supported protocol params
+    def get_topic_supported(self, topic, pub_uri):
+        return self.get_supported()
+
+    ## Release the resources reserved by get_topic_supported() for a
+    ## connection that was not created by this handler, e.g. because
+    ## the Publisher selected another protocol.
+    ## @param self
+    ## @param topic str: resolved topic name
+    ## @param pub_uri str: publisher API URI, or None for all publishers
+    def release_topic(self, topic, pub_uri=None):
+        pass
         
     ## Prepare a transport based on one of the supported protocols
     ## declared by a Subscriber. Subscribers supply a list of
@@ -32,70 +32,139 @@
 #
 # Revision $Id$
 
-from __future__ import print_function
-
 """
 UDPROS connection protocol.
+
+Implements U{http://ros.org/wiki/ROS/UDPROS}, compatible with roscpp.
+UDPROS is negotiated in requestTopic(): the subscriber binds a UDP
+socket for the connection and sends its connection header, address
+and maximum datagram size; the publisher answers with its own
+connection header and a connection ID.  Each message, including its
+4-byte length prefix, is then sent in one or more datagrams, each
+starting with an 8-byte header::
+
+  uint32 connection_id
+  uint8  op        # DATA0 for the first datagram of a message, DATAN for the others
+  uint8  message_id
+  uint16 block     # number of datagrams for DATA0, index of the datagram for DATAN
+
+There is no retransmission: a message with a missing datagram is
+dropped, and message IDs are tracked to count the messages lost.
 """
 ## UDPROS connection protocol.
 #  http://ros.org/wiki/ROS/UDPROS
 # 
 
+import errno
 import socket
+import struct
 import threading
+import traceback
+
+try:
+    from xmlrpc.client import Binary # Python 3.x
+except ImportError:
+    from xmlrpclib import Binary # Python 2.x
+
+from genpy import DeserializationError
+
 import rosgraph.network
 
+import rospy.names
+import rospy.impl.reactor
 import rospy.impl.registration
 import rospy.impl.transport
+from rospy.core import is_shutdown, logdebug, logwarn, rospyerr
+from rospy.exceptions import TransportInitError, TransportTerminated
+
+from rospy.impl.tcpros_pubsub import TCPROSPub, TCPROSSub
+
+UDPROS = 'UDPROS'
+
+## default maximum datagram size, as in roscpp
+DEFAULT_MAX_DATAGRAM_SIZE = 1500
+
+ROS_UDP_DATA0 = 0
+ROS_UDP_DATAN = 1
+ROS_UDP_PING = 2
+ROS_UDP_ERR = 3
+
+_HEADER = struct.Struct('<IBBH')
 
 def get_max_datagram_size():
-    #TODO
-    return 1024
+    return DEFAULT_MAX_DATAGRAM_SIZE
+
+def _encode_header(fields):
+    # UDPROS headers are sent without the length prefix of TCPROS headers
+    return rosgraph.network.encode_ros_handshake_header(fields)[4:]
+
+def _decode_header(data):
+    data = getattr(data, 'data', data) # xmlrpc Binary
+    return rosgraph.network.decode_ros_handshake_header(struct.pack('<I', len(data)) + data)
+
+def _create_socket():
+    if rosgraph.network.use_ipv6():
+        return socket.socket(socket.AF_INET6, socket.SOCK_DGRAM)
+    return socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
 
-class UDPROSHandler(rospy.transport.ProtocolHandler):
+class UDPROSHandler(rospy.impl.transport.ProtocolHandler):
     """
-    rospy protocol handler for UDPROS. Stores the datagram server if necessary.
+    rospy protocol handler for UDPROS. Subscriptions that asked for
+    UDPROS (see L{rospy.topics.Subscriber}) offer it first to their
+    publishers, with TCPROS as fallback.
     """
     
-    def __init__(self, port=0):
+    def __init__(self):
         """
         ctor
         """
-        self.port = port
-        self.buff_size = get_max_datagram_size()
-        
-    def init_server(self):
+        self.lock = threading.Lock()
+        # { (topic, pub_uri) : socket } sockets offered to publishers
+        self.pending = {}
+
+    def shutdown(self):
+        with self.lock:
+            for sock in self.pending.values():
+                sock.close()
+            self.pending.clear()
+
+    def get_topic_supported(self, resolved_name, pub_uri):
         """
-        Initialize and start the server thread, if not already initialized.
+        Offer UDPROS to pub_uri if the subscription asked for it: this
+        binds the socket the publisher will send to.
         """
-        if self.server is not None:
-            return
-        if rosgraph.network.use_ipv6():
-            s = socket.socket(socket.AF_INET6, socket.SOCK_DGRAM)
-        else:
-            s = socket.socket(socket.AF_INET, socket.SOCK_DGRAM) 
-        s.bind((rosgraph.network.get_bind_address(), self.port))
-        if self.port == 0:
-            self.port = s.getsockname()[1]
-        self.server = s
-        threading.start_new_thread(self.run, ())
-
-    def run(self):
-        buff_size = self.buff_size
+        sub = rospy.impl.registration.get_topic_manager().get_subscriber_impl(resolved_name)
+        if sub is None or not sub.udp:
+            return []
+        sock = _create_socket()
         try:
-            while not rospy.core.is_shutdown():
-                data = self.server.recvfrom(self.buff_size)
-                print("received packet")
-                #TODO
-        except:
-            #TODO: log
-            pass
+            sock.bind((rosgraph.network.get_bind_address(), 0))
+        except socket.error as e:
+            logwarn("cannot bind UDPROS socket for [%s]: %s", resolved_name, e)
+            sock.close()
+            return []
+        with self.lock:
+            old = self.pending.pop((resolved_name, pub_uri), None)
+            if old is not None:
+                old.close()
+            self.pending[(resolved_name, pub_uri)] = sock
+        header = TCPROSSub(resolved_name, sub.data_class).get_header_fields()
+        del header['tcp_nodelay']
+        return [[UDPROS, Binary(_encode_header(header)), rosgraph.network.get_host_name(),
+                 sock.getsockname()[1], get_max_datagram_size()]]
 
-    def shutdown(self):
-        if self.sock is not None:
-            self.sock.close()
+    def release_topic(self, resolved_name, pub_uri=None):
+        """
+        Close the sockets offered to pub_uri, or to all the publishers
+        of resolved_name, that the publisher did not select.
+        """
+        with self.lock:
+            keys = [k for k in self.pending if k[0] == resolved_name and pub_uri in (None, k[1])]
+            socks = [self.pending.pop(k) for k in keys]
+        for sock in socks:
+            sock.close()
 
-    def create_transport(self, topic_name, pub_uri, protocol_params):
+    def create_transport(self, resolved_name, pub_uri, protocol_params):
         """
         Connect to topic resolved_name on Publisher pub_uri using UDPROS.
         @param resolved_name str: resolved topic name
@@ -107,34 +176,49 @@ class UDPROSHandler(rospy.transport.ProtocolHandler):
         @return: code, message, debug
         @rtype: (int, str, int)
         """
-
-        #Validate protocol params = [UDPROS, address, port, headers]
-        if type(protocol_params) != list or len(protocol_params) != 4:
+        with self.lock:
+            sock = self.pending.pop((resolved_name, pub_uri), None)
+        #Validate protocol params = [UDPROS, address, port, connection_id, max_datagram_size, header]
+        if type(protocol_params) != list or len(protocol_params) != 6:
+            if sock is not None:
+                sock.close()
             return 0, "ERROR: invalid UDPROS parameters", 0
         if protocol_params[0] != UDPROS:
-            return 0, "INTERNAL ERROR: protocol id is not UDPROS: %s"%id, 0
-
-        #TODO: get connection_id and buffer size from params
-        id, dest_addr, dest_port, headers = protocol_params
+            if sock is not None:
+                sock.close()
+            return 0, "INTERNAL ERROR: protocol id is not UDPROS: %s"%protocol_params[0], 0
+        if sock is None:
+            return 0, "ERROR: UDPROS was not offered to [%s]"%pub_uri, 0
+        _, dest_addr, dest_port, connection_id, max_datagram_size, header = protocol_params
+        try:
+            header = _decode_header(header)
+        except Exception as e:
+            sock.close()
+            return 0, "ERROR: invalid UDPROS header: %s"%e, 0
 
-        self.init_server()
-        
-        #TODO: parse/validate headers
+        sub = rospy.impl.registration.get_topic_manager().get_subscriber_impl(resolved_name)
+        if sub is None:
+            sock.close()
+            return 0, "ERROR: no subscriber for [%s]"%resolved_name, 0
+        transport = UDPROSTransport(rospy.impl.transport.INBOUND, resolved_name, sock,
+                                    connection_id, max_datagram_size, header=header,
+                                    recv_data_class=sub.data_class, queue_size=sub.queue_size)
+        transport.set_endpoint_id(pub_uri)
+        transport.remote_endpoint = (dest_addr, dest_port)
 
-        sub = rospy.registration.get_topic_manager().get_subscriber_impl(topic_name)
-        # Create Transport
-        
-        # TODO: create just a single 'connection' instance to represent
-        # all UDP connections. 'connection' can take care of unifying
-        # publication if addresses are the same
-        transport = UDPTransport(protocol, topic_name, sub.receive_callback) 
-        
         # Attach connection to _SubscriberImpl
-        if sub.add_connection(transport): #pass udp connection to handler
-            return 1, "Connected topic[%s]. Transport impl[%s]"%(topic_name, transport.__class__.__name__), dest_port
+        if sub.add_connection(transport):
+            reactor = rospy.impl.reactor.get_reactor()
+            if reactor is not None:
+                transport.receive_reactor(sub.receive_callback, reactor)
+            else:
+                t = threading.Thread(name=resolved_name, target=transport.receive_loop, args=(sub.receive_callback,))
+                t.daemon = True
+                t.start()
+            return 1, "Connected topic[%s]. Transport impl[%s]"%(resolved_name, transport.__class__.__name__), dest_port
         else:
             transport.close()
-            return 0, "ERROR: Race condition failure: duplicate topic subscriber [%s] was created"%(topic_name), 0
+            return 0, "ERROR: Race condition failure: duplicate topic subscriber [%s] was created"%(resolved_name), 0
 
     def supports(self, protocol):
         """
@@ -147,11 +231,12 @@ class UDPROSHandler(rospy.transport.ProtocolHandler):
     
     def get_supported(self):
         """
-        Get supported protocols
+        Get supported protocols. UDPROS parameters are specific to
+        each connection, see L{get_topic_supported()}.
         """
-        return [[UDPROS]]
+        return []
         
-    def init_publisher(self, topic_name, protocol_params): 
+    def init_publisher(self, resolved_name, protocol_params):
         """
         Initialize this node to start publishing to a new UDP location.
         
@@ -161,127 +246,203 @@ class UDPROSHandler(rospy.transport.ProtocolHandler):
         @param protocol_params: requested protocol
           parameters. protocol[0] must be the string 'UDPROS'
         @type  protocol_params: [str, value*]
-        @return: (code, msg, [UDPROS, addr, port])
+        @return: (code, msg, [UDPROS, addr, port, connection_id, max_datagram_size, header])
         @rtype: (int, str, list)
         """
-
         if protocol_params[0] != UDPROS:
-            return 0, "Internal error: protocol does not match UDPROS: %s"%protocol, []
-        #TODO
+            return 0, "Internal error: protocol does not match UDPROS: %s"%protocol_params, []
+        if len(protocol_params) != 5:
+            return 0, "ERROR: invalid UDPROS parameters", []
         _, header, host, port, max_datagram_size = protocol_params
-        #TODO: connection_id, max_datagraph_size
-        return 1, "ready", [UDPROS]
-
-    def topic_connection_handler(self, sock, client_addr, header):
-        """
-        Process incoming topic connection. Reads in topic name from
-        handshake and creates the appropriate L{TCPROSPub} handler for the
-        connection.
-        @param sock: socket connection
-        @type sock: socket.socket
-        @param client_addr: client address
-        @type client_addr: (str, int)
-        @param header: key/value pairs from handshake header
-        @type header: dict
-        @return: error string or None 
-        @rtype: str
-        """
-        for required in ['topic', 'md5sum', 'callerid']:
+        try:
+            header = _decode_header(header)
+        except Exception as e:
+            return 0, "ERROR: invalid UDPROS header: %s"%e, []
+        for required in ['md5sum', 'callerid']:
             if not required in header:
-                return "Missing required '%s' field"%required
-        else:
-            resolved_topic_name = header['topic']
-            md5sum = header['md5sum']
-            tm = rospy.registration.get_topic_manager()
-            topic = tm.get_publisher_impl(resolved_topic_name)
-            if not topic:
-                return "[%s] is not a publisher of  [%s]. Topics are %s"%(rospy.names.get_caller_id(), resolved_topic_name, tm.get_publications())
-            elif md5sum != rospy.names.TOPIC_ANYTYPE and md5sum != topic.data_class._md5sum:
-
-                actual_type = topic.data_class._type
-
-                # check to see if subscriber sent 'type' header. If they did, check that
-                # types are same first as this provides a better debugging message
-                if 'type' in header:
-                    requested_type = header['type']
-                    if requested_type != actual_type:
-                        return "topic types do not match: [%s] vs. [%s]"%(requested_type, actual_type)
-                else:
-                    # defaults to actual type
-                    requested_type = actual_type
+                return 0, "Missing required '%s' field"%required, []
 
-                return "Client [%s] wants topic [%s] to have datatype/md5sum [%s/%s], but our version has [%s/%s] Dropping connection."%(header['callerid'], resolved_topic_name, requested_type, md5sum, actual_type, topic.data_class._md5sum)
-
-            else:
-                #TODO:POLLING if polling header is present, have to spin up receive loop as well
+        tm = rospy.impl.registration.get_topic_manager()
+        topic = tm.get_publisher_impl(resolved_name)
+        if not topic or topic.closed:
+            return 0, "[%s] is not a publisher of [%s]"%(rospy.names.get_caller_id(), resolved_name), []
+        md5sum = header['md5sum']
+        if md5sum != rospy.names.TOPIC_ANYTYPE and md5sum != topic.data_class._md5sum:
+            return 0, "Client [%s] wants topic [%s] to have md5sum [%s], but our version has [%s]"%(header['callerid'], resolved_name, md5sum, topic.data_class._md5sum), []
+        if max_datagram_size <= _HEADER.size:
+            return 0, "ERROR: invalid max datagram size %s"%max_datagram_size, []
 
-                # #1334: tcp_nodelay support from subscriber option
-                if 'tcp_nodelay' in header:
-                    tcp_nodelay = True if header['tcp_nodelay'].strip() == '1' else False
-                else:
-                    tcp_nodelay = self.tcp_nodelay_map.get(resolved_topic_name, False)
-
-                _configure_pub_socket(sock, tcp_nodelay)
-                protocol = TCPROSPub(resolved_topic_name, topic.data_class, is_latch=topic.is_latch, headers=topic.headers)
-                transport = TCPROSTransport(protocol, resolved_topic_name)
-                transport.set_socket(sock, header['callerid'])
-                transport.write_header()
-                topic.add_connection(transport)
-            
-    
+        sock = _create_socket()
+        try:
+            sock.connect((host, port))
+        except socket.error as e:
+            sock.close()
+            return 0, "ERROR: cannot connect UDPROS socket to %s:%s: %s"%(host, port, e), []
+        pub_header = TCPROSPub(resolved_name, topic.data_class, is_latch=topic.is_latch, headers=topic.headers).get_header_fields()
+        transport = UDPROSTransport(rospy.impl.transport.OUTBOUND, resolved_name, sock,
+                                    None, max_datagram_size, header=pub_header)
+        transport.set_endpoint_id(header['callerid'])
+        transport.remote_endpoint = (host, port)
+        topic.add_connection(transport)
+        return 1, "ready", [UDPROS, rosgraph.network.get_host_name(), transport.local_endpoint[1],
+                            transport.connection_id, max_datagram_size, Binary(_encode_header(pub_header))]
 
 ## UDPROS communication routines
-class UDPROSTransport(rospy.transport.Transport):
-    transport_type = 'UDPROS'
+class UDPROSTransport(rospy.impl.transport.Transport):
+    transport_type = UDPROS
     
-    def __init__(self, protocol, name, header):
+    def __init__(self, direction, name, sock, connection_id, max_datagram_size, header=None,
+                 recv_data_class=None, queue_size=None):
         """
         ctor
+        @param direction: INBOUND or OUTBOUND
+        @type  direction: str
         @param name: topic name    
-        @type  name: str:
-        @param protocol: protocol implementation    
-        @param protocol: UDPROSTransportProtocol 
-        @param header: handshake header if transport handshake header was
-        already read off of transport.
+        @type  name: str
+        @param sock: UDP socket, connected to the subscriber for
+        outbound connections
+        @type  sock: socket.socket
+        @param connection_id: connection ID, or None to use the
+        transport id (publishers)
+        @type  connection_id: int
+        @param max_datagram_size: maximum size of the datagrams (in bytes)
+        @type  max_datagram_size: int
+        @param header: connection header of the publisher
         @type  header: dict
+        @param recv_data_class: message class for deserializing inbound messages
+        @type  recv_data_class: Class
+        @param queue_size: maximum number of messages to deserialize
+        at a time
+        @type  queue_size: int
         @throws TransportInitError: if transport cannot be initialized according to arguments
         """
-        super(UDPROSTransport, self).__init__(protocol.direction, name=name)
+        super(UDPROSTransport, self).__init__(direction, name=name)
         if not name:
             raise TransportInitError("Unable to initialize transport: name is not set")
 
-        self.done = False
-        self.header = header
-            
-    def send_message(self, msg, seq):
-        """
-        Convenience routine for services to send a message across a
-        particular connection. NOTE: write_data is much more efficient
-        if same message is being sent to multiple connections. Not
-        threadsafe.
-        @param msg: message to send
-        @type  msg: Msg
-        @param seq: sequence number for message
-        @type  seq: int
-        @raise TransportException: if error occurred sending message
-        """
-        # this will call write_data(), so no need to keep track of stats
-        serialize_message(self.write_buff, seq, msg)
-        self.write_data(self.write_buff.getvalue())
-        self.write_buff.truncate(0)
-        self.write_buff.seek(0)
+        self.socket = sock
+        self.connection_id = connection_id if connection_id is not None else self.id
+        self.max_datagram_size = max_datagram_size
+        self.header = header or {}
+        self.callerid_pub = self.header.get('callerid', 'unknown')
+        self.is_latched = self.header.get('latching', '0') == '1'
+        self.latch = None
+        self.recv_data_class = recv_data_class
+        self.queue_size = queue_size
+        self.local_endpoint = sock.getsockname()[:2]
+        self._fileno = sock.fileno()
+
+        #STATS
+        # number of messages lost, from gaps in message IDs and incomplete messages
+        self.stat_drops = 0
+
+        # send state
+        self._message_id = 0
+        # receive state
+        self._last_message_id = None
+        self._blocks = None # datagrams of the message being reassembled
+        self._num_blocks = 0
+
+    def fileno(self):
+        return self._fileno
+
+    def set_endpoint_id(self, endpoint_id):
+        self.endpoint_id = endpoint_id
+
+    def get_transport_info(self):
+        return "%s connection on port %s to [%s:%s]" % (self.transport_type, self.local_endpoint[1], self.remote_endpoint[0], self.remote_endpoint[1])
 
     def write_data(self, data):
         """
-        Write raw data to transport
+        Write a serialized message, including its length prefix, in as
+        many datagrams as needed.
         @raise TransportInitialiationError: could not be initialized
         @raise TransportTerminated: no longer open for publishing
         """
-        # TODO
-        # - cut into packets
-        # write to address
-        pass
-    
+        if self.done or self.socket is None:
+            raise TransportTerminated("connection closed")
+        payload = self.max_datagram_size - _HEADER.size
+        size = len(data)
+        num_blocks = (size + payload - 1) // payload
+        if num_blocks > 0xffff:
+            logwarn("[%s]: message of %s bytes is too large for UDPROS, dropping it", self.name, size)
+            return False
+        message_id = self._message_id
+        self._message_id = (message_id + 1) & 0xff
+        view = memoryview(data)
+        try:
+            for block in range(num_blocks):
+                if block == 0:
+                    header = _HEADER.pack(self.connection_id, ROS_UDP_DATA0, message_id, num_blocks)
+                else:
+                    header = _HEADER.pack(self.connection_id, ROS_UDP_DATAN, message_id, block)
+                self.socket.send(header + view[block * payload:(block + 1) * payload].tobytes())
+        except socket.error as e:
+            if e.errno in (errno.EAGAIN, errno.EWOULDBLOCK, errno.ENOBUFS):
+                # datagrams may be lost anyway: the subscriber sees a gap
+                self.stat_drops += 1
+                return False
+            logdebug("[%s]: closing UDPROS connection to [%s]: %s", self.name, self.endpoint_id, e)
+            self.close()
+            raise TransportTerminated(str(e))
+        self.stat_bytes += size
+        self.stat_num_msg += 1
+        return True
+
+    def _receive_datagram(self, datagram, msg_queue):
+        """
+        Reassemble messages from one datagram.
+        """
+        if len(datagram) < _HEADER.size:
+            return
+        connection_id, op, message_id, block = _HEADER.unpack_from(datagram)
+        if connection_id != self.connection_id:
+            return
+        self.stat_bytes += len(datagram)
+        if op == ROS_UDP_DATA0:
+            if self._blocks is not None:
+                # the previous message is incomplete
+                self.stat_drops += 1
+            if self._last_message_id is not None:
+                self.stat_drops += (message_id - self._last_message_id - 1) & 0xff
+            self._last_message_id = message_id
+            self._blocks = [datagram[_HEADER.size:]]
+            self._num_blocks = block
+        elif op == ROS_UDP_DATAN:
+            if self._blocks is None or message_id != self._last_message_id:
+                return
+            if block != len(self._blocks):
+                # a datagram was lost
+                self.stat_drops += 1
+                self._blocks = None
+                return
+            self._blocks.append(datagram[_HEADER.size:])
+        else:
+            return
+        if len(self._blocks) >= self._num_blocks:
+            data = b''.join(self._blocks)
+            self._blocks = None
+            (size,) = struct.unpack_from('<I', data)
+            if size != len(data) - 4:
+                raise DeserializationError("UDPROS message of %s bytes has a length of %s"%(len(data) - 4, size))
+            msg_queue.append(data[4:])
+
+    def _deserialize(self, msg_queue):
+        if self.queue_size is not None:
+            msg_queue = msg_queue[-self.queue_size:]
+        msgs = []
+        try:
+            for data in msg_queue:
+                msgs.append(self.recv_data_class().deserialize(data))
+        except Exception as e:
+            raise DeserializationError("cannot deserialize: %s"%str(e))
+        self.stat_num_msg += len(msgs)
+        for m in msgs:
+            m._connection_header = self.header
+        if self.is_latched and msgs:
+            self.latch = msgs[-1]
+        return msgs
+
     def receive_once(self):
         """
         block until messages are read off of socket
@@ -289,21 +450,101 @@ class UDPROSTransport(rospy.transport.Transport):
         @rtype: [Msg]
         @raise TransportException: if unable to receive message due to error
         """
-        pass
+        msg_queue = []
+        while not msg_queue and not self.done and not is_shutdown():
+            try:
+                datagram = self.socket.recv(65536)
+            except socket.timeout:
+                continue
+            self._receive_datagram(datagram, msg_queue)
+        return self._deserialize(msg_queue)
+
+    def receive_available(self):
+        """
+        Read the datagrams available on the nonblocking socket.
+        @return: list of newly received messages, possibly empty
+        @rtype: [Msg]
+        """
+        msg_queue = []
+        while True:
+            try:
+                datagram = self.socket.recv(65536)
+            except socket.error as e:
+                if e.errno in (errno.EAGAIN, errno.EWOULDBLOCK):
+                    break
+                raise
+            self._receive_datagram(datagram, msg_queue)
+        return self._deserialize(msg_queue)
 
     ## Receive messages until shutdown
     ## @param self
-    ## @param msgs_callback fn([msg]): callback to invoke for new messages received    
+    ## @param msgs_callback fn([msg], connection): callback to invoke for new messages received    
     def receive_loop(self, msgs_callback):
-        pass
-    
+        # a timeout lets the loop notice that the connection was closed
+        self.socket.settimeout(1.0)
+        try:
+            while not self.done and not is_shutdown():
+                msgs = self.receive_once()
+                if msgs and not self.done and not is_shutdown():
+                    msgs_callback(msgs, self)
+        except DeserializationError as e:
+            rospyerr("[%s]: %s", self.name, e)
+        except Exception:
+            if not self.done and not is_shutdown():
+                rospyerr("[%s]: UDPROS receive failed:\n%s", self.name, traceback.format_exc())
+        finally:
+            self.close()
+
+    def receive_reactor(self, msgs_callback, reactor):
+        """
+        Receive messages on the I/O threads of reactor.
+        @param msgs_callback: callback to invoke for new messages received
+        @type  msgs_callback: fn([msg], connection)
+        @param reactor: reactor watching the socket
+        @type  reactor: L{rospy.impl.reactor.Reactor}
+        """
+        self.socket.setblocking(0)
+        receiver = _UDPROSReceiver(self, msgs_callback)
+        previous_callback = self.cleanup_cb
+        def cleanup_cb(transport):
+            reactor.unregister(receiver)
+            if previous_callback:
+                previous_callback(transport)
+        self.set_cleanup_callback(cleanup_cb)
+        reactor.register(receiver)
+
     ## close i/o and release resources
-    def close(super):
-        self(UDPROSTransport, self).close()
-        #TODO
-        self.done = True
-    
-_handler = UDPROSHandler()
+    def close(self):
+        if not self.done:
+            try:
+                if self.socket is not None:
+                    self.socket.close()
+            finally:
+                self.socket = None
+                super(UDPROSTransport, self).close()
+
+class _UDPROSReceiver(rospy.impl.reactor.ReactorHandler):
+    """
+    Reactor handler receiving the datagrams of a L{UDPROSTransport}.
+    """
+
+    def __init__(self, transport, msgs_callback):
+        self.transport = transport
+        self.msgs_callback = msgs_callback
+        self._fileno = transport.fileno()
+
+    def fileno(self):
+        return self._fileno
+
+    def handle_read(self):
+        transport = self.transport
+        if transport.done or is_shutdown():
+            raise TransportTerminated("connection closed")
+        msgs = transport.receive_available()
+        if msgs:
+            self.msgs_callback(msgs, transport)
 
-def get_handler():
-    return _handler
+    def handle_error(self, e):
+        if not isinstance(e, TransportTerminated):
+            rospyerr("[%s]: UDPROS receive failed: %s", self.transport.name, e)
+        self.transport.close()
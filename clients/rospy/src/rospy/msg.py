@@ -161,6 +161,109 @@ def serialize_message(b, seq, msg):
     b.write(struct.pack('<I', size))
     b.seek(end)
    
+class ReceiveBuffer(object):
+    """
+    Receive buffer for streams of length-prefixed messages.  Data is
+    received with recv_into() at the end of a preallocated bytearray,
+    complete messages are sliced out of it through a memoryview and
+    the buffer is only compacted or grown when there is not enough
+    room left for the next read.
+    """
+
+    def __init__(self, size=65536, data=b''):
+        """
+        @param size: initial capacity (in bytes)
+        @type  size: int
+        @param data: data already received
+        @type  data: bytes
+        """
+        self._buff = bytearray(max(size, len(data)))
+        self._buff[:len(data)] = data
+        self._start = 0
+        self._end = len(data)
+
+    def tell(self):
+        """
+        @return: number of bytes received and not yet consumed
+        @rtype: int
+        """
+        return self._end - self._start
+
+    def capacity(self):
+        """
+        @return: size of the underlying buffer
+        @rtype: int
+        """
+        return len(self._buff)
+
+    def recv_into(self, sock, size):
+        """
+        Receive up to size bytes from sock, or the rest of a message
+        whose length is already known if that is more.  The length
+        prefix is only a hint: reads grow at most by the size of the
+        buffer, so that the buffer grows as data is actually received.
+        @param sock: socket to read from
+        @type  sock: socket.socket
+        @param size: read size
+        @type  size: int
+        @return: number of bytes received, 0 if the connection was closed
+        @rtype: int
+        """
+        if self._end - self._start >= 4:
+            (msg_size,) = struct.unpack_from('<I', self._buff, self._start)
+            rest = msg_size + 4 - (self._end - self._start)
+            size = max(size, min(rest, len(self._buff)))
+        if len(self._buff) - self._end < size:
+            self._reserve(size)
+        n = sock.recv_into(memoryview(self._buff)[self._end:], size)
+        self._end += n
+        return n
+
+    def _reserve(self, size):
+        used = self._end - self._start
+        if len(self._buff) - used >= size:
+            # compact: move the partial message to the front
+            self._buff[:used] = self._buff[self._start:self._end]
+        else:
+            buff = bytearray(max(2 * len(self._buff), used + size))
+            buff[:used] = self._buff[self._start:self._end]
+            self._buff = buff
+        self._start = 0
+        self._end = used
+
+    def read_frames(self, max_frames=None, keep=None):
+        """
+        Consume the complete messages in the buffer.
+        @param max_frames: maximum number of messages to consume
+        @type  max_frames: int
+        @param keep: only return the last keep messages consumed
+        @type  keep: int
+        @return: serialized messages, without their length prefix
+        @rtype: [bytes]
+        """
+        buff = self._buff
+        frames = []
+        start = self._start
+        while self._end - start >= 4:
+            (size,) = struct.unpack_from('<I', buff, start)
+            if self._end - start - 4 < size:
+                break
+            frames.append((start + 4, size))
+            start += size + 4
+            if max_frames and len(frames) >= max_frames:
+                break
+        self._start = start
+        if keep is not None:
+            frames = frames[-keep:]
+
+        # genpy deserializers decode and keep slices of their input, so
+        # each message gets its own copy of its bytes
+        view = memoryview(buff)
+        frames = [view[offset:offset + size].tobytes() for offset, size in frames]
+        if self._start == self._end:
+            self._start = self._end = 0
+        return frames
+
 def deserialize_messages(b, msg_queue, data_class, queue_size=None, max_msgs=None, start=0):
     """
     Read all messages off the buffer 
@@ -180,6 +283,18 @@ def deserialize_messages(b, msg_queue, data_class, queue_size=None, max_msgs=Non
     @type  max_msgs: int
     @raise genpy.DeserializationError: if an error/exception occurs during deserialization
     """    
+    if isinstance(b, ReceiveBuffer):
+        try:
+            for q in b.read_frames(max_msgs, queue_size):
+                data = data_class()
+                msg_queue.append(data.deserialize(q))
+            if queue_size is not None:
+                del msg_queue[:-queue_size]
+        except Exception as e:
+            logging.getLogger('rospy.msg').error("cannot deserialize message: EXCEPTION %s", traceback.format_exc())
+            raise genpy.DeserializationError("cannot deserialize: %s"%str(e))
+        return
+
     try:
         pos = start
         btell = b.tell()
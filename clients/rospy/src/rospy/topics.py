@@ -64,8 +64,10 @@ create classes that are children of these implementations.
 """
 
 
+import copy
 import struct
 import select
+import collections
 try:
     from cStringIO import StringIO #Python 2.x
     python3 = 0
@@ -87,14 +89,18 @@ import traceback
 import rosgraph.names
 
 from rospy.core import *
+from rospy.executors import CallbackQueue, InlineExecutor, get_default_executor
 from rospy.exceptions import ROSSerializationException, TransportTerminated
 from rospy.msg import serialize_message, args_kwds_to_message
 
 from rospy.impl.statistics import SubscriberStatisticsLogger
 
 from rospy.impl.registration import get_topic_manager, set_topic_manager, Registration, get_registration_listeners
-from rospy.impl.tcpros import get_tcpros_handler, DEFAULT_BUFF_SIZE
-from rospy.impl.tcpros_pubsub import QueuedConnection
+from rospy.impl.tcpros import get_tcpros_handler, get_udpros_handler, DEFAULT_BUFF_SIZE
+from rospy.impl.tcpros_base import TCPROS
+from rospy.impl.intraprocess import INTRAPROCESS, create_intraprocess_connection, is_intraprocess_enabled
+from rospy.impl.reactor import get_reactor
+from rospy.impl.tcpros_pubsub import QueuedConnection, ReactorQueuedConnection, is_tcp_nodelay
 
 _logger = logging.getLogger('rospy.topics')
 
@@ -512,7 +518,9 @@ class Subscriber(Topic):
     the messages are of a given type.
     """
     def __init__(self, name, data_class, callback=None, callback_args=None,
-                 queue_size=None, buff_size=DEFAULT_BUFF_SIZE, tcp_nodelay=False):
+                 queue_size=None, buff_size=DEFAULT_BUFF_SIZE, tcp_nodelay=False, udp=False,
+                 executor=None, callback_queue_size=None, max_concurrency=1,
+                 batch_size=None, batch_latency=None):
         """
         Constructor.
 
@@ -558,6 +566,34 @@ class Subscriber(Topic):
           message data. Setting tcp_nodelay to True enables TCP_NODELAY
           for all subscribers in the same python process.
         @type  tcp_nodelay: bool
+        @param udp: if True, request UDPROS from publishers, falling
+          back to TCPROS for publishers that do not support it. UDPROS
+          has a lower latency but messages can be lost. Setting udp to
+          True enables UDPROS for all subscribers to this topic in the
+          same python process.
+        @type  udp: bool
+        @param executor: executor running the callbacks, see
+          L{rospy.executors}. Defaults to the executor set with
+          L{rospy.executors.set_default_executor()}, which runs
+          callbacks on the thread receiving the messages unless set.
+        @type  executor: L{rospy.executors.Executor}
+        @param callback_queue_size: maximum number of messages
+          waiting for the executor, the oldest message is dropped
+          when it is full. None for no limit (default).
+        @type  callback_queue_size: int
+        @param max_concurrency: maximum number of messages handled
+          by the executor at a time. Messages are handled in order
+          if it is 1 (default).
+        @type  max_concurrency: int
+        @param batch_size: if set, callback receives lists of up to
+          batch_size messages from the same publisher, i.e.
+          fn(msgs, connection_header) or fn(msgs, connection_header,
+          callback_args).
+        @type  batch_size: int
+        @param batch_latency: maximum time (in seconds) a message
+          waits for its batch to fill up. If None (default), batches
+          hold the messages received at once.
+        @type  batch_latency: float or L{Duration}
         @raise ROSException: if parameters are invalid
         """
         super(Subscriber, self).__init__(name, data_class, Registration.SUB)
@@ -570,11 +606,15 @@ class Subscriber(Topic):
         if buff_size != DEFAULT_BUFF_SIZE:
             self.impl.set_buff_size(buff_size)
 
+        self.batch_size = batch_size
         if callback is not None:
             # #1852
             # it's important that we call add_callback so that the
             # callback can be invoked with any latched messages
-            self.impl.add_callback(callback, callback_args)
+            if batch_size is not None:
+                self.impl.add_batch_callback(callback, callback_args, batch_size, batch_latency)
+            else:
+                self.impl.add_callback(callback, callback_args)
             # save arguments for unregister
             self.callback = callback
             self.callback_args = callback_args
@@ -583,6 +623,10 @@ class Subscriber(Topic):
             self.callback = self.callback_args = None            
         if tcp_nodelay:
             self.impl.set_tcp_nodelay(tcp_nodelay)        
+        if udp:
+            self.impl.set_udp(udp)
+        if executor is not None or callback_queue_size is not None or max_concurrency != 1:
+            self.impl.set_executor(executor or get_default_executor(), callback_queue_size, max_concurrency)
 
     def unregister(self):
         """
@@ -593,10 +637,164 @@ class Subscriber(Topic):
             # It's possible to have a Subscriber instance with no
             # associated callback
             if self.callback is not None:
-                self.impl.remove_callback(self.callback, self.callback_args)
+                if self.batch_size is not None:
+                    self.impl.remove_batch_callback(self.callback, self.callback_args)
+                else:
+                    self.impl.remove_callback(self.callback, self.callback_args)
             self.callback = self.callback_args = None
             super(Subscriber, self).unregister()
 
+## batch of messages waiting for the executor of a subscription
+_Batch = collections.namedtuple('_Batch', ['callback', 'msgs', 'header'])
+
+class _BatchCallback(object):
+    """
+    Callback receiving the messages of a subscription in batches.
+    Messages are batched per connection and a batch is delivered when
+    it is full, or when its first message has waited batch_latency.
+    Batches are delivered in order, outside of the lock, by one thread
+    at a time: threads finding another thread delivering just queue
+    their batches, so a slow callback does not block the receiving
+    threads of other connections.
+    """
+
+    def __init__(self, impl, cb, cb_args, batch_size, batch_latency=None):
+        """
+        ctor.
+        @param impl: subscription
+        @type  impl: L{_SubscriberImpl}
+        @param cb: callback function, fn(msgs, header[, cb_args])
+        @type  cb: fn([msg], dict, cb_args)
+        @param batch_size: maximum number of messages in a batch
+        @type  batch_size: int
+        @param batch_latency: maximum time (in seconds) a message
+        waits for its batch to fill up, or None to deliver the messages
+        received at once
+        @type  batch_latency: float
+        @raise ROSException: if parameters are invalid
+        """
+        if type(batch_size) != int or batch_size < 1:
+            raise ROSException("batch size must be a positive integer")
+        if batch_latency is not None and batch_latency < 0:
+            raise ROSException("batch latency may not be negative")
+        self.impl = impl
+        self.cb = cb
+        self.cb_args = cb_args
+        self.batch_size = batch_size
+        self.batch_latency = batch_latency or None
+        # { connection : (msgs, deadline) }
+        self._pending = {}
+        # [(msgs, header)] batches waiting to be delivered
+        self._ready = collections.deque()
+        self._delivering = False
+        self._cond = threading.Condition()
+        self._thread = None
+        self.closed = False
+
+    def add(self, msgs, connection):
+        """
+        Add messages received on connection, delivering the full batches.
+        """
+        with self._cond:
+            if self.closed:
+                return
+            batch, deadline = self._pending.pop(connection, ([], None))
+            batch.extend(msgs)
+            header = getattr(connection, 'header', None) or {}
+            flushed = False
+            while len(batch) >= self.batch_size:
+                self._ready.append((batch[:self.batch_size], header))
+                del batch[:self.batch_size]
+                flushed = True
+            if batch and self.batch_latency is None:
+                self._ready.append((batch, header))
+            elif batch:
+                # the remaining messages start a new batch
+                if flushed or deadline is None:
+                    deadline = time.time() + self.batch_latency
+                self._pending[connection] = (batch, deadline)
+                self._start()
+            deliver = self._claim_delivery()
+            self._cond.notify()
+        if deliver:
+            self._deliver()
+
+    def _claim_delivery(self):
+        # called with _cond held
+        if self._ready and not self._delivering:
+            self._delivering = True
+            return True
+        return False
+
+    def _deliver(self):
+        """
+        Deliver the ready batches, until there are none left.
+        """
+        try:
+            while True:
+                with self._cond:
+                    if not self._ready or self.closed:
+                        self._delivering = False
+                        return
+                    batch, header = self._ready.popleft()
+                self.impl._dispatch_batch(self, batch, header)
+        except:
+            with self._cond:
+                self._delivering = False
+            raise
+
+    def _start(self):
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._flush_loop, name='%s-batch'%self.impl.resolved_name)
+            self._thread.daemon = True
+            self._thread.start()
+
+    def _flush_loop(self):
+        while True:
+            with self._cond:
+                if self.closed or is_shutdown():
+                    return
+                now = time.time()
+                for connection, (batch, deadline) in list(self._pending.items()):
+                    if deadline <= now:
+                        del self._pending[connection]
+                        self._ready.append((batch, getattr(connection, 'header', None) or {}))
+                deliver = self._claim_delivery()
+                if not deliver:
+                    if self._pending:
+                        timeout = min(deadline for _, deadline in self._pending.values()) - now
+                    else:
+                        timeout = 1.
+                    self._cond.wait(max(timeout, 0.001))
+            if deliver:
+                self._deliver()
+
+    def invoke(self, msgs, header):
+        """
+        Invoke the callback on a batch. Traps and logs any exceptions
+        raised by the callback.
+        """
+        try:
+            if self.cb_args is not None:
+                self.cb(msgs, header, self.cb_args)
+            else:
+                self.cb(msgs, header)
+        except Exception as e:
+            if not is_shutdown():
+                logerr("bad callback: %s\n%s"%(self.cb, traceback.format_exc()))
+            else:
+                _logger.warn("during shutdown, bad callback: %s\n%s"%(self.cb, traceback.format_exc()))
+
+    def close(self):
+        """
+        Drop the pending messages and stop the flush thread.
+        """
+        with self._cond:
+            self.closed = True
+            self._pending.clear()
+            self._ready.clear()
+            self._cond.notify()
+
 class _SubscriberImpl(_TopicImpl):
     """
     Underlying L{_TopicImpl} implementation for subscriptions.
@@ -614,9 +812,15 @@ class _SubscriberImpl(_TopicImpl):
         # under lock. This is a list of 2-tuples (fn, args), where
         # args are additional arguments for the callback, or None
         self.callbacks = [] 
+        # L{_BatchCallback}s, modified like callbacks
+        self.batch_callbacks = []
         self.queue_size = None
         self.buff_size = DEFAULT_BUFF_SIZE
         self.tcp_nodelay = False
+        self.udp = False
+        # messages waiting for the executor, None to run callbacks inline
+        self.callback_queue = None
+        self.set_executor(get_default_executor())
         self.statistics_logger = SubscriberStatisticsLogger(self) \
             if SubscriberStatisticsLogger.is_enabled() \
             else None
@@ -627,9 +831,16 @@ class _SubscriberImpl(_TopicImpl):
         if self.callbacks:
             del self.callbacks[:]
             self.callbacks = None
+        if self.callback_queue is not None:
+            self.callback_queue.close()
+        for b in self.batch_callbacks:
+            b.close()
+        self.batch_callbacks = []
         if self.statistics_logger:
             self.statistics_logger.shutdown()
             self.statistics_logger = None
+        if self.udp:
+            get_udpros_handler().release_topic(self.resolved_name)
         
     def set_tcp_nodelay(self, tcp_nodelay):
         """
@@ -638,6 +849,36 @@ class _SubscriberImpl(_TopicImpl):
         supports it.
         """
         self.tcp_nodelay = tcp_nodelay
+
+    def set_udp(self, udp):
+        """
+        Request UDPROS for future topic connections, if the publisher
+        supports it.
+        """
+        self.udp = udp
+
+    def set_executor(self, executor, queue_size=None, concurrency=1):
+        """
+        Set the executor running the callbacks of this subscription.
+        @param executor: callback executor
+        @type  executor: L{rospy.executors.Executor}
+        @param queue_size: maximum number of messages waiting for the
+        executor, or None for no limit
+        @type  queue_size: int
+        @param concurrency: maximum number of messages handled at a time
+        @type  concurrency: int
+        @raise ROSException: if parameters are invalid
+        """
+        if isinstance(executor, InlineExecutor) and queue_size is None and concurrency == 1:
+            callback_queue = None
+        else:
+            try:
+                callback_queue = CallbackQueue(executor, self._deliver, queue_size, concurrency)
+            except ValueError as e:
+                raise ROSException(str(e))
+        old, self.callback_queue = self.callback_queue, callback_queue
+        if old is not None:
+            old.close()
         
     def set_queue_size(self, queue_size):
         """
@@ -680,9 +921,9 @@ class _SubscriberImpl(_TopicImpl):
         """
         # save reference to avoid locking
         conn = self.connections
-        #for now drop estimate is -1
+        # only UDPROS connections estimate drops, -1 otherwise
         stats = (self.resolved_name, 
-                 [(c.id, c.stat_bytes, c.stat_num_msg, -1, not c.done)
+                 [(c.id, c.stat_bytes, c.stat_num_msg, getattr(c, 'stat_drops', -1), not c.done)
                   for c in conn] )
         return stats
 
@@ -733,6 +974,69 @@ class _SubscriberImpl(_TopicImpl):
         if not matches:
             raise KeyError("no matching cb")
 
+    def add_batch_callback(self, cb, cb_args, batch_size, batch_latency=None):
+        """
+        Register a callback to be invoked with batches of the messages
+        received from the same publisher.
+        @param cb: callback function to invoke with the list of
+          messages and the connection header of the publisher,
+          i.e. fn(msgs, header). If callback args is set, they will be
+          passed in as the third argument.
+        @type  cb: fn([msg], dict, cb_args)
+        @param cb_cargs: additional arguments to pass to callback
+        @type  cb_cargs: Any
+        @param batch_size: maximum number of messages in a batch
+        @type  batch_size: int
+        @param batch_latency: maximum time (in seconds) a message
+          waits for its batch to fill up, or None to deliver the
+          messages received at once
+        @type  batch_latency: float or L{Duration}
+        @raise ROSException: if parameters are invalid
+        """
+        if self.closed:
+            raise ROSException("subscriber [%s] has been closed"%(self.resolved_name))
+        if isinstance(batch_latency, genpy.Duration):
+            batch_latency = batch_latency.to_sec()
+        batch = _BatchCallback(self, cb, cb_args, batch_size, batch_latency)
+        with self.c_lock:
+            self.batch_callbacks = self.batch_callbacks + [batch]
+
+        # #1852: invoke callback with any latched messages
+        for c in self.connections:
+            if c.latch is not None:
+                batch.invoke([c.latch], getattr(c, 'header', None) or {})
+
+    def remove_batch_callback(self, cb, cb_args):
+        """
+        Unregister a batch callback.
+        @param cb: callback function
+        @type  cb: fn([msg], dict, cb_args)
+        @param cb_cargs: additional arguments associated with callback
+        @type  cb_cargs: Any
+        @raise KeyError: if no matching callback
+        """
+        if self.closed:
+            return
+        with self.c_lock:
+            matches = [x for x in self.batch_callbacks if x.cb == cb and x.cb_args == cb_args]
+            if matches:
+                new_callbacks = self.batch_callbacks[:]
+                new_callbacks.remove(matches[0])
+                self.batch_callbacks = new_callbacks
+        if not matches:
+            raise KeyError("no matching cb")
+        matches[0].close()
+
+    def _dispatch_batch(self, batch_callback, msgs, header):
+        """
+        Invoke batch_callback on msgs, on the executor of this subscription.
+        """
+        callback_queue = self.callback_queue
+        if callback_queue is not None:
+            callback_queue.put(_Batch(batch_callback, msgs, header))
+        else:
+            batch_callback.invoke(msgs, header)
+
     def _invoke_callback(self, msg, cb, cb_args):
         """
         Invoke callback on msg. Traps and logs any exceptions raise by callback
@@ -762,11 +1066,30 @@ class _SubscriberImpl(_TopicImpl):
         """
         # save reference to avoid lock
         callbacks = self.callbacks
+        callback_queue = self.callback_queue
         for msg in msgs:
             if self.statistics_logger:
                 self.statistics_logger.callback(msg, connection.callerid_pub, connection.stat_bytes)
+            if not callbacks:
+                continue
+            if callback_queue is not None:
+                callback_queue.put(msg)
+                continue
             for cb, cb_args in callbacks:
                 self._invoke_callback(msg, cb, cb_args)
+        for batch_callback in self.batch_callbacks:
+            batch_callback.add(msgs, connection)
+
+    def _deliver(self, msg):
+        """
+        Invoke the callbacks on msg, or a batch callback on its
+        batch, on the executor of this subscription.
+        """
+        if isinstance(msg, _Batch):
+            msg.callback.invoke(msg.msgs, msg.header)
+            return
+        for cb, cb_args in self.callbacks or ():
+            self._invoke_callback(msg, cb, cb_args)
 
 class SubscribeListener(object):
     """
@@ -809,7 +1132,8 @@ class Publisher(Topic):
     Class for registering as a publisher of a ROS topic.
     """
 
-    def __init__(self, name, data_class, subscriber_listener=None, tcp_nodelay=False, latch=False, headers=None, queue_size=None):
+    def __init__(self, name, data_class, subscriber_listener=None, tcp_nodelay=False, latch=False, headers=None, queue_size=None,
+                 coalesce_window=None):
         """
         Constructor
         @param name: resource name of topic, e.g. 'laser'. 
@@ -837,6 +1161,12 @@ class Publisher(Topic):
         publishing will happen synchronously and a warning message
         will be printed.
         @type  queue_size: int
+        @param coalesce_window: If set, messages to subscribers without
+        TCP_NODELAY are held back up to coalesce_window seconds so
+        that bursts of small messages are sent with a single system
+        call. Publishing is then asynchronous, with an infinite queue
+        if queue_size is None.
+        @type  coalesce_window: float
         @raise ROSException: if parameters are invalid     
         """
         super(Publisher, self).__init__(name, data_class, Registration.PUB)
@@ -849,9 +1179,11 @@ class Publisher(Topic):
             self.impl.enable_latch()
         if headers:
             self.impl.add_headers(headers)
+        if coalesce_window is not None:
+            self.impl.set_coalesce_window(coalesce_window)
         if queue_size is not None:
             self.impl.set_queue_size(queue_size)
-        else:
+        elif coalesce_window is None:
             import warnings
             warnings.warn("The publisher should be created with an explicit keyword argument 'queue_size'. "
                 "Please see http://wiki.ros.org/rospy/Overview/Publishers%20and%20Subscribers for more information.", SyntaxWarning, stacklevel=2)
@@ -917,6 +1249,9 @@ class _PublisherImpl(_TopicImpl):
         # maximum queue size for publishing messages
         self.queue_size = None
 
+        # time (in seconds) messages are held back to be sent with later ones
+        self.coalesce_window = None
+
         #STATS
         self.message_data_sent = 0
 
@@ -951,6 +1286,18 @@ class _PublisherImpl(_TopicImpl):
     def set_queue_size(self, queue_size):
         self.queue_size = queue_size
 
+    def set_coalesce_window(self, coalesce_window):
+        """
+        Set the coalescing window of future connections without
+        TCP_NODELAY.
+        @param coalesce_window: time (in seconds), or None to disable
+        @type  coalesce_window: float
+        @raise ROSException: if coalesce_window is negative
+        """
+        if coalesce_window is not None and coalesce_window < 0:
+            raise ROSException("coalesce window may not be negative")
+        self.coalesce_window = coalesce_window
+
     def get_stats(self): # STATS
         """
         Get the stats for this topic publisher
@@ -993,8 +1340,17 @@ class _PublisherImpl(_TopicImpl):
         @return: True if connection was added
         @rtype: bool
         """
-        if self.queue_size is not None:
-            c = QueuedConnection(c, self.queue_size)
+        coalesce_window = self.coalesce_window
+        if coalesce_window is not None and (c.transport_type != TCPROS or is_tcp_nodelay(c.socket)):
+            coalesce_window = None
+        if coalesce_window is not None:
+            c = QueuedConnection(c, self.queue_size or 0, coalesce_window)
+        elif self.queue_size is not None and c.transport_type != INTRAPROCESS:
+            reactor = get_reactor()
+            if reactor is not None and c.transport_type == TCPROS:
+                c = ReactorQueuedConnection(c, self.queue_size, reactor)
+            else:
+                c = QueuedConnection(c, self.queue_size)
         super(_PublisherImpl, self).add_connection(c)
         def publish_single(data):
             self.publish(data, connection_override=c)
@@ -1055,6 +1411,12 @@ class _PublisherImpl(_TopicImpl):
         else:
             conns = [connection_override]
 
+        # intra-process connections take a copy of the message, which
+        # is only serialized for the other connections
+        local_conns = [c for c in conns if c.transport_type == INTRAPROCESS]
+        if local_conns:
+            conns = [c for c in conns if c.transport_type != INTRAPROCESS]
+
         # #2128 test our buffer. I don't know how this got closed in
         # that case, but we can at least diagnose the problem.
         b = self.buff
@@ -1063,11 +1425,31 @@ class _PublisherImpl(_TopicImpl):
 
             # serialize the message
             self.seq += 1 #count messages published to the topic
-            serialize_message(b, self.seq, message)
+            if conns:
+                serialize_message(b, self.seq, message)
+            elif getattr(message.__class__, "_has_header", False):
+                message.header.seq = self.seq
 
-            # send the buffer to all connections
             err_con = []
-            data = b.getvalue()
+            if local_conns:
+                # the subscribers receive the message later, on their
+                # delivery threads: the publisher may reuse its instance
+                local_message = copy.deepcopy(message)
+            for c in local_conns:
+                try:
+                    c.write_message(local_message)
+                except TransportTerminated as e:
+                    err_con.append(c)
+
+            # send the buffer to all connections
+            if python3 == 0:
+                data = b.getvalue()
+            elif conns:
+                # hand out the buffer itself rather than a copy: as the
+                # connections can queue it, the next message is
+                # serialized into a new buffer
+                data = b.getbuffer()
+                self.buff = BytesIO()
 
             for c in conns:
                 try:
@@ -1083,8 +1465,9 @@ class _PublisherImpl(_TopicImpl):
 
             # reset the buffer and update stats
             self.message_data_sent += b.tell() #STATS
-            b.seek(0)
-            b.truncate(0)
+            if b is self.buff:
+                b.seek(0)
+                b.truncate(0)
             
         except ValueError:
             # operations on self.buff can fail if topic is closed
@@ -1307,6 +1690,34 @@ class _TopicManager(object):
                 del impl
                 _logger.debug("... done deleting topic %s", resolved_name)
                 
+    def connect_intraprocess(self, resolved_name, pub_uri):
+        """
+        Connect the subscription to resolved_name to the publication of
+        the same topic in this process, if there is one, with the
+        intra-process transport.
+        @param resolved_name: resolved topic name
+        @type  resolved_name: str
+        @param pub_uri: XML-RPC URI of this node
+        @type  pub_uri: str
+        @return: subscriber end of the connection, or None if the
+        topic has to be connected with another transport
+        @rtype: L{Transport}
+        """
+        if not is_intraprocess_enabled():
+            return None
+        with self.lock:
+            pub = self.pubs.get(resolved_name, None)
+            sub = self.subs.get(resolved_name, None)
+        # the subscriber callbacks need instances of their own message
+        # class, e.g. AnyMsg subscriptions need the serialized data
+        if pub is None or sub is None or pub.closed or sub.closed or \
+                pub.data_class is not sub.data_class:
+            return None
+        sub_conn, pub_conn = create_intraprocess_connection(pub, sub, pub_uri)
+        sub.add_connection(sub_conn)
+        pub.add_connection(pub_conn)
+        return sub_conn
+
     def get_publisher_impl(self, resolved_name):
         """
         @param resolved_name: resolved topic name
@@ -33,6 +33,7 @@
 #
 # test_bag.py
 
+import binascii
 import hashlib
 import heapq
 import os
@@ -378,6 +379,286 @@ class TestRosbag(unittest.TestCase):
             self.assertLess(info.compressed, 1050)
             self.assertGreater(info.compressed, 850)
         
+    def test_compression_codecs(self):
+        fn = '/tmp/test_compression_codecs.bag'
+
+        for compression in rosbag.get_compressions():
+            codec = rosbag.get_codec(compression) if compression != rosbag.Compression.NONE else None
+            levels = [None] if codec is None or codec.levels is None else [None, codec.levels[0], codec.levels[1]]
+            for level in levels:
+                with rosbag.Bag(fn, 'w', compression=compression, compression_level=level, chunk_threshold=1024) as b:
+                    for i in range(1000):
+                        b.write('/ints', Int32(data=i), genpy.Time.from_sec(i + 1))
+
+                with rosbag.Bag(fn) as b:
+                    self.assertEqual(b.get_compression_info().compression, compression)
+                    self.assertEqual([msg.data for _, msg, _ in b.read_messages()], list(range(1000)))
+
+                # Reindexing decompresses through the codec registry too
+                with rosbag.Bag(fn, 'a', allow_unindexed=True) as b:
+                    for _ in b.reindex():
+                        pass
+
+    def test_invalid_compression_level_fails(self):
+        fn = '/tmp/test_invalid_compression_level_fails.bag'
+
+        self.assertRaises(ValueError, rosbag.Bag, fn, 'w', compression=rosbag.Compression.BZ2, compression_level=10)
+        self.assertRaises(ValueError, rosbag.Bag, fn, 'w', compression=rosbag.Compression.NONE, compression_level=1)
+        with rosbag.Bag(fn, 'w', compression=rosbag.Compression.ZLIB) as b:
+            b.compression_level = 9
+            self.assertRaises(ValueError, setattr, b, 'compression_level', 10)
+            # Changing the compression resets the level
+            b.compression = rosbag.Compression.BZ2
+            self.assertEqual(b.compression_level, None)
+
+    def test_register_codec(self):
+        class XorCodec(rosbag.Codec):
+            name = 'test_xor'
+
+            def decompress(self, data):
+                return bytes(bytearray(c ^ 0x55 for c in bytearray(data)))
+
+            def create_compressor(self, level=None):
+                codec = self
+                class Compressor(object):
+                    def compress(self, data):
+                        return codec.decompress(data)
+                    def flush(self):
+                        return b''
+                return Compressor()
+
+        fn = '/tmp/test_register_codec.bag'
+        rosbag.register_codec(XorCodec())
+        try:
+            with rosbag.Bag(fn, 'w', compression='test_xor') as b:
+                for i in range(10):
+                    b.write('/ints', Int32(data=i), genpy.Time.from_sec(i + 1))
+            with rosbag.Bag(fn) as b:
+                self.assertEqual([msg.data for _, msg, _ in b.read_messages()], list(range(10)))
+        finally:
+            del bag._codecs['test_xor']
+
+        with rosbag.Bag(fn) as b:
+            self.assertRaises(rosbag.ROSBagException, lambda: list(b.read_messages()))
+
+    def test_copy_chunks(self):
+        inbag_fn = '/tmp/test_copy_chunks_in.bag'
+        outbag_fn = '/tmp/test_copy_chunks_out.bag'
+
+        with rosbag.Bag(inbag_fn, 'w', compression=rosbag.Compression.BZ2, chunk_threshold=1024) as b:
+            for i in range(1000):
+                b.write('/ints%d' % (i % 3), Int32(data=i), genpy.Time.from_sec(i + 1))
+
+        with rosbag.Bag(inbag_fn) as inbag:
+            with rosbag.Bag(outbag_fn, 'w', compression=rosbag.Compression.ZLIB) as outbag:
+                progress = []
+                bag._copy_chunks(inbag, outbag, workers=3, progress=progress.append)
+            self.assertEqual(progress[-1], inbag._uncompressed_size)
+
+            with rosbag.Bag(outbag_fn) as outbag:
+                self.assertEqual(outbag.get_compression_info().compression, rosbag.Compression.ZLIB)
+                self.assertEqual(len(outbag._chunks), len(inbag._chunks))
+                for topic in ['/ints0', '/ints1', '/ints2']:
+                    self.assertEqual([(m.message.data, m.timestamp) for m in outbag.read_messages(topic)],
+                                     [(m.message.data, m.timestamp) for m in inbag.read_messages(topic)])
+
+    def test_encrypted_chunks(self):
+        from rosbag import rosbag_main
+
+        class FakeGPGResult(object):
+            ok = True
+            status = 'ok'
+            def __init__(self, data):
+                self.data = data
+            def __str__(self):
+                return 'encrypted:' + binascii.hexlify(self.data).decode()
+
+        class FakeGPG(object):
+            # stands in for gnupg.GPG, "encrypting" the symmetric key by hex encoding it
+            def list_keys(self, secret=False):
+                return [{'uids': ['Test User <test@example.com>']}]
+            def encrypt(self, data, recipients, always_trust=False):
+                return FakeGPGResult(data)
+            def decrypt(self, data, passphrase=None):
+                if isinstance(data, bytes):
+                    data = data.decode()
+                return FakeGPGResult(binascii.unhexlify(data[len('encrypted:'):]))
+
+        class FakeGnupg(object):
+            GPG = FakeGPG
+
+        aes = 'rosbag/AesCbcEncryptor'
+        fn = '/tmp/test_encrypted_chunks.bag'
+        copy_fn = '/tmp/test_encrypted_chunks_copy.bag'
+        plain_fn = '/tmp/test_encrypted_chunks_plain.bag'
+        main_fn = '/tmp/test_encrypted_chunks_main.bag'
+
+        def messages(b):
+            return [(topic, msg.data, t) for topic, msg, t in b.read_messages()]
+
+        gnupg = bag.gnupg
+        bag.gnupg = FakeGnupg()
+        try:
+            # chunks are assembled in memory, compressed, then encrypted
+            with rosbag.Bag(fn, 'w', compression=rosbag.Compression.BZ2, chunk_threshold=1024) as b:
+                b.set_encryptor(aes, '*')
+                self.assertTrue(b._encryptor.encrypts_chunks)
+                for i in range(500):
+                    b.write('/ints%d' % (i % 3), Int32(data=i), genpy.Time.from_sec(i + 1))
+                # the initialization vector precedes the padded cipher text
+                encrypted = b._encryptor.encrypt_chunk(b'chunk')
+                self.assertEqual(2 * bag.AES.block_size, len(encrypted))
+                self.assertEqual(b'chunk', b._encryptor.decrypt_chunk(encrypted))
+
+            with rosbag.Bag(fn) as inbag:
+                self.assertEqual('Test User', inbag._encryptor._gpg_key_user)
+                self.assertTrue(len(inbag._chunks) > 1)
+                expected = [('/ints%d' % (i % 3), i, genpy.Time.from_sec(i + 1)) for i in range(500)]
+                self.assertEqual(expected, messages(inbag))
+
+                # chunks are decrypted and encrypted again with a new key
+                with rosbag.Bag(copy_fn, 'w', compression=rosbag.Compression.ZLIB) as outbag:
+                    outbag.set_encryptor(aes, 'Test User')
+                    bag._copy_chunks(inbag, outbag, workers=3)
+                # or written in the clear
+                with rosbag.Bag(plain_fn, 'w') as outbag:
+                    bag._copy_chunks(inbag, outbag, workers=2)
+
+            with rosbag.Bag(copy_fn) as b:
+                self.assertEqual(aes, b._encryptor.NAME)
+                self.assertEqual(b.get_compression_info().compression, rosbag.Compression.ZLIB)
+                self.assertEqual(expected, messages(b))
+            with rosbag.Bag(plain_fn) as b:
+                self.assertFalse(b._encryptor.encrypts_chunks)
+                self.assertEqual(expected, messages(b))
+
+            # rosbag encrypt re-encrypts the chunks in Python
+            with rosbag.Bag(main_fn, 'w') as outbag:
+                rosbag_main.change_encryption_op(plain_fn, outbag, aes, 'Test User', rosbag.Compression.BZ2, True, 2)
+            with rosbag.Bag(main_fn) as b:
+                self.assertEqual(aes, b._encryptor.NAME)
+                self.assertEqual(expected, messages(b))
+        finally:
+            bag.gnupg = gnupg
+
+    def test_get_topic_sizes(self):
+        fn = '/tmp/test_get_topic_sizes.bag'
+
+        expected = {'/a': 0, '/b': 0}
+        with rosbag.Bag(fn, 'w', compression=rosbag.Compression.ZLIB, chunk_threshold=1024) as b:
+            for i in range(500):
+                topic = '/a' if i % 3 else '/b'
+                data = 'x' * (i % 50)
+                b.write(topic, String(data=data), genpy.Time.from_sec(i + 1))
+                expected[topic] += 4 + len(data)
+
+        with rosbag.Bag(fn) as b:
+            self.assertEqual(b.get_topic_sizes(), expected)
+            self.assertEqual(b.get_topic_sizes('/b'), {'/b': expected['/b']})
+            self.assertEqual(b.get_topic_sizes(['/a', '/missing']), {'/a': expected['/a']})
+
+            # Bags written without sizes in their index are scanned
+            for chunk_info in b._chunks:
+                chunk_info.connection_bytes = {}
+            self.assertEqual(b.get_topic_sizes(), expected)
+
+        # Reindexing recovers the sizes
+        with rosbag.Bag(fn, 'a', allow_unindexed=True) as b:
+            b._clear_index()
+            for _ in b._reader.reindex():
+                pass
+            for chunk_info in b._chunks:
+                self.assertEqual(set(chunk_info.connection_bytes), set(chunk_info.connection_counts))
+
+        with rosbag.Bag(fn) as b:
+            self.assertEqual(b.get_topic_sizes(), expected)
+
+    def test_cursor(self):
+        fn = '/tmp/test_cursor.bag'
+
+        with rosbag.Bag(fn, 'w', chunk_threshold=256) as b:
+            for i in range(300):
+                # Messages on the two topics share timestamps
+                b.write('/ints%d' % (i % 2), Int32(data=i), genpy.Time.from_sec(1 + i // 2))
+
+        with rosbag.Bag(fn) as b:
+            expected = [(m.topic, m.message.data, m.timestamp) for m in b.read_messages()]
+
+            cursor = b.cursor()
+            self.assertEqual(cursor.topics, ['/ints0', '/ints1'])
+            self.assertEqual(cursor.prev(), None)
+
+            forward = []
+            while cursor.peek() is not None:
+                entry = cursor.peek()
+                m = cursor.next()
+                self.assertEqual((entry.topic, entry.timestamp, entry.datatype), (m.topic, m.timestamp, 'std_msgs/Int32'))
+                forward.append((m.topic, m.message.data, m.timestamp))
+            self.assertEqual(sorted(forward, key=lambda m: m[1]), expected)
+            self.assertEqual(cursor.next(), None)
+
+            cursor.seek_end()
+            backward = []
+            while True:
+                m = cursor.prev()
+                if m is None:
+                    break
+                backward.append((m.topic, m.message.data, m.timestamp))
+            self.assertEqual(backward, list(reversed(forward)))
+
+            # Seek and step back and forth
+            cursor.seek(50.0)
+            self.assertEqual(cursor.peek_prev().timestamp, genpy.Time.from_sec(49))
+            m1 = cursor.next()
+            m2 = cursor.next()
+            self.assertEqual((m1.timestamp, m2.timestamp), (genpy.Time.from_sec(50), genpy.Time.from_sec(50)))
+            self.assertNotEqual(m1.topic, m2.topic)
+            self.assertEqual(cursor.prev(), m1)
+            self.assertEqual(cursor.next(), m2)
+
+            # Step on a subset of the topics
+            cursor.seek(genpy.Time.from_sec(10))
+            self.assertEqual([cursor.next('/ints1').message.data for _ in range(3)], [19, 21, 23])
+            self.assertEqual(cursor.prev('/ints0').message.data, 22)
+
+            raw_cursor = b.cursor('/ints0', raw=True)
+            raw_cursor.seek(100)
+            msg = raw_cursor.next().message
+            self.assertEqual(msg[0], 'std_msgs/Int32')
+            self.assertEqual(raw_cursor.peek().timestamp, genpy.Time.from_sec(101))
+
+    def test_read_messages_workers(self):
+        fn = '/tmp/test_read_messages_workers.bag'
+
+        with rosbag.Bag(fn, 'w', chunk_threshold=1024) as b:
+            for i in range(2000):
+                b.write('/ints%d' % (i % 3), Int32(data=i), genpy.Time.from_sec(i // 2 + 1))
+                if i % 10 == 0:
+                    b.write('/strings', String(data='x' * i), genpy.Time.from_sec(i // 2 + 1))
+
+        with rosbag.Bag(fn) as b:
+            expected = [(m.topic, m.message, m.timestamp) for m in b.read_messages()]
+
+            self.assertEqual([tuple(m) for m in b.read_messages(workers=3)], expected)
+            self.assertEqual([tuple(m) for m in b.read_messages('/strings', start_time=genpy.Time(500), workers=2)],
+                             [m for m in expected if m[0] == '/strings' and m[2] >= genpy.Time(500)])
+
+            self.assertEqual([m.connection_header for m in b.read_messages(workers=2, return_connection_header=True)],
+                             [m.connection_header for m in b.read_messages(return_connection_header=True)])
+
+            # The map function runs in the workers or, without workers, in this process
+            sizes = [len(m.message.data) if m.topic == '/strings' else m.message.data for m in b.read_messages()]
+            map_fn = lambda m: len(m.message.data) if m.topic == '/strings' else m.message.data
+            self.assertEqual(list(b.read_messages(workers=4, map_fn=map_fn)), sizes)
+            self.assertEqual(list(b.read_messages(map_fn=map_fn)), sizes)
+
+            # Stopping early shuts the workers down
+            msgs = b.read_messages(workers=2)
+            self.assertEqual(tuple(next(msgs)), expected[0])
+            msgs.close()
+
+            self.assertRaises(ValueError, b.read_messages, raw=True, workers=2)
+
     def test_get_time(self):
         fn = '/tmp/test_get_time.bag'
         
@@ -0,0 +1,120 @@
+#!/usr/bin/env python
+# Software License Agreement (BSD License)
+#
+# Copyright (c) 2008, Willow Garage, Inc.
+# All rights reserved.
+#
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions
+# are met:
+#
+#  * Redistributions of source code must retain the above copyright
+#    notice, this list of conditions and the following disclaimer.
+#  * Redistributions in binary form must reproduce the above
+#    copyright notice, this list of conditions and the following
+#    disclaimer in the documentation and/or other materials provided
+#    with the distribution.
+#  * Neither the name of Willow Garage, Inc. nor the names of its
+#    contributors may be used to endorse or promote products derived
+#    from this software without specific prior written permission.
+#
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS
+# "AS IS" AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT
+# LIMITED TO, THE IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS
+# FOR A PARTICULAR PURPOSE ARE DISCLAIMED. IN NO EVENT SHALL THE
+# COPYRIGHT OWNER OR CONTRIBUTORS BE LIABLE FOR ANY DIRECT, INDIRECT,
+# INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL DAMAGES (INCLUDING,
+# BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES;
+# LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER
+# CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT
+# LIABILITY, OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN
+# ANY WAY OUT OF THE USE OF THIS SOFTWARE, EVEN IF ADVISED OF THE
+# POSSIBILITY OF SUCH DAMAGE.
+
+
+import asyncio
+import socket
+import threading
+import unittest
+
+import rospy
+import rospy.aio
+from rospy.impl.reactor import ReactorHandler
+
+class SocketHandler(ReactorHandler):
+    def __init__(self, sock):
+        self.sock = sock
+        sock.setblocking(0)
+        self.data = b''
+        self.error = None
+        self.thread = None
+    def fileno(self):
+        return self.sock.fileno()
+    def handle_read(self):
+        self.thread = threading.current_thread()
+        d = self.sock.recv(4096)
+        if not d:
+            raise EOFError()
+        self.data += d
+    def handle_error(self, e):
+        self.error = e
+
+class TestRospyAio(unittest.TestCase):
+
+    def test_asyncio_reactor(self):
+        async def main():
+            loop = asyncio.get_running_loop()
+            reactor = rospy.aio.AsyncioReactor(loop)
+            a, b = socket.socketpair()
+            handler = SocketHandler(a)
+            # registering from another thread is scheduled on the loop
+            t = threading.Thread(target=reactor.register, args=(handler,))
+            t.start()
+            t.join()
+            await asyncio.sleep(0.05)
+            b.sendall(b'hello')
+            for _ in range(100):
+                if handler.data:
+                    break
+                await asyncio.sleep(0.01)
+            self.assertEqual(handler.data, b'hello')
+            self.assertIs(handler.thread, threading.current_thread())
+
+            b.close()
+            for _ in range(100):
+                if handler.error:
+                    break
+                await asyncio.sleep(0.01)
+            self.assertIsInstance(handler.error, EOFError)
+            a.close()
+        asyncio.run(main())
+
+    def test_subscriber(self):
+        from std_msgs.msg import Int32
+        rospy.rostime.set_rostime_initialized(True)
+
+        async def main():
+            sub = rospy.aio.Subscriber('/aio_test', Int32, queue_size=5)
+            try:
+                # callbacks from rospy's threads
+                t = threading.Thread(target=lambda: [sub._callback(Int32(i)) for i in range(8)])
+                t.start()
+                t.join()
+                self.assertEqual((await sub.get()).data, 3)
+                self.assertEqual(sub.dropped, 3)
+
+                received = []
+                async def consume():
+                    async for msg in sub:
+                        received.append(msg.data)
+                consumer = asyncio.ensure_future(consume())
+                await asyncio.sleep(0.05)
+                sub._callback(Int32(8))
+                await asyncio.sleep(0.05)
+            finally:
+                sub.unregister()
+            await asyncio.wait_for(consumer, 1.)
+            self.assertEqual(received, [4, 5, 6, 7, 8])
+            with self.assertRaises(StopAsyncIteration):
+                await sub.get()
+        asyncio.run(main())
@@ -0,0 +1,242 @@
+#!/usr/bin/env python
+# Software License Agreement (BSD License)
+#
+# Copyright (c) 2008, Willow Garage, Inc.
+# All rights reserved.
+#
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions
+# are met:
+#
+#  * Redistributions of source code must retain the above copyright
+#    notice, this list of conditions and the following disclaimer.
+#  * Redistributions in binary form must reproduce the above
+#    copyright notice, this list of conditions and the following
+#    disclaimer in the documentation and/or other materials provided
+#    with the distribution.
+#  * Neither the name of Willow Garage, Inc. nor the names of its
+#    contributors may be used to endorse or promote products derived
+#    from this software without specific prior written permission.
+#
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS
+# "AS IS" AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT
+# LIMITED TO, THE IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS
+# FOR A PARTICULAR PURPOSE ARE DISCLAIMED. IN NO EVENT SHALL THE
+# COPYRIGHT OWNER OR CONTRIBUTORS BE LIABLE FOR ANY DIRECT, INDIRECT,
+# INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL DAMAGES (INCLUDING,
+# BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES;
+# LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER
+# CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT
+# LIABILITY, OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN
+# ANY WAY OUT OF THE USE OF THIS SOFTWARE, EVEN IF ADVISED OF THE
+# POSSIBILITY OF SUCH DAMAGE.
+
+
+import threading
+import time
+import unittest
+
+import rospy
+from rospy.executors import CallbackQueue, InlineExecutor, ThreadPoolExecutor, SingleThreadedExecutor
+
+def wait_for(cond, timeout=5.):
+    end = time.time() + timeout
+    while not cond() and time.time() < end:
+        time.sleep(0.01)
+    return cond()
+
+class TestRospyExecutors(unittest.TestCase):
+
+    def test_inline(self):
+        handled = []
+        q = CallbackQueue(InlineExecutor(), handled.append)
+        q.put(1)
+        q.put(2)
+        self.assertEqual([1, 2], handled)
+        self.assertRaises(ValueError, CallbackQueue, InlineExecutor(), handled.append, 0)
+        self.assertRaises(ValueError, CallbackQueue, InlineExecutor(), handled.append, None, 0)
+
+    def test_drop_oldest(self):
+        executor = SingleThreadedExecutor()
+        try:
+            release = threading.Event()
+            handled = []
+            def handler(item):
+                release.wait(5.)
+                handled.append(item)
+            q = CallbackQueue(executor, handler, queue_size=2)
+            q.put(0)
+            self.assertTrue(wait_for(lambda: len(q) == 0))
+            # 0 is being handled, 1 and 2 are dropped
+            for i in range(1, 5):
+                q.put(i)
+            self.assertEqual(2, q.dropped)
+            release.set()
+            self.assertTrue(wait_for(lambda: len(handled) == 3))
+            self.assertEqual([0, 3, 4], handled)
+
+            q.close()
+            q.put(5)
+            time.sleep(0.1)
+            self.assertEqual([0, 3, 4], handled)
+        finally:
+            executor.shutdown()
+
+    def test_drop_newest(self):
+        from rospy.executors import DROP_NEWEST
+        executor = SingleThreadedExecutor()
+        try:
+            release = threading.Event()
+            handled = []
+            dropped = []
+            def handler(item):
+                release.wait(5.)
+                handled.append(item)
+            q = CallbackQueue(executor, handler, queue_size=2, overflow=DROP_NEWEST, dropped_callback=dropped.append)
+            self.assertTrue(q.put(0))
+            self.assertTrue(wait_for(lambda: len(q) == 0))
+            # 0 is being handled, 3 and 4 are rejected
+            self.assertEqual([True, True, False, False], [q.put(i) for i in range(1, 5)])
+            self.assertEqual([3, 4], dropped)
+            self.assertEqual(2, q.dropped)
+            release.set()
+            self.assertTrue(wait_for(lambda: len(handled) == 3))
+            self.assertEqual([0, 1, 2], handled)
+        finally:
+            executor.shutdown()
+        self.assertRaises(ValueError, CallbackQueue, executor, handler, overflow='drop_all')
+
+    def test_concurrency(self):
+        executor = ThreadPoolExecutor(threads=4)
+        try:
+            lock = threading.Lock()
+            running = [0, 0, 0]
+            peak = [0, 0, 0]
+            handled = [[], [], []]
+            def handler(item):
+                n, i = item
+                with lock:
+                    running[n] += 1
+                    peak[n] = max(peak[n], running[n])
+                time.sleep(0.01)
+                with lock:
+                    running[n] -= 1
+                    handled[n].append(i)
+            queues = [CallbackQueue(executor, handler, concurrency=c) for c in (1, 2, 4)]
+            for i in range(20):
+                for n, q in enumerate(queues):
+                    q.put((n, i))
+            self.assertTrue(wait_for(lambda: all(len(h) == 20 for h in handled)))
+            # the single concurrency queue is handled in order
+            self.assertEqual(list(range(20)), handled[0])
+            self.assertEqual(1, peak[0])
+            self.assertTrue(peak[1] <= 2)
+            self.assertTrue(peak[2] <= 4)
+        finally:
+            executor.shutdown()
+        self.assertRaises(ValueError, ThreadPoolExecutor, threads=0)
+
+    def test_subscriber_executor(self):
+        from std_msgs.msg import String
+        from rospy.topics import _SubscriberImpl
+
+        class Connection(object):
+            callerid_pub = '/pub'
+            stat_bytes = 0
+
+        executor = SingleThreadedExecutor()
+        try:
+            sub = _SubscriberImpl('/executor', String)
+            self.assertEqual(None, sub.callback_queue)
+            threads = []
+            sub.add_callback(lambda m: threads.append((m.data, threading.current_thread())), None)
+            sub.set_executor(executor, queue_size=10)
+            sub.receive_callback([String('a'), String('b')], Connection())
+            self.assertTrue(wait_for(lambda: len(threads) == 2))
+            self.assertEqual(['a', 'b'], [d for d, t in threads])
+            self.assertTrue(all(t is executor._threads[0] for d, t in threads))
+            self.assertRaises(rospy.ROSException, sub.set_executor, executor, 0)
+            sub.close()
+        finally:
+            executor.shutdown()
+
+    def test_subscriber_batches(self):
+        from std_msgs.msg import String
+        from rospy.topics import _SubscriberImpl
+
+        class Connection(object):
+            callerid_pub = '/pub'
+            stat_bytes = 0
+            def __init__(self, callerid):
+                self.header = {'callerid': callerid}
+
+        c1, c2 = Connection('/pub1'), Connection('/pub2')
+        sub = _SubscriberImpl('/batches', String)
+        batches = []
+        def cb(msgs, header, arg):
+            batches.append((header['callerid'], [m.data for m in msgs], arg))
+        sub.add_batch_callback(cb, 'arg', 3)
+        self.assertRaises(rospy.ROSException, sub.add_batch_callback, lambda msgs, header: None, None, 0)
+        # without latency, batches hold the messages received at once
+        sub.receive_callback([String(str(i)) for i in range(4)], c1)
+        sub.receive_callback([String('x')], c2)
+        self.assertEqual([('/pub1', ['0', '1', '2'], 'arg'), ('/pub1', ['3'], 'arg'), ('/pub2', ['x'], 'arg')], batches)
+        sub.remove_batch_callback(cb, 'arg')
+        self.assertEqual([], sub.batch_callbacks)
+
+        # messages wait batch_latency for their batch to fill up
+        del batches[:]
+        sub.add_batch_callback(lambda msgs, header: batches.append((header['callerid'], [m.data for m in msgs])), None, 3, rospy.Duration.from_sec(0.2))
+        sub.receive_callback([String('a')], c1)
+        sub.receive_callback([String('b')], c2)
+        sub.receive_callback([String('c'), String('d')], c1)
+        self.assertEqual([('/pub1', ['a', 'c', 'd'])], batches)
+        self.assertTrue(wait_for(lambda: len(batches) == 2))
+        self.assertEqual(('/pub2', ['b']), batches[1])
+
+        # the remaining messages of a flushed batch wait batch_latency again
+        del batches[:]
+        sub.receive_callback([String('f')], c1)
+        time.sleep(0.15)
+        sub.receive_callback([String('g'), String('h'), String('i')], c1)
+        self.assertEqual([('/pub1', ['f', 'g', 'h'])], batches)
+        time.sleep(0.1)
+        self.assertEqual(1, len(batches))
+        self.assertTrue(wait_for(lambda: len(batches) == 2))
+        self.assertEqual(('/pub1', ['i']), batches[1])
+
+        # a slow callback doesn't block the other receiving threads
+        slow_sub = _SubscriberImpl('/batches', String)
+        release = threading.Event()
+        def slow_cb(msgs, header):
+            release.wait(5.)
+            batches.append((header['callerid'], [m.data for m in msgs]))
+        slow_sub.add_batch_callback(slow_cb, None, 1)
+        del batches[:]
+        t = threading.Thread(target=slow_sub.receive_callback, args=([String('j')], c1))
+        t.start()
+        try:
+            self.assertTrue(wait_for(lambda: slow_sub.batch_callbacks[0]._delivering))
+            slow_sub.receive_callback([String('k')], c2)
+            self.assertEqual([], batches)
+        finally:
+            release.set()
+            t.join(5.)
+        self.assertEqual([('/pub1', ['j']), ('/pub2', ['k'])], batches)
+        slow_sub.close()
+
+        # batches are delivered on the executor of the subscription
+        executor = SingleThreadedExecutor()
+        try:
+            threads = []
+            sub.set_executor(executor)
+            sub.add_batch_callback(lambda msgs, header: threads.append(threading.current_thread()), None, 10)
+            sub.receive_callback([String('e')], c1)
+            self.assertTrue(wait_for(lambda: threads))
+            self.assertTrue(threads[0] is executor._threads[0])
+            sub.close()
+        finally:
+            executor.shutdown()
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,148 @@
+#!/usr/bin/env python
+# Software License Agreement (BSD License)
+#
+# Copyright (c) 2008, Willow Garage, Inc.
+# All rights reserved.
+#
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions
+# are met:
+#
+#  * Redistributions of source code must retain the above copyright
+#    notice, this list of conditions and the following disclaimer.
+#  * Redistributions in binary form must reproduce the above
+#    copyright notice, this list of conditions and the following
+#    disclaimer in the documentation and/or other materials provided
+#    with the distribution.
+#  * Neither the name of Willow Garage, Inc. nor the names of its
+#    contributors may be used to endorse or promote products derived
+#    from this software without specific prior written permission.
+#
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS
+# "AS IS" AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT
+# LIMITED TO, THE IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS
+# FOR A PARTICULAR PURPOSE ARE DISCLAIMED. IN NO EVENT SHALL THE
+# COPYRIGHT OWNER OR CONTRIBUTORS BE LIABLE FOR ANY DIRECT, INDIRECT,
+# INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL DAMAGES (INCLUDING,
+# BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES;
+# LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER
+# CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT
+# LIABILITY, OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN
+# ANY WAY OUT OF THE USE OF THIS SOFTWARE, EVEN IF ADVISED OF THE
+# POSSIBILITY OF SUCH DAMAGE.
+
+import threading
+import time
+import unittest
+
+import rospy
+from rospy.impl.intraprocess import INTRAPROCESS, create_intraprocess_connection
+
+def wait_for(cond, timeout=5.):
+    end = time.time() + timeout
+    while not cond() and time.time() < end:
+        time.sleep(0.01)
+    return cond()
+
+class TestRospyIntraProcess(unittest.TestCase):
+
+    def test_intraprocess_connection(self):
+        from std_msgs.msg import String
+        from rospy.topics import _PublisherImpl, _SubscriberImpl
+
+        rospy.rostime.set_rostime_initialized(True)
+        pub = _PublisherImpl('/intra', String)
+        pub.is_latch = True
+        sub = _SubscriberImpl('/intra', String)
+        received = []
+        sub.add_callback(lambda m: received.append(m), None)
+
+        sub_conn, pub_conn = create_intraprocess_connection(pub, sub, 'http://localhost:1234/')
+        sub.add_connection(sub_conn)
+        pub.add_connection(pub_conn)
+        self.assertEqual(INTRAPROCESS, sub_conn.transport_type)
+        self.assertEqual('http://localhost:1234/', sub_conn.endpoint_id)
+        self.assertTrue(sub.has_connection('http://localhost:1234/'))
+
+        # messages are passed as copies, without serialization
+        msgs = [String('m%s' % i) for i in range(10)]
+        for m in msgs:
+            pub.publish(m)
+        self.assertTrue(wait_for(lambda: len(received) == 10))
+        self.assertEqual([m.data for m in msgs], [m.data for m in received])
+        self.assertFalse(any(a is b for a, b in zip(msgs, received)))
+        self.assertEqual(b'', pub.buff.getvalue())
+        self.assertEqual('1', received[0]._connection_header['latching'])
+        self.assertFalse(hasattr(msgs[0], '_connection_header'))
+        self.assertEqual(10, pub_conn.stat_num_msg)
+        self.assertEqual(10, sub_conn.stat_num_msg)
+        self.assertTrue(sub_conn.latch is received[-1])
+
+        # closing the subscription closes the publisher end
+        sub.close()
+        self.assertTrue(wait_for(lambda: not pub.has_connections()))
+        self.assertTrue(pub_conn.done)
+
+    def test_intraprocess_queue_size(self):
+        from std_msgs.msg import String
+        from rospy.topics import _PublisherImpl, _SubscriberImpl
+
+        rospy.rostime.set_rostime_initialized(True)
+        pub = _PublisherImpl('/intra_queue', String)
+        sub = _SubscriberImpl('/intra_queue', String)
+        sub.set_queue_size(2)
+        blocked = threading.Event()
+        release = threading.Event()
+        received = []
+        def cb(m):
+            blocked.set()
+            release.wait(5.)
+            received.append(m.data)
+        sub.add_callback(cb, None)
+        sub_conn, pub_conn = create_intraprocess_connection(pub, sub, 'http://localhost:1234/')
+        sub.add_connection(sub_conn)
+        pub.add_connection(pub_conn)
+
+        # publishing doesn't wait on callbacks and only the newest
+        # queue_size messages are kept while the callback is busy
+        pub.publish(String('first'))
+        self.assertTrue(blocked.wait(5.))
+        for i in range(5):
+            pub.publish(String('m%s' % i))
+        release.set()
+        self.assertTrue(wait_for(lambda: len(received) == 3))
+        self.assertEqual(['first', 'm3', 'm4'], received)
+
+        pub.close()
+        self.assertTrue(wait_for(lambda: not sub.has_connections()))
+        sub.close()
+
+    def test_intraprocess_reused_message(self):
+        from std_msgs.msg import Int32
+        from rospy.topics import _PublisherImpl, _SubscriberImpl
+
+        rospy.rostime.set_rostime_initialized(True)
+        pub = _PublisherImpl('/intra_reuse', Int32)
+        sub = _SubscriberImpl('/intra_reuse', Int32)
+        release = threading.Event()
+        received = []
+        def cb(m):
+            release.wait(5.)
+            received.append(m.data)
+        sub.add_callback(cb, None)
+        sub_conn, pub_conn = create_intraprocess_connection(pub, sub, 'http://localhost:1234/')
+        sub.add_connection(sub_conn)
+        pub.add_connection(pub_conn)
+
+        # the publisher reuses one instance while the subscriber is busy
+        msg = Int32()
+        for i in range(20):
+            msg.data = i
+            pub.publish(msg)
+        release.set()
+        self.assertTrue(wait_for(lambda: len(received) == 20))
+        self.assertEqual(list(range(20)), received)
+
+        pub.close()
+        self.assertTrue(wait_for(lambda: not sub.has_connections()))
+        sub.close()
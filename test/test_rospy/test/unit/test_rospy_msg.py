@@ -275,3 +275,70 @@ class TestRospyMsg(unittest.TestCase):
             b2.write(v)
         self.assertEqual(b.getvalue(), b2.getvalue())
 
+
+    def test_receive_buffer(self):
+        import socket
+        from rospy.msg import ReceiveBuffer
+        frames = [('frame-%s'%i).encode() * (i + 1) for i in range(20)]
+        data = b''.join(struct.pack('<I', len(f)) + f for f in frames)
+
+        # handshake leftovers are kept
+        b = ReceiveBuffer(16, data[:3])
+        self.assertEqual(3, b.tell())
+        self.assertEqual([], b.read_frames())
+
+        s1, s2 = socket.socketpair()
+        try:
+            s1.sendall(data[3:])
+            received = []
+            while b.tell() or len(received) < len(frames):
+                # small reads split frames and force compaction and growth
+                self.assertTrue(b.recv_into(s2, 7) > 0)
+                received.extend(b.read_frames())
+            self.assertEqual(frames, received)
+            self.assertEqual(0, b.tell())
+            self.assertTrue(b.capacity() < len(data))
+
+            # a read covers the rest of a frame whose size is known
+            s1.sendall(data)
+            b.recv_into(s2, 4)
+            self.assertEqual(len(frames[0]) + 4, b.recv_into(s2, 1) + 4)
+            self.assertEqual(frames[:1], b.read_frames())
+        finally:
+            s1.close()
+            s2.close()
+
+        # the buffer grows with the data received, not with the length
+        # advertised by the peer
+        big = b'x' * 100000
+        b = ReceiveBuffer(16)
+        s1, s2 = socket.socketpair()
+        try:
+            s1.sendall(struct.pack('<I', 0xffffffff) + b'abc')
+            self.assertEqual(7, b.recv_into(s2, 16))
+            s1.sendall(b'def')
+            self.assertEqual(3, b.recv_into(s2, 16))
+            self.assertTrue(b.capacity() <= 64, b.capacity())
+        finally:
+            s1.close()
+            s2.close()
+        b = ReceiveBuffer(16)
+        s1, s2 = socket.socketpair()
+        try:
+            import threading
+            t = threading.Thread(target=s1.sendall, args=(struct.pack('<I', len(big)) + big,))
+            t.start()
+            received = []
+            while not received:
+                b.recv_into(s2, 16)
+                received.extend(b.read_frames())
+            self.assertEqual([big], received)
+            t.join()
+        finally:
+            s1.close()
+            s2.close()
+
+        b = ReceiveBuffer(16, data)
+        self.assertEqual(frames[:2], b.read_frames(max_frames=2))
+        self.assertEqual(frames[-3:], b.read_frames(keep=3))
+        self.assertEqual(0, b.tell())
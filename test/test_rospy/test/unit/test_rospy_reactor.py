@@ -0,0 +1,191 @@
+#!/usr/bin/env python
+# Software License Agreement (BSD License)
+#
+# Copyright (c) 2008, Willow Garage, Inc.
+# All rights reserved.
+#
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions
+# are met:
+#
+#  * Redistributions of source code must retain the above copyright
+#    notice, this list of conditions and the following disclaimer.
+#  * Redistributions in binary form must reproduce the above
+#    copyright notice, this list of conditions and the following
+#    disclaimer in the documentation and/or other materials provided
+#    with the distribution.
+#  * Neither the name of Willow Garage, Inc. nor the names of its
+#    contributors may be used to endorse or promote products derived
+#    from this software without specific prior written permission.
+#
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS
+# "AS IS" AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT
+# LIMITED TO, THE IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS
+# FOR A PARTICULAR PURPOSE ARE DISCLAIMED. IN NO EVENT SHALL THE
+# COPYRIGHT OWNER OR CONTRIBUTORS BE LIABLE FOR ANY DIRECT, INDIRECT,
+# INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL DAMAGES (INCLUDING,
+# BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES;
+# LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER
+# CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT
+# LIABILITY, OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN
+# ANY WAY OUT OF THE USE OF THIS SOFTWARE, EVEN IF ADVISED OF THE
+# POSSIBILITY OF SUCH DAMAGE.
+
+
+import socket
+import threading
+import time
+import unittest
+from io import BytesIO
+
+import rospy
+from rospy.impl.reactor import Reactor, ReactorHandler, EVENT_READ, EVENT_WRITE
+
+class SocketHandler(ReactorHandler):
+    def __init__(self, sock):
+        self.sock = sock
+        sock.setblocking(0)
+        self.data = b''
+        self.writable = threading.Event()
+        self.error = None
+    def fileno(self):
+        return self.sock.fileno()
+    def handle_read(self):
+        d = self.sock.recv(4096)
+        if not d:
+            raise EOFError()
+        self.data += d
+    def handle_write(self):
+        self.writable.set()
+    def handle_error(self, e):
+        self.error = e
+
+def wait_for(cond, timeout=5.):
+    end = time.time() + timeout
+    while not cond() and time.time() < end:
+        time.sleep(0.01)
+    return cond()
+
+class TestRospyReactor(unittest.TestCase):
+
+    def setUp(self):
+        self.reactor = Reactor(threads=2)
+
+    def tearDown(self):
+        self.reactor.shutdown()
+
+    def test_read_write_events(self):
+        pairs = [socket.socketpair() for _ in range(10)]
+        handlers = [SocketHandler(a) for a, b in pairs]
+        for h in handlers:
+            self.reactor.register(h)
+        for i, (a, b) in enumerate(pairs):
+            b.sendall(b'x' * i)
+        self.assertTrue(wait_for(lambda: all(h.data == b'x' * i for i, h in enumerate(handlers))))
+
+        self.reactor.modify(handlers[0], EVENT_READ | EVENT_WRITE)
+        self.assertTrue(handlers[0].writable.wait(5.))
+        self.assertFalse(handlers[1].writable.is_set())
+
+        # closing the peer raises in the handler, which is unregistered
+        pairs[1][1].close()
+        self.assertTrue(wait_for(lambda: isinstance(handlers[1].error, EOFError)))
+
+        self.reactor.unregister(handlers[2])
+        pairs[2][1].sendall(b'more')
+        time.sleep(0.2)
+        self.assertEqual(handlers[2].data, b'xx')
+
+        for a, b in pairs:
+            a.close()
+            b.close()
+
+    def test_invalid_threads(self):
+        self.assertRaises(ValueError, Reactor, threads=0)
+
+    def test_set_reactor_threads(self):
+        import rospy.impl.reactor as reactor
+        try:
+            reactor.set_reactor_threads(1)
+            first = reactor.get_reactor()
+            self.assertTrue(first is reactor.get_reactor())
+            # a new reactor is created, the previous one keeps running
+            # until rospy shuts down
+            reactor.set_reactor_threads(2)
+            second = reactor.get_reactor()
+            self.assertEqual(2, second.threads)
+            self.assertTrue(all(t.is_alive() for t in first._threads))
+            reactor._shutdown_reactor()
+            self.assertTrue(wait_for(lambda: not any(t.is_alive() for t in first._threads + second._threads)))
+            self.assertEqual([], reactor._retired_reactors)
+        finally:
+            reactor._shutdown_reactor()
+            reactor.set_reactor_threads(0)
+
+    def test_receive_reactor(self):
+        from std_msgs.msg import Int32
+        from rospy.impl.tcpros_base import TCPROSTransport, TCPROSTransportProtocol
+        from rospy.msg import serialize_message
+
+        rospy.rostime.set_rostime_initialized(True)
+        a, b = socket.socketpair()
+        protocol = TCPROSTransportProtocol('/reactor', Int32)
+        transport = TCPROSTransport(protocol, '/reactor')
+        transport.set_socket(a, 'endpoint')
+        transport.header = {'type': 'std_msgs/Int32'}
+
+        received = []
+        closed = []
+        transport.set_cleanup_callback(closed.append)
+        transport.receive_reactor(lambda msgs, conn: received.extend(m.data for m in msgs), self.reactor)
+
+        buff = BytesIO()
+        for i in range(100):
+            serialize_message(buff, i, Int32(i))
+        data = buff.getvalue()
+        # split frames across writes
+        b.sendall(data[:7])
+        time.sleep(0.05)
+        b.sendall(data[7:])
+        self.assertTrue(wait_for(lambda: len(received) == 100))
+        self.assertEqual(received, list(range(100)))
+        self.assertEqual(transport.stat_num_msg, 100)
+
+        # the remote end closing the connection closes the transport
+        b.close()
+        self.assertTrue(wait_for(lambda: transport.done))
+        self.assertEqual(closed, [transport])
+
+    def test_reactor_queued_connection(self):
+        from std_msgs.msg import Int32
+        from rospy.exceptions import TransportTerminated
+        from rospy.impl.tcpros_base import TCPROSTransport, TCPROSTransportProtocol
+        from rospy.impl.tcpros_pubsub import ReactorQueuedConnection
+
+        a, b = socket.socketpair()
+        a.setsockopt(socket.SOL_SOCKET, socket.SO_SNDBUF, 4096)
+        transport = TCPROSTransport(TCPROSTransportProtocol('/reactor', Int32), '/reactor')
+        transport.set_socket(a, 'endpoint')
+        closed = []
+        transport.set_cleanup_callback(closed.append)
+        conn = ReactorQueuedConnection(transport, 3, self.reactor)
+
+        # the reader is stalled: data beyond the socket buffers is queued
+        # and the oldest queued data is dropped
+        chunks = [bytes(bytearray([i])) * 100000 for i in range(6)]
+        for c in chunks:
+            self.assertTrue(conn.write_data(c))
+
+        received = bytearray()
+        b.settimeout(5.)
+        while len(received) < 4 * 100000:
+            received.extend(b.recv(65536))
+        # the partially sent first chunk is completed, 1 and 2 are dropped
+        self.assertEqual(bytes(received), b''.join([chunks[0]] + chunks[3:]))
+        self.assertTrue(wait_for(lambda: transport.stat_num_msg == 4))
+
+        # the subscriber closing the connection closes the transport
+        b.close()
+        self.assertTrue(wait_for(lambda: transport.done))
+        self.assertEqual(closed, [transport])
+        self.assertRaises(TransportTerminated, conn.write_data, b'x')
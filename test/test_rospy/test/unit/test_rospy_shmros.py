@@ -0,0 +1,135 @@
+#!/usr/bin/env python
+# Software License Agreement (BSD License)
+#
+# Copyright (c) 2008, Willow Garage, Inc.
+# All rights reserved.
+#
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions
+# are met:
+#
+#  * Redistributions of source code must retain the above copyright
+#    notice, this list of conditions and the following disclaimer.
+#  * Redistributions in binary form must reproduce the above
+#    copyright notice, this list of conditions and the following
+#    disclaimer in the documentation and/or other materials provided
+#    with the distribution.
+#  * Neither the name of Willow Garage, Inc. nor the names of its
+#    contributors may be used to endorse or promote products derived
+#    from this software without specific prior written permission.
+#
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS
+# "AS IS" AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT
+# LIMITED TO, THE IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS
+# FOR A PARTICULAR PURPOSE ARE DISCLAIMED. IN NO EVENT SHALL THE
+# COPYRIGHT OWNER OR CONTRIBUTORS BE LIABLE FOR ANY DIRECT, INDIRECT,
+# INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL DAMAGES (INCLUDING,
+# BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES;
+# LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER
+# CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT
+# LIABILITY, OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN
+# ANY WAY OUT OF THE USE OF THIS SOFTWARE, EVEN IF ADVISED OF THE
+# POSSIBILITY OF SUCH DAMAGE.
+
+import os
+import socket
+import unittest
+from io import BytesIO
+
+import rospy
+
+class TestRospyShmros(unittest.TestCase):
+
+    def test_ring(self):
+        from std_msgs.msg import String
+        from rospy.msg import serialize_message, ReceiveBuffer
+        from rospy.impl.shmros import SHMROSPub, SHMROSSub, SHMROSTransport, MIN_RING_MESSAGE_SIZE
+
+        ring_size = 4 * MIN_RING_MESSAGE_SIZE
+        a, b = socket.socketpair()
+        pub = SHMROSTransport(SHMROSPub('/shm', String, ring_size=ring_size), '/shm')
+        pub.set_socket(a, 'subscriber')
+        sub = SHMROSSub('/shm', String)
+        sub.attach(pub.protocol.get_header_fields())
+        try:
+            # large messages go through the ring until it is full, small
+            # ones and the ones that don't fit are sent inline
+            sizes = [10, MIN_RING_MESSAGE_SIZE, 2 * MIN_RING_MESSAGE_SIZE, 2 * MIN_RING_MESSAGE_SIZE, 5 * MIN_RING_MESSAGE_SIZE]
+            buff = BytesIO()
+            for i, size in enumerate(sizes):
+                buff.seek(0)
+                buff.truncate(0)
+                # 4 bytes of the serialized message are the string length
+                serialize_message(buff, i, String(chr(ord('a') + i) * (size - 4)))
+                pub.write_data(buff.getvalue())
+            self.assertEqual(3 * MIN_RING_MESSAGE_SIZE, pub.write_pos)
+
+            rb = ReceiveBuffer()
+            msgs = []
+            b.settimeout(5.)
+            while len(msgs) < len(sizes):
+                rb.recv_into(b, 65536)
+                sub.read_messages(rb, msgs, b)
+            self.assertEqual([chr(ord('a') + i) * (size - 4) for i, size in enumerate(sizes)], [m.data for m in msgs])
+
+            # the subscriber acknowledged the ring, which wraps around
+            buff.seek(0)
+            buff.truncate(0)
+            serialize_message(buff, 5, String('f' * (2 * MIN_RING_MESSAGE_SIZE - 4)))
+            pub.write_data(buff.getvalue())
+            self.assertEqual(3 * MIN_RING_MESSAGE_SIZE, pub.read_pos)
+            self.assertEqual(6 * MIN_RING_MESSAGE_SIZE, pub.write_pos)
+            del msgs[:]
+            while not msgs:
+                rb.recv_into(b, 65536)
+                sub.read_messages(rb, msgs, b)
+            self.assertEqual('f' * (2 * MIN_RING_MESSAGE_SIZE - 4), msgs[0].data)
+        finally:
+            sub.close()
+            pub.close()
+            b.close()
+
+    def test_high_fd(self):
+        from std_msgs.msg import String
+        from rospy.msg import serialize_message, ReceiveBuffer
+        from rospy.impl.shmros import SHMROSPub, SHMROSSub, SHMROSTransport, MIN_RING_MESSAGE_SIZE
+        try:
+            import resource
+            soft, hard = resource.getrlimit(resource.RLIMIT_NOFILE)
+            if soft <= 1500:
+                resource.setrlimit(resource.RLIMIT_NOFILE, (min(2048, hard), hard))
+        except (ImportError, ValueError):
+            pass
+
+        # control socket above the FD_SETSIZE limit of select()
+        a, b = socket.socketpair()
+        try:
+            os.dup2(a.fileno(), 1500)
+        except OSError:
+            self.skipTest("cannot open file descriptor 1500")
+        a.close()
+        a = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM, 0, 1500)
+        pub = SHMROSTransport(SHMROSPub('/shm_fd', String, ring_size=4 * MIN_RING_MESSAGE_SIZE), '/shm_fd')
+        pub.set_socket(a, 'subscriber')
+        sub = SHMROSSub('/shm_fd', String)
+        sub.attach(pub.protocol.get_header_fields())
+        try:
+            buff = BytesIO()
+            rb = ReceiveBuffer()
+            b.settimeout(5.)
+            for i in range(2):
+                buff.seek(0)
+                buff.truncate(0)
+                serialize_message(buff, i, String('x' * MIN_RING_MESSAGE_SIZE))
+                pub.write_data(buff.getvalue())
+                msgs = []
+                while not msgs:
+                    rb.recv_into(b, 65536)
+                    sub.read_messages(rb, msgs, b)
+            # the acknowledgement of the first message was read
+            self.assertFalse(pub.done)
+            self.assertTrue(pub.read_pos > 0)
+        finally:
+            sub.close()
+            pub.close()
+            b.close()
@@ -0,0 +1,124 @@
+#!/usr/bin/env python
+# Software License Agreement (BSD License)
+#
+# Copyright (c) 2008, Willow Garage, Inc.
+# All rights reserved.
+#
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions
+# are met:
+#
+#  * Redistributions of source code must retain the above copyright
+#    notice, this list of conditions and the following disclaimer.
+#  * Redistributions in binary form must reproduce the above
+#    copyright notice, this list of conditions and the following
+#    disclaimer in the documentation and/or other materials provided
+#    with the distribution.
+#  * Neither the name of Willow Garage, Inc. nor the names of its
+#    contributors may be used to endorse or promote products derived
+#    from this software without specific prior written permission.
+#
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS
+# "AS IS" AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT
+# LIMITED TO, THE IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS
+# FOR A PARTICULAR PURPOSE ARE DISCLAIMED. IN NO EVENT SHALL THE
+# COPYRIGHT OWNER OR CONTRIBUTORS BE LIABLE FOR ANY DIRECT, INDIRECT,
+# INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL DAMAGES (INCLUDING,
+# BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES;
+# LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER
+# CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT
+# LIABILITY, OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN
+# ANY WAY OUT OF THE USE OF THIS SOFTWARE, EVEN IF ADVISED OF THE
+# POSSIBILITY OF SUCH DAMAGE.
+
+
+import math
+import unittest
+
+import rospy
+from rospy.impl.statistics import StreamingStatistics, ConnectionStatisticsLogger
+
+class Stamp(object):
+    def __init__(self, secs):
+        self.secs = secs
+    def to_sec(self):
+        return self.secs
+
+class Header(object):
+    def __init__(self, seq, stamp):
+        self.seq = seq
+        self.stamp = Stamp(stamp)
+
+class StampedMsg(object):
+    _has_header = True
+    def __init__(self, seq, stamp):
+        self.header = Header(seq, stamp)
+
+class SubscriberStatisticsLogger(object):
+    min_elements = 10
+    max_elements = 100
+    min_window = 4
+    max_window = 64
+    def __init__(self, sample_stride):
+        self.sample_stride = sample_stride
+
+class TestRospyStatistics(unittest.TestCase):
+
+    def test_streaming_statistics(self):
+        values = [0.5, 1.5, 0.25, 4.0, 2.0]
+        s = StreamingStatistics()
+        self.assertEqual(0.0, s.stddev())
+        for v in values:
+            s.add(v)
+        mean = sum(values) / len(values)
+        self.assertEqual(5, s.count)
+        self.assertAlmostEqual(mean, s.mean)
+        self.assertAlmostEqual(math.sqrt(sum((v - mean) ** 2 for v in values) / len(values)), s.stddev())
+        self.assertEqual(0.25, s.min)
+        self.assertEqual(4.0, s.max)
+        s.reset()
+        self.assertEqual(0, s.count)
+        self.assertEqual(None, s.max)
+
+    def _run(self, sample_stride, num_msgs, skip_seq=None):
+        rospy.rostime.set_rostime_initialized(True)
+        now = [100.0]
+        get_time = rospy.get_time
+        rospy.get_time = lambda: now[0]
+        try:
+            logger = ConnectionStatisticsLogger('/topic', '/sub', '/pub')
+            sent = []
+            logger.sendStatistics = lambda parent: sent.append(1)
+            parent = SubscriberStatisticsLogger(sample_stride)
+            for seq in range(1, num_msgs + 1):
+                if seq == skip_seq:
+                    now[0] += 0.1
+                    continue
+                now[0] += 0.1
+                logger.callback(parent, StampedMsg(seq, now[0] - 0.02), seq * 10)
+            logger.pub.unregister()
+            return logger
+        finally:
+            rospy.get_time = get_time
+
+    def test_connection_statistics(self):
+        logger = self._run(1, 10, skip_seq=5)
+        self.assertEqual(9, logger.delivered_msgs_)
+        self.assertEqual(1, logger.dropped_msgs_)
+        self.assertEqual(9, logger.age_.count)
+        self.assertAlmostEqual(0.02, logger.age_.mean)
+        self.assertEqual(8, logger.period_.count)
+        self.assertAlmostEqual(0.2, logger.period_.max)
+        self.assertAlmostEqual(0.1, logger.period_.min)
+        self.assertEqual(100, logger.stat_bytes_window_)
+
+        # only every 4th message is timed
+        logger = self._run(4, 20)
+        self.assertEqual(20, logger.delivered_msgs_)
+        self.assertEqual(0, logger.dropped_msgs_)
+        self.assertEqual(5, logger.age_.count)
+        self.assertEqual(5, logger.period_.count)
+        self.assertAlmostEqual(0.1, logger.period_.mean)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -235,3 +235,46 @@ class TestRospyTcprosPubsub(unittest.TestCase):
         self.assertEqual('fuga', fields['hoge'])
         self.assertEqual('baz', fields['foo'])        
             
+
+    def test_QueuedConnection_coalescing(self):
+        from rospy.impl.tcpros_base import TCPROSTransport, TCPROSTransportProtocol
+        from rospy.impl.tcpros_pubsub import QueuedConnection, is_tcp_nodelay
+
+        class GatherSocket(FakeSocket):
+            def __init__(self):
+                super(GatherSocket, self).__init__()
+                self.calls = []
+            def sendmsg(self, buffers):
+                # accept at most 5 bytes at a time
+                data = b''.join(bytes(b) for b in buffers)[:5]
+                self.calls.append(len(buffers))
+                self.data += data
+                return len(data)
+
+        sock = GatherSocket()
+        transport = TCPROSTransport(TCPROSTransportProtocol('/coalesce', None), '/coalesce')
+        transport.set_socket(sock, 'endpoint')
+        self.assertTrue(transport.write_frames([b'abc', b'', b'defghijk', b'l']))
+        self.assertEqual(b'abcdefghijkl', sock.data)
+        self.assertEqual([3, 2, 2], sock.calls)
+        self.assertEqual(4, transport.stat_num_msg)
+        self.assertEqual(12, transport.stat_bytes)
+
+        # messages written within the window are sent at once
+        sock.data = b''
+        del sock.calls[:]
+        conn = QueuedConnection(transport, 0, 0.2)
+        for d in [b'1', b'2', b'3']:
+            conn.write_data(d)
+        time.sleep(0.1)
+        self.assertEqual(b'', sock.data)
+        time.sleep(0.3)
+        self.assertEqual(b'123', sock.data)
+        self.assertEqual([3], sock.calls)
+        transport.close()
+
+        s = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        self.assertFalse(is_tcp_nodelay(s))
+        s.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        self.assertTrue(is_tcp_nodelay(s))
+        s.close()
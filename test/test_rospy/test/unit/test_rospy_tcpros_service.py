@@ -38,6 +38,12 @@ import struct
 import unittest
 import time
 
+def wait_for(cond, timeout=5.):
+    end = time.time() + timeout
+    while not cond() and time.time() < end:
+        time.sleep(0.01)
+    return cond()
+
 class FakeSocket(object):
     def __init__(self):
         self.data = ''
@@ -57,6 +63,89 @@ class FakeSocket(object):
     def close(self):
         pass
 
+class FakeServiceServer(object):
+    """
+    Minimal TCPROS service server for EmptySrv: responds to each request
+    with an OK byte and an empty response, or with an error if the
+    error flag is set.
+    """
+    def __init__(self, close_after=None):
+        import threading
+        self.sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        self.sock.bind(('127.0.0.1', 0))
+        self.sock.listen(10)
+        self.uri = 'rosrpc://127.0.0.1:%s'%self.sock.getsockname()[1]
+        self.close_after = close_after
+        self.error = False
+        self.delay = 0.
+        self.accepted = 0
+        self.headers = []
+        self.connections = []
+        t = threading.Thread(target=self._accept)
+        t.daemon = True
+        t.start()
+
+    def _accept(self):
+        import threading
+        while True:
+            try:
+                conn, _ = self.sock.accept()
+            except socket.error:
+                return
+            self.accepted += 1
+            self.connections.append(conn)
+            t = threading.Thread(target=self._serve, args=(conn,))
+            t.daemon = True
+            t.start()
+
+    def _recv(self, conn, size):
+        data = b''
+        while len(data) < size:
+            d = conn.recv(size - len(data))
+            if not d:
+                raise socket.error('closed')
+            data += d
+        return data
+
+    def _serve(self, conn):
+        import test_rospy.srv
+        from io import BytesIO
+        from rosgraph.network import read_ros_handshake_header, write_ros_handshake_header
+        try:
+            self.headers.append(read_ros_handshake_header(conn, BytesIO(), 4096))
+            write_ros_handshake_header(conn, {'callerid': '/fake', 'md5sum': test_rospy.srv.EmptySrv._md5sum,
+                                              'type': test_rospy.srv.EmptySrv._type})
+            calls = 0
+            while True:
+                (size,) = struct.unpack('<I', self._recv(conn, 4))
+                self._recv(conn, size)
+                time.sleep(self.delay)
+                if self.error:
+                    msg = b'failed'
+                    conn.sendall(b'\x00' + struct.pack('<I', len(msg)) + msg)
+                else:
+                    conn.sendall(b'\x01' + struct.pack('<I', 0))
+                calls += 1
+                if self.close_after and calls >= self.close_after:
+                    break
+        except socket.error:
+            pass
+        conn.close()
+
+    def close(self):
+        # wake up the accepting thread
+        try:
+            self.sock.shutdown(socket.SHUT_RDWR)
+        except socket.error:
+            pass
+        self.sock.close()
+        for c in self.connections:
+            try:
+                c.shutdown(socket.SHUT_RDWR)
+            except socket.error:
+                pass
+            c.close()
+
 # test service implementation
 class TestRospyTcprosService(unittest.TestCase):
 
@@ -231,4 +320,302 @@ class TestRospyTcprosService(unittest.TestCase):
         fields = p.get_header_fields()
         self.assertEqual(name, fields['service'])
         self.assertEqual(srv_data_class._md5sum, fields['md5sum'])
-        self.assertEqual(srv_data_class._type, fields['type'])        
+        self.assertEqual(srv_data_class._type, fields['type'])
+
+    def test_ServiceConnectionPool(self):
+        import threading
+        import rospy.impl.tcpros_service
+        from rospy.impl.tcpros_service import ServiceConnectionPool
+        from rospy.service import ServiceException
+        import test_rospy.srv
+        import rospy.names
+        rospy.names._set_caller_id('test_ServiceConnectionPool')
+
+        srv = test_rospy.srv.EmptySrv
+        name = '/pooled'
+        server = FakeServiceServer()
+        pool = ServiceConnectionPool(max_connections=2)
+        pool._uris[name] = server.uri
+        try:
+            # sequential calls reuse the persistent connection
+            for i in range(5):
+                pool.call(name, srv, srv._request_class())
+            self.assertEqual(1, server.accepted)
+            self.assertEqual('1', server.headers[0]['persistent'])
+
+            # error responses keep the connection
+            server.error = True
+            self.assertRaises(ServiceException, pool.call, name, srv, srv._request_class())
+            server.error = False
+            pool.call(name, srv, srv._request_class())
+            self.assertEqual(1, server.accepted)
+
+            # concurrent calls get separate connections, up to max_connections
+            a = pool.acquire(name, srv)
+            b = pool.acquire(name, srv)
+            self.assertTrue(a[1] is not b[1])
+            self.assertEqual(2, server.accepted)
+            acquired = []
+            t = threading.Thread(target=lambda: acquired.append(pool.acquire(name, srv)))
+            t.start()
+            time.sleep(0.2)
+            self.assertEqual([], acquired)
+            pool.release(b[0], b[1])
+            t.join(5.)
+            self.assertTrue(acquired[0][1] is b[1])
+            pool.release(a[0], a[1])
+            pool.release(acquired[0][0], acquired[0][1])
+        finally:
+            server.close()
+
+        # the service is restarted elsewhere: the pooled connections are
+        # dead and the service is looked up again
+        restarted = FakeServiceServer(close_after=2)
+        lookup = rospy.impl.tcpros_service.lookup_service_uri
+        rospy.impl.tcpros_service.lookup_service_uri = lambda resolved_name: restarted.uri
+        try:
+            time.sleep(0.1)
+            pool.call(name, srv, srv._request_class())
+            self.assertEqual(1, restarted.accepted)
+            self.assertEqual(restarted.uri, pool.lookup(name))
+
+            # the service closing a connection between calls is detected
+            pool.call(name, srv, srv._request_class())
+            pool.call(name, srv, srv._request_class())
+            self.assertEqual(2, restarted.accepted)
+        finally:
+            rospy.impl.tcpros_service.lookup_service_uri = lookup
+            restarted.close()
+            pool.close()
+        self.assertRaises(ServiceException, pool.call, name, srv, srv._request_class())
+
+        # idle connections are closed when any connection is acquired
+        server = FakeServiceServer()
+        pool = ServiceConnectionPool(idle_timeout=0.1)
+        pool._uris[name] = server.uri
+        try:
+            pool.call(name, srv, srv._request_class())
+            idle = pool._idle[pool._key(server.uri, srv, None)][0][0]
+            self.assertTrue(pool._is_alive(idle))
+            time.sleep(0.2)
+            key, transport, reused = pool.acquire(name, srv, {'other': '1'})
+            self.assertFalse(reused)
+            self.assertTrue(idle.done)
+            self.assertEqual({}, pool._idle)
+            pool.release(key, transport)
+        finally:
+            server.close()
+            pool.close()
+
+    def test_ServiceConnectionPool_call_async(self):
+        from rospy.exceptions import ROSException
+        from rospy.impl.tcpros_service import ServiceConnectionPool
+        from rospy.service import ServiceException
+        import test_rospy.srv
+        import rospy.names
+        rospy.names._set_caller_id('test_ServiceConnectionPool_call_async')
+
+        srv = test_rospy.srv.EmptySrv
+        name = '/pooled_async'
+        server = FakeServiceServer()
+        pool = ServiceConnectionPool(max_connections=4)
+        pool._uris[name] = server.uri
+        try:
+            # more calls in flight than connections
+            server.delay = 0.05
+            futures = [pool.call_async(name, srv, srv._request_class()) for i in range(12)]
+            for f in futures:
+                self.assertTrue(isinstance(f.result(5.), srv._response_class))
+            self.assertEqual(4, server.accepted)
+
+            server.delay = 0.
+            server.error = True
+            f = pool.call_async(name, srv, srv._request_class())
+            self.assertRaises(ServiceException, f.result, 5.)
+            server.error = False
+
+            # timed out and cancelled calls close their connection
+            server.delay = 0.5
+            f = pool.call_async(name, srv, srv._request_class(), timeout=0.1)
+            self.assertRaises(ROSException, f.result, 5.)
+            f = pool.call_async(name, srv, srv._request_class())
+            time.sleep(0.1)
+            self.assertTrue(f.cancel())
+            server.delay = 0.
+            self.assertTrue(isinstance(pool.call_async(name, srv, srv._request_class()).result(5.), srv._response_class))
+            self.assertEqual(0, len(pool._calls))
+        finally:
+            server.close()
+            pool.close()
+
+        # calls waiting for a connection that time out or are cancelled
+        # don't take the connection from the calls still waiting
+        server = FakeServiceServer()
+        pool = ServiceConnectionPool(max_connections=1)
+        pool._uris[name] = server.uri
+        try:
+            key, transport, _ = pool.acquire(name, srv)
+            a = pool.call_async(name, srv, srv._request_class(), timeout=0.1)
+            b = pool.call_async(name, srv, srv._request_class())
+            c = pool.call_async(name, srv, srv._request_class())
+            self.assertTrue(wait_for(lambda: sum(len(w) for w in pool._waiters.values()) == 3))
+            self.assertRaises(ROSException, a.result, 5.)
+            self.assertTrue(c.cancel())
+            self.assertEqual(1, sum(len(w) for w in pool._waiters.values()))
+            pool.release(key, transport)
+            self.assertTrue(isinstance(b.result(5.), srv._response_class))
+            self.assertEqual({}, pool._waiters)
+        finally:
+            server.close()
+            pool.close()
+
+    def test_ServiceImpl_request_queue(self):
+        import threading
+        from rospy.impl.tcpros_base import TCPROSTransport
+        from rospy.impl.tcpros_service import ServiceImpl
+        import test_rospy.srv
+        import rospy.names
+        rospy.names._set_caller_id('test_ServiceImpl_request_queue')
+
+        srv = test_rospy.srv.EmptySrv
+        release = threading.Event()
+        handled = []
+        def handler(request):
+            handled.append(request)
+            release.wait(5.)
+            return srv._response_class()
+        service = ServiceImpl('/queued', srv, handler, max_concurrency=1, queue_size=1)
+
+        clients = []
+        for i in range(3):
+            a, b = socket.socketpair()
+            transport = TCPROSTransport(service.protocol, '/queued')
+            transport.set_socket(a, '/client%s'%i)
+            service.handle_queued(transport, {'persistent': '1'})
+            b.settimeout(5.)
+            clients.append(b)
+        def response(b):
+            data = b''
+            while len(data) < 5 or len(data) < 5 + struct.unpack('<I', data[1:5])[0]:
+                data += b.recv(4096)
+            return data
+        try:
+            # one request is handled, one waits, the last is rejected
+            clients[0].sendall(struct.pack('<I', 0))
+            for _ in range(500):
+                if handled:
+                    break
+                time.sleep(0.01)
+            clients[1].sendall(struct.pack('<I', 0))
+            for _ in range(500):
+                if len(service.request_queue):
+                    break
+                time.sleep(0.01)
+            clients[2].sendall(struct.pack('<I', 0))
+            data = response(clients[2])
+            self.assertEqual(b'\x00', data[:1])
+            self.assertTrue(b'busy' in data, data)
+
+            release.set()
+            self.assertEqual(b'\x01' + struct.pack('<I', 0), response(clients[0]))
+            self.assertEqual(b'\x01' + struct.pack('<I', 0), response(clients[1]))
+            # persistent connections are handled again
+            clients[2].sendall(struct.pack('<I', 0))
+            self.assertEqual(b'\x01' + struct.pack('<I', 0), response(clients[2]))
+            self.assertEqual(3, len(handled))
+
+            # the clients of queued requests get an error on shutdown
+            release.clear()
+            clients[0].sendall(struct.pack('<I', 0))
+            for _ in range(500):
+                if len(handled) == 4:
+                    break
+                time.sleep(0.01)
+            clients[1].sendall(struct.pack('<I', 0))
+            for _ in range(500):
+                if len(service.request_queue):
+                    break
+                time.sleep(0.01)
+            shutdown = threading.Thread(target=service.shutdown)
+            shutdown.start()
+            data = response(clients[1])
+            self.assertEqual(b'\x00', data[:1])
+            self.assertTrue(b'shut down' in data, data)
+            self.assertEqual(b'', clients[1].recv(4096))
+        finally:
+            release.set()
+            if service.done:
+                shutdown.join(5.)
+            else:
+                service.request_queue.close()
+                service._own_executor.shutdown()
+            for b in clients:
+                b.close()
+
+    def test_wait_for_services(self):
+        import rosgraph
+        import rospy.impl.tcpros_service as tcpros_service
+        from rospy.exceptions import ROSException
+        import rospy.rostime
+        rospy.rostime.set_rostime_initialized(True)
+
+        registered = {}
+        up = set()
+        lookups = []
+        probes = []
+        def lookup_services(master, names):
+            lookups.append(list(names))
+            return dict((n, registered[n]) for n in names if n in registered)
+        def probe_service(name, uri, timeout=10.0):
+            probes.append((name, uri))
+            if uri not in up:
+                raise socket.error('connection refused')
+        def tick(master, names):
+            # services come up between lookups
+            if len(lookups) == 1:
+                registered['/a'] = 'rosrpc://host:1'
+                registered['/b'] = 'rosrpc://host:2'
+                up.add('rosrpc://host:1')
+            elif len(lookups) == 3:
+                # /b restarted at a new URI
+                registered['/b'] = 'rosrpc://host:3'
+                up.add('rosrpc://host:3')
+            return lookup_services(master, names)
+
+        orig = tcpros_service._lookup_services, tcpros_service._probe_service, rosgraph.Master
+        tcpros_service._lookup_services, tcpros_service._probe_service = tick, probe_service
+        rosgraph.Master = lambda caller_id: None
+        try:
+            tcpros_service.wait_for_services(['/a', '/b'], timeout=5.)
+            # one lookup of all the missing services per tick
+            self.assertEqual([['/a', '/b'], ['/a', '/b'], ['/b'], ['/b']], lookups)
+            # /b is probed again after each lookup until it responds
+            self.assertEqual([('/a', 'rosrpc://host:1'), ('/b', 'rosrpc://host:2'), ('/b', 'rosrpc://host:2'),
+                              ('/b', 'rosrpc://host:3')], probes)
+
+            # a service registered before it accepts connections is
+            # found once it does, at the same URI
+            registered['/d'] = 'rosrpc://host:4'
+            def probe_starting(name, uri, timeout=10.0):
+                if len(probes) == 2:
+                    up.add(uri)
+                probe_service(name, uri, timeout)
+            tcpros_service._probe_service = probe_starting
+            del probes[:]
+            tcpros_service.wait_for_services(['/d'], timeout=5.)
+            self.assertEqual([('/d', 'rosrpc://host:4')] * 3, probes)
+            tcpros_service._probe_service = probe_service
+
+            del lookups[:]
+            start = time.time()
+            try:
+                tcpros_service.wait_for_services(['/a', '/c'], timeout=0.5)
+                self.fail("should have timed out")
+            except ROSException as e:
+                self.assertTrue('/c' in str(e) and '/a' not in str(e), str(e))
+            self.assertTrue(time.time() - start < 1.)
+            # exponential backoff
+            self.assertTrue(len(lookups) < 8, lookups)
+            self.assertRaises(ValueError, tcpros_service.wait_for_services, ['/a'], 0.)
+        finally:
+            tcpros_service._lookup_services, tcpros_service._probe_service, rosgraph.Master = orig
@@ -0,0 +1,145 @@
+#!/usr/bin/env python
+# Software License Agreement (BSD License)
+#
+# Copyright (c) 2008, Willow Garage, Inc.
+# All rights reserved.
+#
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions
+# are met:
+#
+#  * Redistributions of source code must retain the above copyright
+#    notice, this list of conditions and the following disclaimer.
+#  * Redistributions in binary form must reproduce the above
+#    copyright notice, this list of conditions and the following
+#    disclaimer in the documentation and/or other materials provided
+#    with the distribution.
+#  * Neither the name of Willow Garage, Inc. nor the names of its
+#    contributors may be used to endorse or promote products derived
+#    from this software without specific prior written permission.
+#
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS
+# "AS IS" AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT
+# LIMITED TO, THE IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS
+# FOR A PARTICULAR PURPOSE ARE DISCLAIMED. IN NO EVENT SHALL THE
+# COPYRIGHT OWNER OR CONTRIBUTORS BE LIABLE FOR ANY DIRECT, INDIRECT,
+# INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL DAMAGES (INCLUDING,
+# BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES;
+# LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER
+# CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT
+# LIABILITY, OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN
+# ANY WAY OUT OF THE USE OF THIS SOFTWARE, EVEN IF ADVISED OF THE
+# POSSIBILITY OF SUCH DAMAGE.
+
+
+import socket
+import unittest
+from io import BytesIO
+
+import rospy
+from rospy.impl.transport import INBOUND, OUTBOUND
+from rospy.impl.udpros import UDPROSTransport, UDPROSHandler, UDPROS
+from rospy.msg import serialize_message
+
+class DatagramSocket(object):
+    """records the datagrams sent by a publisher transport"""
+    def __init__(self):
+        self.datagrams = []
+    def getsockname(self):
+        return ('127.0.0.1', 1234)
+    def fileno(self):
+        return -1
+    def send(self, data):
+        self.datagrams.append(data)
+        return len(data)
+    def close(self):
+        pass
+
+class TestRospyUdpros(unittest.TestCase):
+
+    def _serialize(self, seq, msg):
+        buff = BytesIO()
+        serialize_message(buff, seq, msg)
+        return buff.getvalue()
+
+    def test_handler(self):
+        h = UDPROSHandler()
+        self.assertTrue(h.supports(UDPROS))
+        self.assertFalse(h.supports('TCPROS'))
+        self.assertEqual([], h.get_supported())
+        self.assertEqual(0, h.init_publisher('/foo', ['TCPROS'])[0])
+        self.assertEqual(0, h.init_publisher('/foo', [UDPROS, b'', 'localhost'])[0])
+        # UDPROS was not offered to this publisher
+        self.assertEqual(0, h.create_transport('/foo', 'http://localhost:1234/', [UDPROS, 'localhost', 1, 1, 1500, b''])[0])
+
+        # sockets offered to publishers that selected another protocol are closed
+        socks = [socket.socket(socket.AF_INET, socket.SOCK_DGRAM) for _ in range(3)]
+        h.pending[('/foo', 'http://a:1/')] = socks[0]
+        h.pending[('/foo', 'http://b:1/')] = socks[1]
+        h.pending[('/bar', 'http://a:1/')] = socks[2]
+        h.release_topic('/foo', 'http://a:1/')
+        self.assertEqual(-1, socks[0].fileno())
+        self.assertEqual(2, len(h.pending))
+        # all the sockets of a subscription are closed when it closes
+        h.release_topic('/foo')
+        self.assertEqual(-1, socks[1].fileno())
+        self.assertEqual([('/bar', 'http://a:1/')], list(h.pending))
+        h.shutdown()
+        self.assertEqual(-1, socks[2].fileno())
+
+    def test_fragmentation(self):
+        from std_msgs.msg import String
+        rospy.rostime.set_rostime_initialized(True)
+
+        sub_sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        sub_sock.bind(('127.0.0.1', 0))
+        pub_sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        pub_sock.connect(sub_sock.getsockname())
+        pub = UDPROSTransport(OUTBOUND, '/udp', pub_sock, None, 1500, header={'callerid': '/pub'})
+        sub = UDPROSTransport(INBOUND, '/udp', sub_sock, pub.connection_id, 1500,
+                              header={'callerid': '/pub'}, recv_data_class=String)
+        sub_sock.settimeout(5.)
+        try:
+            for i, size in enumerate([0, 1488, 1489, 10000]):
+                self.assertTrue(pub.write_data(self._serialize(i, String('x' * size))))
+                msgs = sub.receive_once()
+                self.assertEqual(['x' * size], [m.data for m in msgs])
+                self.assertEqual('/pub', msgs[0]._connection_header['callerid'])
+            self.assertEqual(4, pub.stat_num_msg)
+            self.assertEqual(4, sub.stat_num_msg)
+            self.assertEqual(0, sub.stat_drops)
+        finally:
+            pub.close()
+            sub.close()
+        self.assertTrue(pub.done)
+
+    def test_drops(self):
+        from std_msgs.msg import String
+
+        pub = UDPROSTransport(OUTBOUND, '/udp', DatagramSocket(), 7, 100)
+        sub = UDPROSTransport(INBOUND, '/udp', DatagramSocket(), 7, 100, recv_data_class=String)
+        messages = []
+        for i in range(5):
+            del pub.socket.datagrams[:]
+            pub.write_data(self._serialize(i, String(str(i) * 200)))
+            self.assertEqual(3, len(pub.socket.datagrams))
+            messages.append(pub.socket.datagrams[:])
+
+        queue = []
+        for d in messages[0]:
+            sub._receive_datagram(d, queue)
+        self.assertEqual(1, len(queue))
+        # message 1 is lost, the second datagram of message 2 is lost
+        sub._receive_datagram(messages[2][0], queue)
+        sub._receive_datagram(messages[2][2], queue)
+        self.assertEqual(2, sub.stat_drops)
+        # the last datagram of message 3 is lost
+        for d in messages[3][:2] + messages[4]:
+            sub._receive_datagram(d, queue)
+        # datagrams of other connections are ignored
+        sub._receive_datagram(b'\0' * 8 + messages[0][0][8:], queue)
+        self.assertEqual(3, sub.stat_drops)
+        self.assertEqual(['0' * 200, '4' * 200], [m.data for m in sub._deserialize(queue)])
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,289 @@
+#!/usr/bin/env python
+# Software License Agreement (BSD License)
+#
+# Copyright (c) 2009, Willow Garage, Inc.
+# All rights reserved.
+#
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions
+# are met:
+#
+#  * Redistributions of source code must retain the above copyright
+#    notice, this list of conditions and the following disclaimer.
+#  * Redistributions in binary form must reproduce the above
+#    copyright notice, this list of conditions and the following
+#    disclaimer in the documentation and/or other materials provided
+#    with the distribution.
+#  * Neither the name of Willow Garage, Inc. nor the names of its
+#    contributors may be used to endorse or promote products derived
+#    from this software without specific prior written permission.
+#
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS
+# "AS IS" AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT
+# LIMITED TO, THE IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS
+# FOR A PARTICULAR PURPOSE ARE DISCLAIMED. IN NO EVENT SHALL THE
+# COPYRIGHT OWNER OR CONTRIBUTORS BE LIABLE FOR ANY DIRECT, INDIRECT,
+# INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL DAMAGES (INCLUDING,
+# BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES;
+# LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER
+# CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT
+# LIABILITY, OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN
+# ANY WAY OUT OF THE USE OF THIS SOFTWARE, EVEN IF ADVISED OF THE
+# POSSIBILITY OF SUCH DAMAGE.
+
+"""
+Benchmarks of the rosbag Python API on synthetic bags.
+
+Generates a bag with the given number of topics, message size and
+compression, then times writing, opening, reading, reindexing and
+compressing it.  Results are printed as a table and can be written as
+JSON and compared against a previous run, e.g. from another commit:
+
+  bag_benchmark.py --size 256 --output before.json
+  bag_benchmark.py --size 256 --compare before.json
+"""
+
+from __future__ import print_function
+
+import gc
+import json
+import optparse
+import os
+import platform
+import shutil
+import struct
+import subprocess
+import sys
+import tempfile
+import time
+
+try:
+    import tracemalloc  # Python 3.4+
+except ImportError:
+    tracemalloc = None
+
+import genpy
+
+import rosbag
+from rosbag.bag import _copy_chunks
+
+# The payload is written as a std_msgs/String, so the bags can be read without any generated messages
+_DATATYPE = 'std_msgs/String'
+_MD5SUM   = '992ce8a1687cec8c8bd883ec73ca41d1'
+_MSG_DEF  = 'string data\n'
+
+def generate_bag(filename, size, topics, message_size, rate, compression, chunk_threshold):
+    """
+    Write a synthetic bag.
+    @param size: total payload size in bytes
+    @param rate: publishing rate of each topic in Hz
+    @return: number of messages and payload bytes written
+    """
+    headers = []
+    for i in range(topics):
+        topic = '/benchmark/topic%d' % i
+        headers.append((topic, {'topic': topic, 'type': _DATATYPE, 'md5sum': _MD5SUM, 'message_definition': _MSG_DEF,
+                                'callerid': '/bag_benchmark', 'latching': '0'}))
+
+    # Compressible, but not trivially so
+    text = b''.join(b'%08x ' % (i * 2654435761 % 2 ** 32) for i in range(message_size // 9 + 1))[:message_size - 4]
+    serialized = struct.pack('<I', len(text)) + text
+
+    count = max(1, size // len(serialized))
+    period = 1.0 / (rate * topics)
+    with rosbag.Bag(filename, 'w', compression=compression, chunk_threshold=chunk_threshold) as bag:
+        for i in range(count):
+            topic, header = headers[i % topics]
+            t = genpy.Time.from_sec(1000000000.0 + i * period)
+            bag.write(topic, (_DATATYPE, serialized, _MD5SUM, None), t, raw=True, connection_header=header)
+
+    return count, count * len(serialized)
+
+def _timed(fn, repeat):
+    # Best of repeat runs: the least disturbed by other activity on the machine
+    best = None
+    result = None
+    for _ in range(repeat):
+        gc.collect()
+        start = time.time()
+        result = fn()
+        elapsed = time.time() - start
+        if best is None or elapsed < best:
+            best = elapsed
+    return best, result
+
+def _read_all(filename, **kwargs):
+    count = 0
+    with rosbag.Bag(filename) as bag:
+        for _ in bag.read_messages(**kwargs):
+            count += 1
+    return count
+
+def _index_memory(filename):
+    if tracemalloc is None:
+        return None
+    gc.collect()
+    tracemalloc.start()
+    try:
+        bag = rosbag.Bag(filename)
+        current, _ = tracemalloc.get_traced_memory()
+        bag.close()
+    finally:
+        tracemalloc.stop()
+    return current
+
+def _reindex(filename, workdir):
+    copy = os.path.join(workdir, 'reindex.bag')
+    shutil.copy(filename, copy)
+    start = time.time()
+    with rosbag.Bag(copy, 'a', allow_unindexed=True) as bag:
+        for _ in bag.reindex():
+            pass
+    elapsed = time.time() - start
+    os.remove(copy)
+    return elapsed
+
+def _compress(filename, workdir, compression, copy_chunks, workers=None):
+    out = os.path.join(workdir, 'compressed.bag')
+    with rosbag.Bag(filename) as inbag:
+        with rosbag.Bag(out, 'w', compression=compression) as outbag:
+            if copy_chunks:
+                _copy_chunks(inbag, outbag, workers)
+            else:
+                for topic, msg, t, header in inbag.read_messages(raw=True, return_connection_header=True):
+                    outbag.write(topic, msg, t, raw=True, connection_header=header)
+    size = os.path.getsize(out)
+    os.remove(out)
+    return size
+
+def run(options):
+    workdir = tempfile.mkdtemp(prefix='bag_benchmark')
+    try:
+        filename = os.path.join(workdir, 'benchmark.bag')
+        size = int(options.size * 1024 * 1024)
+
+        results = {}
+        def add(name, seconds, unit_count=None, unit=None):
+            entry = {'seconds': seconds}
+            if unit_count is not None and seconds > 0:
+                entry[unit + '_per_second'] = unit_count / seconds
+            results[name] = entry
+            return entry
+
+        def generate():
+            return generate_bag(filename, size, options.topics, options.message_size, options.rate,
+                                options.compression, options.chunk_threshold)
+        seconds, (count, payload) = _timed(generate, options.repeat)
+        add('write', seconds, payload, 'bytes')['messages'] = count
+        bag_size = os.path.getsize(filename)
+
+        add('open', _timed(lambda: rosbag.Bag(filename).close(), options.repeat)[0])
+        results['index_memory'] = {'bytes': _index_memory(filename)}
+
+        add('read', _timed(lambda: _read_all(filename), options.repeat)[0], payload, 'bytes')
+        add('read_raw', _timed(lambda: _read_all(filename, raw=True), options.repeat)[0], payload, 'bytes')
+        seconds, filtered = _timed(lambda: _read_all(filename, topics=['/benchmark/topic0'], raw=True), options.repeat)
+        add('read_topic', seconds, filtered, 'messages')
+
+        results['reindex'] = {'seconds': min(_reindex(filename, workdir) for _ in range(options.repeat))}
+
+        for name, copy_chunks in [('compress', False), ('compress_chunks', True)]:
+            seconds, compressed_size = _timed(lambda: _compress(filename, workdir, options.target_compression, copy_chunks, options.jobs),
+                                              options.repeat)
+            add(name, seconds, payload, 'bytes')['ratio'] = float(compressed_size) / bag_size
+
+        return {
+            'parameters': {
+                'size': size,
+                'topics': options.topics,
+                'message_size': options.message_size,
+                'compression': options.compression,
+                'chunk_threshold': options.chunk_threshold,
+                'target_compression': options.target_compression,
+                'jobs': options.jobs,
+                'repeat': options.repeat,
+                'bag_size': bag_size,
+                'messages': count,
+            },
+            'environment': {
+                'python': platform.python_version(),
+                'platform': platform.platform(),
+                'commit': _git_commit(),
+            },
+            'results': results,
+        }
+    finally:
+        shutil.rmtree(workdir)
+
+def _git_commit():
+    try:
+        with open(os.devnull, 'w') as devnull:
+            return subprocess.check_output(['git', 'rev-parse', 'HEAD'], cwd=os.path.dirname(os.path.abspath(__file__)),
+                                           stderr=devnull).decode().strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+def print_results(report, baseline=None):
+    print('%-16s %12s %16s %10s' % ('benchmark', 'seconds', 'throughput', 'change'))
+    for name, entry in sorted(report['results'].items()):
+        if 'seconds' not in entry:
+            print('%-16s %12s %16s' % (name, '-', '%s bytes' % entry['bytes']))
+            continue
+
+        throughput = ''
+        if 'bytes_per_second' in entry:
+            throughput = '%.1f MB/s' % (entry['bytes_per_second'] / 1024 / 1024)
+        elif 'messages_per_second' in entry:
+            throughput = '%.0f msg/s' % entry['messages_per_second']
+
+        change = ''
+        if baseline is not None and name in baseline['results']:
+            before = baseline['results'][name].get('seconds')
+            if before:
+                change = '%+.1f%%' % (100.0 * (entry['seconds'] - before) / before)
+
+        print('%-16s %12.4f %16s %10s' % (name, entry['seconds'], throughput, change))
+
+def main(argv):
+    parser = optparse.OptionParser(usage='bag_benchmark.py [options]', description='Benchmark the rosbag Python API on a synthetic bag.')
+    parser.add_option('-s', '--size',             type='float',  dest='size',               default=64.0,  help='payload size of the bag in MB (default: %default)')
+    parser.add_option('-t', '--topics',           type='int',    dest='topics',             default=10,    help='number of topics (default: %default)')
+    parser.add_option('-m', '--message-size',     type='int',    dest='message_size',       default=1024,  help='message size in bytes (default: %default)')
+    parser.add_option(      '--rate',             type='float',  dest='rate',               default=100.0, help='rate of each topic in Hz (default: %default)')
+    parser.add_option('-c', '--compression',      type='choice', dest='compression',        default=rosbag.Compression.NONE, choices=rosbag.get_compressions(),
+                      help='compression of the generated bag (default: %default)')
+    parser.add_option(      '--chunk-threshold',  type='int',    dest='chunk_threshold',    default=768 * 1024, help='chunk threshold in bytes (default: %default)')
+    parser.add_option(      '--target-compression', type='choice', dest='target_compression', default=rosbag.Compression.BZ2, choices=rosbag.get_compressions(),
+                      help='compression to benchmark compressing to (default: %default)')
+    parser.add_option('-j', '--jobs',             type='int',    dest='jobs',               default=None,  help='workers for chunk recompression (default: number of CPUs)')
+    parser.add_option('-r', '--repeat',           type='int',    dest='repeat',             default=3,     help='runs of each benchmark; the fastest is reported (default: %default)')
+    parser.add_option('-o', '--output',           action='store', dest='output',                           help='write the results as JSON to FILE', metavar='FILE')
+    parser.add_option(      '--compare',          action='store', dest='compare',                          help='compare with the JSON results in FILE', metavar='FILE')
+    (options, args) = parser.parse_args(argv)
+
+    if args:
+        parser.error('unexpected arguments: %s' % ' '.join(args))
+    if options.message_size < 5:
+        parser.error('message size must be at least 5 bytes')
+    if options.repeat < 1:
+        parser.error('repeat must be at least 1')
+
+    baseline = None
+    if options.compare:
+        with open(options.compare) as f:
+            baseline = json.load(f)
+
+    report = run(options)
+
+    if baseline is not None:
+        differing = [k for k, v in report['parameters'].items() if k != 'repeat' and baseline['parameters'].get(k) != v]
+        if differing:
+            print('WARNING: parameters differ from the baseline: %s' % ', '.join(sorted(differing)), file=sys.stderr)
+
+    print_results(report, baseline)
+    if options.output:
+        with open(options.output, 'w') as f:
+            json.dump(report, f, indent=2, sort_keys=True)
+
+if __name__ == '__main__':
+    main(sys.argv[1:])
@@ -30,7 +30,12 @@
 # ANY WAY OUT OF THE USE OF THIS SOFTWARE, EVEN IF ADVISED OF THE
 # POSSIBILITY OF SUCH DAMAGE.
 
-from .bag import Bag, Compression, ROSBagException, ROSBagFormatException, ROSBagUnindexedException
+from .bag import Bag, BagCursor, Compression, ROSBagException, ROSBagFormatException, ROSBagUnindexedException
+from .bag import Codec, get_codec, get_compressions, register_codec
+from .catalog import BagCatalog
+from .player import BagPlayer, TimeSource
+from .recorder import Recorder
+from .snapshot import Snapshotter
 
 # Import rosbag main to be used by the rosbag executable
 from .rosbag_main import rosbagmain
@@ -49,6 +49,13 @@ import sys
 import threading
 import time
 import yaml
+import zlib
+
+try:
+    import lzma  # Python 3.3+
+    found_lzma = True
+except ImportError:
+    found_lzma = False
 
 from Cryptodome.Cipher import AES
 from Cryptodome.Random import get_random_bytes
@@ -120,11 +127,141 @@ class ROSBagEncryptException(ROSBagException):
 
 class Compression:
     """
-    Allowable compression types
+    Allowable compression types.  Only NONE, BZ2 and LZ4 can be read by the C++ rosbag API.
     """
     NONE = 'none'
     BZ2  = 'bz2'
     LZ4  = 'lz4'
+    ZLIB = 'zlib'
+    LZMA = 'lzma'
+
+class Codec(object):
+    """
+    A chunk compression method.  Codecs are looked up by the name stored in
+    the chunk header, so a registered codec can be used both to write bags
+    and to read them back.
+
+    Subclasses implement decompress() and create_compressor().
+    """
+    name          = None    # name stored in the chunk header
+    levels        = None    # (min, max) compression levels, or None if the level can't be set
+    default_level = None
+
+    def check_level(self, level):
+        """
+        @raise ValueError: if level isn't valid for this codec
+        """
+        if level is None:
+            return
+        if self.levels is None:
+            raise ValueError('%s compression does not support compression levels' % self.name)
+        if not self.levels[0] <= level <= self.levels[1]:
+            raise ValueError('%s compression level must be between %d and %d' % (self.name, self.levels[0], self.levels[1]))
+
+    def compress(self, data, level=None):
+        """
+        Compress a complete buffer.
+        @rtype: bytes
+        """
+        compressor = self.create_compressor(level)
+        return compressor.compress(data) + compressor.flush()
+
+    def decompress(self, data):
+        """
+        Decompress a complete buffer.
+        @rtype: bytes
+        """
+        raise NotImplementedError()
+
+    def create_compressor(self, level=None):
+        """
+        Create a streaming compressor with compress(data) and flush() methods (e.g. bz2.BZ2Compressor).
+        @param level: compression level, or None for the default level
+        @type  level: int
+        """
+        raise NotImplementedError()
+
+class _BZ2Codec(Codec):
+    name          = Compression.BZ2
+    levels        = (1, 9)
+    default_level = 9
+
+    def decompress(self, data):
+        return bz2.decompress(data)
+
+    def create_compressor(self, level=None):
+        return bz2.BZ2Compressor(self.default_level if level is None else level)
+
+class _LZ4Codec(Codec):
+    name = Compression.LZ4
+
+    def decompress(self, data):
+        return roslz4.decompress(data)
+
+    def create_compressor(self, level=None):
+        return roslz4.LZ4Compressor()
+
+class _ZlibCodec(Codec):
+    name          = Compression.ZLIB
+    levels        = (0, 9)
+    default_level = 6
+
+    def decompress(self, data):
+        return zlib.decompress(data)
+
+    def create_compressor(self, level=None):
+        return zlib.compressobj(self.default_level if level is None else level)
+
+class _LZMACodec(Codec):
+    name          = Compression.LZMA
+    levels        = (0, 9)
+    default_level = 6
+
+    def decompress(self, data):
+        return lzma.decompress(data)
+
+    def create_compressor(self, level=None):
+        return lzma.LZMACompressor(preset=self.default_level if level is None else level)
+
+_codecs = {}
+
+def register_codec(codec):
+    """
+    Register a chunk compression codec, replacing any codec with the same name.
+    @param codec: the codec
+    @type  codec: L{Codec}
+    """
+    if not codec.name or codec.name == Compression.NONE:
+        raise ValueError('invalid codec name: %s' % codec.name)
+    _codecs[codec.name] = codec
+
+def get_codec(name):
+    """
+    Get a registered chunk compression codec.
+    @param name: name of the codec, see L{Compression}
+    @type  name: str
+    @return: the codec
+    @rtype: L{Codec}
+    @raise ROSBagException: if no codec is registered with the name
+    """
+    codec = _codecs.get(name)
+    if codec is None:
+        raise ROSBagException('unsupported compression type: %s' % name)
+    return codec
+
+def get_compressions():
+    """
+    Get the names of the compression types which can be used to write bags.
+    @rtype: list(str)
+    """
+    return [Compression.NONE] + sorted(_codecs)
+
+register_codec(_BZ2Codec())
+register_codec(_ZlibCodec())
+if found_lz4:
+    register_codec(_LZ4Codec())
+if found_lzma:
+    register_codec(_LZMACodec())
 
 BagMessage = collections.namedtuple('BagMessage', 'topic message timestamp')
 BagMessageWithConnectionHeader = collections.namedtuple('BagMessageWithConnectionHeader', 'topic message timestamp connection_header')
@@ -135,6 +272,9 @@ class _ROSBagEncryptor(object):
     """
     _ENCRYPTOR_FIELD_NAME = 'encryptor'
 
+    # If True, chunks are assembled in memory and passed to encrypt_chunk() before being written
+    encrypts_chunks = False
+
     def __init__(self):
         pass
 
@@ -148,8 +288,8 @@ class _ROSBagNoEncryptor(_ROSBagEncryptor):
     def initialize(self, _, __):
         pass
 
-    def encrypt_chunk(self, chunk_size, _, __):
-        return chunk_size
+    def encrypt_chunk(self, chunk):
+        return chunk
 
     def decrypt_chunk(self, chunk):
         return chunk
@@ -180,6 +320,8 @@ class _ROSBagAesCbcEncryptor(_ROSBagEncryptor):
     _GPG_USER_FIELD_NAME = 'gpg_user'
     _ENCRYPTED_KEY_FIELD_NAME = 'encrypted_key'
 
+    encrypts_chunks = True
+
     def __init__(self):
         """
         Create AES encryptor.
@@ -199,13 +341,15 @@ class _ROSBagAesCbcEncryptor(_ROSBagEncryptor):
         Initialize encryptor by composing AES symmetric key.
         @param bag: bag to be encrypted/decrypted
         @type  bag: Bag
-        @param gpg_key_user: user name of GPG key used for symmetric key encryption
+        @param gpg_key_user: user name of GPG key used for symmetric key encryption, or '*' for the first key found
         @type  gpg_key_user: str
         @raise ROSBagException: if GPG key user has already been set
         """
         if bag._mode != 'w':
             self._gpg_passphrase = passphrase or os.getenv('ROSBAG_GPG_PASSPHRASE', None)
             return
+        if gpg_key_user == '*':
+            gpg_key_user = _get_default_gpg_user()
         if self._gpg_key_user == gpg_key_user:
             return
         if not self._gpg_key_user:
@@ -214,30 +358,17 @@ class _ROSBagAesCbcEncryptor(_ROSBagEncryptor):
         else:
             raise ROSBagException('Encryption user has already been set to {}'.format(self._gpg_key_user))
 
-    def encrypt_chunk(self, chunk_size, chunk_data_pos, f):
+    def encrypt_chunk(self, chunk):
         """
-        Read chunk from file, encrypt it, and write back to file.
-        @param chunk_size: size of chunk
-        @type  chunk_size: int
-        @param chunk_data_pos: position of chunk data portion
-        @type  chunk_data_pos: int
-        @param f: file stream
-        @type  f: file
-        @return: size of initialization vector and encrypted chunk
-        @rtype:  int
+        Encrypt chunk.  Safe to call from multiple threads.
+        @param chunk: (compressed) chunk data to encrypt
+        @type  chunk: bytes
+        @return: initialization vector followed by the encrypted chunk
+        @rtype:  bytes
         """
-        f.seek(chunk_data_pos)
-        chunk = _read(f, chunk_size)
-        # Encrypt chunk
         iv = get_random_bytes(AES.block_size)
-        f.seek(chunk_data_pos)
-        f.write(iv)
         cipher = AES.new(self._symmetric_key, AES.MODE_CBC, iv)
-        encrypted_chunk = cipher.encrypt(_add_padding(chunk))
-        # Write encrypted chunk
-        f.write(encrypted_chunk)
-        f.truncate(f.tell())
-        return AES.block_size + len(encrypted_chunk)
+        return iv + cipher.encrypt(_add_padding(chunk))
 
     def decrypt_chunk(self, encrypted_chunk):
         """
@@ -383,6 +514,13 @@ def _remove_padding(input_str):
     # Remove PKCS#7 padding from input string
     return input_str[:-ord(input_str[len(input_str) - 1:])]
 
+def _get_default_gpg_user():
+    # Name of the user of the first key found, as chosen by the C++ API for '*'
+    keys = gnupg.GPG().list_keys()
+    if not keys or not keys[0].get('uids'):
+        raise ROSBagEncryptException('GPG key not found')
+    return re.match(r'[^<(]*', keys[0]['uids'][0]).group(0).strip()
+
 def _encrypt_string_gpg(key_user, input):
     gpg = gnupg.GPG()
     enc_data = gpg.encrypt(input, [key_user], always_trust=True)
@@ -401,7 +539,7 @@ class Bag(object):
     """
     Bag serialize messages to and from a single file on disk using the bag format.
     """
-    def __init__(self, f, mode='r', compression=Compression.NONE, chunk_threshold=768 * 1024, allow_unindexed=False, options=None, skip_index=False):
+    def __init__(self, f, mode='r', compression=Compression.NONE, chunk_threshold=768 * 1024, allow_unindexed=False, options=None, skip_index=False, compression_level=None):
         """
         Open a bag file.  The mode can be 'r', 'w', or 'a' for reading (default),
         writing or appending.  The file will be created if it doesn't exist
@@ -418,10 +556,12 @@ class Bag(object):
         @type  chunk_threshold: int
         @param allow_unindexed: if True, allow opening unindexed bags
         @type  allow_unindexed: bool
-        @param options: the bag options (currently: compression and chunk_threshold)
+        @param options: the bag options (currently: compression, compression_level and chunk_threshold)
         @type  options: dict
         @param skip_index: if True, don't read the connection index records on open [2.0+]
         @type  skip_index: bool
+        @param compression_level: compression level, or None for the default level of the compression mode
+        @type  compression_level: int
         @raise ValueError: if any argument is invalid
         @raise ROSBagException: if an error occurs opening file
         @raise ROSBagFormatException: if bag format is corrupted
@@ -431,6 +571,8 @@ class Bag(object):
                 raise ValueError('options must be of type dict')                
             if 'compression' in options:
                 compression = options['compression']
+            if 'compression_level' in options:
+                compression_level = options['compression_level']
             if 'chunk_threshold' in options:
                 chunk_threshold = options['chunk_threshold']
 
@@ -438,12 +580,9 @@ class Bag(object):
         self._filename = None
         self._version  = None
 
-        allowed_compressions = [Compression.NONE, Compression.BZ2]
-        if found_lz4:
-            allowed_compressions.append(Compression.LZ4)
-        if compression not in allowed_compressions:
-            raise ValueError('compression must be one of: %s' % ', '.join(allowed_compressions))  
-        self._compression = compression      
+        _check_compression(compression, compression_level)
+        self._compression       = compression
+        self._compression_level = compression_level
 
         if chunk_threshold < 0:
             raise ValueError('chunk_threshold must be greater than or equal to zero')        
@@ -467,6 +606,7 @@ class Bag(object):
         self._open(f, mode, allow_unindexed)
 
         self._output_file = self._file
+        self._chunk_file  = self._file     # file the (compressed) data of the open chunk is written to
 
     def __iter__(self):
         return self.read_messages()
@@ -480,7 +620,7 @@ class Bag(object):
     @property
     def options(self):
         """Get the options."""
-        return { 'compression' : self._compression, 'chunk_threshold' : self._chunk_threshold }
+        return { 'compression' : self._compression, 'compression_level' : self._compression_level, 'chunk_threshold' : self._chunk_threshold }
     
     @property
     def filename(self):
@@ -516,17 +656,29 @@ class Bag(object):
         return self._compression
     
     def _set_compression(self, compression):
-        """Set the compression method to use for writing."""
-        allowed_compressions = [Compression.NONE, Compression.BZ2]
-        if found_lz4:
-            allowed_compressions.append(Compression.LZ4)
-        if compression not in allowed_compressions:
-            raise ValueError('compression must be one of: %s' % ', '.join(allowed_compressions))        
-        
+        """Set the compression method to use for writing.  The compression level is reset to the default."""
+        _check_compression(compression, None)
+
         self.flush()
-        self._compression = compression
+        self._compression       = compression
+        self._compression_level = None
         
     compression = property(_get_compression, _set_compression)
+
+    # compression_level
+
+    def _get_compression_level(self):
+        """Get the compression level to use for writing (None for the default level)."""
+        return self._compression_level
+
+    def _set_compression_level(self, compression_level):
+        """Set the compression level to use for writing (None for the default level)."""
+        _check_compression(self._compression, compression_level)
+
+        self.flush()
+        self._compression_level = compression_level
+
+    compression_level = property(_get_compression_level, _set_compression_level)
     
     # chunk_threshold
     
@@ -544,9 +696,13 @@ class Bag(object):
         
     chunk_threshold = property(_get_chunk_threshold, _set_chunk_threshold)
 
-    def read_messages(self, topics=None, start_time=None, end_time=None, connection_filter=None, raw=False, return_connection_header=False):
+    def read_messages(self, topics=None, start_time=None, end_time=None, connection_filter=None, raw=False, return_connection_header=False, workers=None, map_fn=None):
         """
         Read messages from the bag, optionally filtered by topic, timestamp and connection details.
+
+        With workers, the messages are deserialized (and map_fn is applied) in a pool of worker
+        processes.  The results are still generated in timestamp order; the number of batches of
+        messages in flight is bounded, so the memory used doesn't grow with the bag size.
         @param topics: list of topics or a single topic. if an empty list is given all topics will be read [optional]
         @type  topics: list(str) or str
         @param start_time: earliest timestamp of message to return [optional]
@@ -557,16 +713,45 @@ class Bag(object):
         @type  connection_filter: function taking (topic, datatype, md5sum, msg_def, header) and returning bool
         @param raw: if True, then generate tuples of (datatype, (data, md5sum, position), pytype)
         @type  raw: bool
+        @param workers: number of worker processes deserializing the messages [optional, default read in this process]
+        @type  workers: int
+        @param map_fn: function applied to each message; its results are generated instead of the messages [optional]
+        @type  map_fn: function taking BagMessage (or BagMessageWithConnectionHeader) and returning a picklable value
         @return: generator of BagMessage(topic, message, timestamp) namedtuples for each message in the bag file
         @rtype:  generator of tuples of (str, U{genpy.Message}, U{genpy.Time}) [not raw] or (str, (str, str, str, tuple, class), U{genpy.Time}) [raw]
+        @raise ValueError: if raw is combined with workers or map_fn
         """
         self.flush()
 
         if topics and type(topics) is str:
             topics = [topics]
+
+        if workers or map_fn is not None:
+            if raw:
+                raise ValueError('raw messages can not be read with workers or map_fn')
+            return self._read_messages_parallel(topics, start_time, end_time, connection_filter, return_connection_header, workers, map_fn)
         
         return self._reader.read_messages(topics, start_time, end_time, connection_filter, raw, return_connection_header)
 
+    def cursor(self, topics=None, connection_filter=None, raw=False, return_connection_header=False):
+        """
+        Create a cursor that can seek to a time and step forward or backward through the
+        messages of the bag, optionally filtered by topic and connection details.
+        @param topics: list of topics or a single topic. if an empty list is given all topics will be read [optional]
+        @type  topics: list(str) or str
+        @param connection_filter: function to filter connections to include [optional]
+        @type  connection_filter: function taking (topic, datatype, md5sum, msg_def, header) and returning bool
+        @param raw: if True, then return messages as tuples of (datatype, data, md5sum, position, pytype)
+        @type  raw: bool
+        @param return_connection_header: if True, return BagMessageWithConnectionHeader tuples
+        @type  return_connection_header: bool
+        @return: cursor positioned before the first message
+        @rtype:  BagCursor
+        """
+        self.flush()
+
+        return BagCursor(self, topics, connection_filter, raw, return_connection_header)
+
     def flush(self):
         """
         Write the open chunk to disk so subsequent reads will read all messages.
@@ -589,6 +774,8 @@ class Bag(object):
         @type  t: U{genpy.Time}
         @param raw: if True, msg is in raw format, i.e. (msg_type, serialized_bytes, md5sum, pytype)
         @type  raw: bool
+        @param connection_header: header of the connection the message was received on; if given with raw, pytype may be None [optional]
+        @type  connection_header: dict
         @raise ValueError: if arguments are invalid or bag is closed
         """
         if not self._file:
@@ -625,7 +812,10 @@ class Bag(object):
         else:
             conn_id = len(self._connections)
 
-            if raw:
+            if raw and connection_header is not None:
+                # The connection header already describes the message type
+                header = connection_header
+            elif raw:
                 if pytype is None:
                     try:
                         pytype = genpy.message.get_message_class(msg_type)
@@ -638,7 +828,7 @@ class Bag(object):
                     print('WARNING: md5sum of loaded type [%s] does not match that specified' % msg_type, file=sys.stderr)
                     #raise ROSBagException('md5sum of loaded type does not match that of data being recorded')
 
-                header = connection_header if connection_header is not None else {
+                header = {
                     'topic': topic,
                     'type': msg_type,
                     'md5sum': md5sum,
@@ -697,6 +887,9 @@ class Bag(object):
 
         # Write message data record
         self._write_message_data_record(conn_id, t, serialized_bytes)
+
+        connection_bytes = self._curr_chunk_info.connection_bytes
+        connection_bytes[conn_id] = connection_bytes.get(conn_id, 0) + len(serialized_bytes)
         
         # Check if we want to stop this chunk
         chunk_size = self._get_chunk_offset()
@@ -912,6 +1105,42 @@ class Bag(object):
             
         return collections.namedtuple("TypesAndTopicsTuple", ["msg_types", "topics"])(msg_types=types, topics=topics_t)
 
+    def get_topic_sizes(self, topic_filters=None):
+        """
+        Returns the number of bytes of serialized message data on each topic in the bag.
+
+        The sizes are read from the chunk info records.  Chunks of bags written without them
+        are scanned once, without deserializing the messages.
+        @param topic_filters: specify one or more topic to filter by.
+        @type topic_filters: either a single str or a list of str.
+        @return: bytes of message data per topic
+        @rtype: dict(str, int)
+        """
+        if topic_filters is not None:
+            if not isinstance(topic_filters, list):
+                topic_filters = [topic_filters]
+            topics = set(topic_filters)
+        else:
+            topics = set([c.topic for c in self._get_connections()])
+
+        topic_sizes = {}
+        for topic in topics:
+            if list(self._get_connections(topic)):
+                topic_sizes[topic] = 0
+
+        if self._version == 102:
+            for topic, msg, _ in self.read_messages(topics=list(topic_sizes.keys()), raw=True):
+                topic_sizes[topic] += len(msg[1])
+        else:
+            if self._mode == 'r':
+                self._reader.read_connection_bytes()
+            for topic in topic_sizes:
+                for connection in self._get_connections(topic):
+                    for chunk in self._chunks:
+                        topic_sizes[topic] += chunk.connection_bytes.get(connection.id, 0)
+
+        return topic_sizes
+
     def set_encryptor(self, encryptor=None, param=None):
         if self._chunks:
             raise ROSBagException('Cannot set encryptor after chunks are written')
@@ -1303,6 +1532,81 @@ class Bag(object):
 
         return sum((h.uncompressed_size for h in self._chunk_headers.values()))
 
+    def _read_messages_parallel(self, topics, start_time, end_time, connection_filter, return_connection_header, workers, map_fn):
+        """
+        Read messages, deserializing them in a pool of worker processes.
+        """
+        import multiprocessing
+
+        # The message classes may be generated from the message definitions, so they're
+        # created before forking the workers, which inherit them
+        message_types = {}
+        for c in self._get_connections(topics, connection_filter):
+            try:
+                message_types[c.md5sum] = _get_message_type(c)
+            except KeyError:
+                raise ROSBagException('Cannot deserialize messages of type [%s].  Message was not preceded in bag by definition' % c.datatype)
+
+        context = None
+        if workers:
+            try:
+                context = multiprocessing.get_context('fork')
+            except AttributeError:
+                context = multiprocessing  # Python 2 always forks
+            except ValueError:
+                pass  # no fork on this platform: deserialize in this process
+
+        raw_messages = self._reader.read_messages(topics, start_time, end_time, connection_filter, True, return_connection_header)
+
+        def batches():
+            batch, batch_bytes = [], 0
+            for m in raw_messages:
+                connection_header = m.connection_header if return_connection_header else None
+                datatype, data, md5sum, position, pytype = m.message
+                batch.append((m.topic, md5sum, data, m.timestamp, connection_header))
+                batch_bytes += len(data)
+                if batch_bytes >= _PARALLEL_BATCH_BYTES or len(batch) >= _PARALLEL_BATCH_COUNT:
+                    yield batch
+                    batch, batch_bytes = [], 0
+            if batch:
+                yield batch
+
+        if context is None:
+            for batch in batches():
+                for result in _deserialize_batch(batch, map_fn is None, (message_types, map_fn)):
+                    yield result
+            return
+
+        pool = context.Pool(workers, _init_message_worker, (message_types, map_fn))
+        try:
+            # Results are collected in submission order: batches that finish early wait in
+            # the bounded window
+            pending = collections.deque()
+            batch_iter = batches()
+            while True:
+                while len(pending) < 2 * workers:
+                    batch = next(batch_iter, None)
+                    if batch is None:
+                        break
+                    pending.append((batch, pool.apply_async(_deserialize_batch, (batch, False))))
+                if not pending:
+                    break
+
+                batch, result = pending.popleft()
+                results = result.get()
+                if map_fn is not None:
+                    for r in results:
+                        yield r
+                else:
+                    for (topic, _, _, t, connection_header), msg in zip(batch, results):
+                        if return_connection_header:
+                            yield BagMessageWithConnectionHeader(topic, msg, t, connection_header)
+                        else:
+                            yield BagMessage(topic, msg, t)
+        finally:
+            pool.terminate()
+            pool.join()
+
     def _read_message(self, position, raw=False, return_connection_header=False):
         """
         Read the message from the given position in the file.
@@ -1627,14 +1931,19 @@ class Bag(object):
 
     def _start_writing_chunk(self, t):
         self._curr_chunk_info = _ChunkInfo(self._file.tell(), t, t)
-        self._write_chunk_header(_ChunkHeader(self._compression, 0, 0))
-        self._curr_chunk_data_pos = self._file.tell()
+        if self._encryptor.encrypts_chunks:
+            # Assemble the chunk in memory, so it is written to disk once, encrypted
+            self._chunk_file = StringIO()
+            self._curr_chunk_data_pos = 0
+        else:
+            self._write_chunk_header(_ChunkHeader(self._compression, 0, 0))
+            self._curr_chunk_data_pos = self._file.tell()
         self._set_compression_mode(self._compression)
         self._chunk_open = True
     
     def _get_chunk_offset(self):
         if self._compression == Compression.NONE:
-            return self._file.tell() - self._curr_chunk_data_pos
+            return self._chunk_file.tell() - self._curr_chunk_data_pos
         else:
             return self._output_file.compressed_bytes_in
 
@@ -1645,21 +1954,31 @@ class Bag(object):
         # Get the uncompressed and compressed sizes
         uncompressed_size = self._get_chunk_offset()
         self._set_compression_mode(Compression.NONE)
-        compressed_size = self._file.tell() - self._curr_chunk_data_pos
 
-        # When encryption is on, compressed_size represents encrypted chunk size;
-        # When decrypting, the actual compressed size can be deduced from the decrypted chunk
-        compressed_size = self._encryptor.encrypt_chunk(compressed_size, self._curr_chunk_data_pos, self._file)
+        if self._chunk_file is not self._file:
+            # When encryption is on, compressed_size represents encrypted chunk size;
+            # When decrypting, the actual compressed size can be deduced from the decrypted chunk
+            encrypted_chunk = self._encryptor.encrypt_chunk(self._chunk_file.getvalue())
+            self._chunk_file  = self._file
+            self._output_file = self._file
+
+            chunk_header = _ChunkHeader(self._compression, len(encrypted_chunk), uncompressed_size)
+            self._write_chunk_header(chunk_header)
+            chunk_header.data_pos = self._file.tell()
+            self._file.write(encrypted_chunk)
+        else:
+            compressed_size = self._file.tell() - self._curr_chunk_data_pos
+
+            # Rewrite the chunk header with the size of the chunk (remembering current offset)
+            end_of_chunk_pos = self._file.tell()
+            self._file.seek(self._curr_chunk_info.pos)
+            chunk_header = _ChunkHeader(self._compression, compressed_size, uncompressed_size, self._curr_chunk_data_pos)
+            self._write_chunk_header(chunk_header)
+            self._file.seek(end_of_chunk_pos)
 
-        # Rewrite the chunk header with the size of the chunk (remembering current offset)
-        end_of_chunk_pos = self._file.tell()
-        self._file.seek(self._curr_chunk_info.pos)
-        chunk_header = _ChunkHeader(self._compression, compressed_size, uncompressed_size, self._curr_chunk_data_pos)
-        self._write_chunk_header(chunk_header)
         self._chunk_headers[self._curr_chunk_info.pos] = chunk_header
 
         # Write out the connection indexes and clear them
-        self._file.seek(end_of_chunk_pos)
         for connection_id, entries in self._curr_chunk_connection_indexes.items():
             self._write_connection_index_record(connection_id, entries)
         self._curr_chunk_connection_indexes.clear()
@@ -1673,14 +1992,11 @@ class Bag(object):
             self._output_file.flush()
         
         # Create the compressor
-        if compression == Compression.BZ2:
-            self._output_file = _CompressorFileFacade(self._file, bz2.BZ2Compressor())
-        elif compression == Compression.LZ4 and found_lz4:
-            self._output_file = _CompressorFileFacade(self._file, roslz4.LZ4Compressor())
-        elif compression == Compression.NONE:
-            self._output_file = self._file
+        if compression == Compression.NONE:
+            self._output_file = self._chunk_file
         else:
-            raise ROSBagException('unsupported compression type: %s' % compression)
+            compressor = get_codec(compression).create_compressor(self._compression_level)
+            self._output_file = _CompressorFileFacade(self._chunk_file, compressor)
 
         self._curr_compression = compression
 
@@ -1754,6 +2070,12 @@ class Bag(object):
             'end_time':   _pack_time(chunk_info.end_time),
             'count':      _pack_uint32(len(chunk_info.connection_counts))
         }
+
+        # Record the message data size of each connection, if known for all of them.  Readers
+        # that don't know the field ignore it.
+        if all(connection_id in chunk_info.connection_bytes for connection_id in chunk_info.connection_counts):
+            header['conn_bytes'] = b''.join([_pack_uint32(connection_id) + _pack_uint64(chunk_info.connection_bytes[connection_id])
+                                             for connection_id in chunk_info.connection_counts])
         
         buffer = self._buffer
         buffer.seek(0)
@@ -1764,6 +2086,189 @@ class Bag(object):
 
         _write_record(self._file, header, buffer.getvalue())    
 
+BagCursorEntry = collections.namedtuple('BagCursorEntry', 'topic timestamp datatype')
+
+class BagCursor(object):
+    """
+    Bidirectional cursor over the messages of an indexed bag, in timestamp order.
+
+    The cursor is positioned between messages after L{seek}, and on a message after it
+    has been stepped to with L{next} or L{prev}.  Seeking and stepping bisect the
+    connection indexes, so they take O(log n) time per connection; stepping within a
+    chunk reuses the decompressed chunk of the previous read.
+
+    Use L{Bag.cursor} to create a cursor.
+    """
+    def __init__(self, bag, topics=None, connection_filter=None, raw=False, return_connection_header=False):
+        """
+        @param bag: bag to read
+        @type  bag: Bag
+        @param topics: list of topics or a single topic. if an empty list is given all topics will be read [optional]
+        @type  topics: list(str) or str
+        @param connection_filter: function to filter connections to include [optional]
+        @type  connection_filter: function taking (topic, datatype, md5sum, msg_def, header) and returning bool
+        @param raw: if True, then return messages as tuples of (datatype, data, md5sum, position, pytype)
+        @type  raw: bool
+        @param return_connection_header: if True, return BagMessageWithConnectionHeader tuples
+        @type  return_connection_header: bool
+        """
+        self._bag                      = bag
+        self._raw                      = raw
+        self._return_connection_header = return_connection_header
+
+        connections = sorted(bag._get_connections(topics, connection_filter), key=lambda c: c.id)
+        indexes     = list(bag._get_indexes(connections))
+
+        self._connections = [(c, index) for c, index in zip(connections, indexes) if index]
+
+        # The position is the sort key (time, connection id, index) of the current message.
+        # A connection id of -1 is before all messages at the time, sys.maxsize after them.
+        self._position = None
+        self.seek_start()
+
+    @property
+    def topics(self):
+        """
+        The topics the cursor reads.
+        """
+        return sorted(set([c.topic for c, _ in self._connections]))
+
+    @property
+    def time(self):
+        """
+        Timestamp of the cursor position.
+        """
+        return self._position[0]
+
+    def seek(self, t):
+        """
+        Move the cursor to just before the first message at or after the given time.
+        @param t: time to seek to
+        @type  t: U{genpy.Time} or float
+        """
+        if not isinstance(t, genpy.Time):
+            t = genpy.Time.from_sec(t)
+        self._position = (t, -1, -1)
+
+    def seek_start(self):
+        """
+        Move the cursor to before the first message.
+        """
+        self.seek(genpy.Time())
+
+    def seek_end(self):
+        """
+        Move the cursor to after the last message.
+        """
+        self._position = (genpy.Time(0xffffffff, 999999999), sys.maxsize, sys.maxsize)
+
+    def peek(self, topics=None):
+        """
+        Return the topic, timestamp and type of the next message, without reading it.
+        @param topics: only consider messages on these topics [optional]
+        @type  topics: list(str) or str
+        @return: the next message entry, or None if there are no more messages
+        @rtype:  BagCursorEntry
+        """
+        return self._entry(self._find_next(topics))
+
+    def peek_prev(self, topics=None):
+        """
+        Return the topic, timestamp and type of the previous message, without reading it.
+        @param topics: only consider messages on these topics [optional]
+        @type  topics: list(str) or str
+        @return: the previous message entry, or None if there are no previous messages
+        @rtype:  BagCursorEntry
+        """
+        return self._entry(self._find_prev(topics))
+
+    def next(self, topics=None):
+        """
+        Move the cursor to the next message and read it.
+        @param topics: only consider messages on these topics [optional]
+        @type  topics: list(str) or str
+        @return: the next message, or None if there are no more messages (the cursor doesn't move)
+        @rtype:  BagMessage
+        """
+        return self._step(self._find_next(topics))
+
+    def prev(self, topics=None):
+        """
+        Move the cursor to the previous message and read it.
+        @param topics: only consider messages on these topics [optional]
+        @type  topics: list(str) or str
+        @return: the previous message, or None if there are no previous messages (the cursor doesn't move)
+        @rtype:  BagMessage
+        """
+        return self._step(self._find_prev(topics))
+
+    def _get_connections(self, topics):
+        if topics is None:
+            return self._connections
+
+        if type(topics) is str:
+            topics = [topics]
+        topics = set([roslib.names.canonicalize_name(t) for t in topics])
+
+        return [(c, index) for c, index in self._connections
+                if c.topic in topics or roslib.names.canonicalize_name(c.topic) in topics]
+
+    def _find_next(self, topics):
+        t, position_id, position_i = self._position
+        entry = _IndexEntry(t)
+
+        found = None
+        for c, index in self._get_connections(topics):
+            if c.id < position_id:
+                i = bisect.bisect_right(index, entry)
+            elif c.id == position_id:
+                i = position_i + 1
+            else:
+                i = bisect.bisect_left(index, entry)
+
+            if i < len(index):
+                key = (index[i].time, c.id, i)
+                if found is None or key < found[0]:
+                    found = (key, c, index[i])
+
+        return found
+
+    def _find_prev(self, topics):
+        t, position_id, position_i = self._position
+        entry = _IndexEntry(t)
+
+        found = None
+        for c, index in self._get_connections(topics):
+            if c.id < position_id:
+                i = bisect.bisect_right(index, entry) - 1
+            elif c.id == position_id:
+                i = position_i - 1
+            else:
+                i = bisect.bisect_left(index, entry) - 1
+
+            if i >= 0:
+                key = (index[i].time, c.id, i)
+                if found is None or key > found[0]:
+                    found = (key, c, index[i])
+
+        return found
+
+    def _entry(self, found):
+        if found is None:
+            return None
+
+        _, c, index_entry = found
+
+        return BagCursorEntry(c.topic, index_entry.time, c.datatype)
+
+    def _step(self, found):
+        if found is None:
+            return None
+
+        self._position, _, index_entry = found
+
+        return self._bag._read_message(index_entry.position, self._raw, self._return_connection_header)
+
 ### Implementation ###
 
 _message_types = {}   # md5sum -> type
@@ -1817,6 +2322,7 @@ class _ChunkInfo(object):
         self.end_time   = end_time
         
         self.connection_counts = {}
+        self.connection_bytes  = {}   # connection id -> bytes of message data
 
     def __str__(self):
         s  = 'chunk_pos:   %d\n' % self.pos
@@ -2500,12 +3006,7 @@ class _BagReader200(_BagReader):
             compressed_chunk = self.bag._encryptor.decrypt_chunk(encrypted_chunk)
 
             # Decompress it
-            if chunk_header.compression == Compression.BZ2:
-                self.decompressed_chunk = bz2.decompress(compressed_chunk)
-            elif chunk_header.compression == Compression.LZ4 and found_lz4:
-                self.decompressed_chunk = roslz4.decompress(compressed_chunk)
-            else:
-                raise ROSBagException('unsupported compression type: %s' % chunk_header.compression)
+            self.decompressed_chunk = get_codec(chunk_header.compression).decompress(compressed_chunk)
 
             if self.decompressed_chunk_io:
                 self.decompressed_chunk_io.close()
@@ -2552,7 +3053,11 @@ class _BagReader200(_BagReader):
                     self.bag._curr_chunk_info.connection_counts[connection_id] = 1
 
                 # Skip over the message content
-                _skip_sized(chunk_file)
+                size = _read_uint32(chunk_file)
+                chunk_file.seek(size, os.SEEK_CUR)
+
+                connection_bytes = self.bag._curr_chunk_info.connection_bytes
+                connection_bytes[connection_id] = connection_bytes.get(connection_id, 0) + size
 
                 # Insert the message entry (in order) into the connection index
                 if connection_id not in self.bag._connection_indexes:
@@ -2751,6 +3256,14 @@ class _BagReader200(_BagReader):
 
             chunk_info = _ChunkInfo(chunk_pos, start_time, end_time)
 
+            if 'conn_bytes' in header:
+                conn_bytes = header['conn_bytes']
+                if len(conn_bytes) % 12 != 0:
+                    raise ROSBagFormatException('Error reading conn_bytes field of chunk info record')
+                for offset in range(0, len(conn_bytes), 12):
+                    connection_id, size = struct.unpack_from('<LQ', conn_bytes, offset)
+                    chunk_info.connection_bytes[connection_id] = size
+
             _read_uint32(f)   # skip the record data size
 
             for i in range(connection_count):
@@ -2799,9 +3312,31 @@ class _BagReader200(_BagReader):
 
         return (connection_id, index)
 
-    def seek_and_read_message_data_record(self, position, raw, return_connection_header=False):
-        chunk_pos, offset = position
+    def read_connection_bytes(self):
+        """
+        Fill in the message data size of each connection in chunks whose chunk info record
+        doesn't store it, by walking the chunk records without deserializing the messages.
+        """
+        for chunk_info in self.bag._chunks:
+            if all(connection_id in chunk_info.connection_bytes for connection_id in chunk_info.connection_counts):
+                continue
+
+            chunk_header = self.bag._chunk_headers[chunk_info.pos]
+            f = self._get_chunk_io(chunk_info.pos)
+            f.seek(0)
+
+            connection_bytes = {}
+            while f.tell() < chunk_header.uncompressed_size:
+                header = _read_header(f)
+                size = _read_uint32(f)
+                if _read_uint8_field(header, 'op') == _OP_MSG_DATA:
+                    connection_id = _read_uint32_field(header, 'conn')
+                    connection_bytes[connection_id] = connection_bytes.get(connection_id, 0) + size
+                f.seek(size, os.SEEK_CUR)
 
+            chunk_info.connection_bytes = connection_bytes
+
+    def _get_chunk_io(self, chunk_pos):
         chunk_header = self.bag._chunk_headers.get(chunk_pos)
         if chunk_header is None:
             raise ROSBagException('no chunk at position %d' % chunk_pos)
@@ -2827,20 +3362,20 @@ class _BagReader200(_BagReader):
 
                 compressed_chunk = self.bag._encryptor.decrypt_chunk(encrypted_chunk)
 
-                if chunk_header.compression == Compression.BZ2:
-                    self.decompressed_chunk = bz2.decompress(compressed_chunk)
-                elif chunk_header.compression == Compression.LZ4 and found_lz4:
-                    self.decompressed_chunk = roslz4.decompress(compressed_chunk)
-                else:
-                    raise ROSBagException('unsupported compression type: %s' % chunk_header.compression)
-                
+                self.decompressed_chunk = get_codec(chunk_header.compression).decompress(compressed_chunk)
+
                 self.decompressed_chunk_pos = chunk_pos
 
                 if self.decompressed_chunk_io:
                     self.decompressed_chunk_io.close()
                 self.decompressed_chunk_io = StringIO(self.decompressed_chunk)
 
-        f = self.decompressed_chunk_io
+        return self.decompressed_chunk_io
+
+    def seek_and_read_message_data_record(self, position, raw, return_connection_header=False):
+        chunk_pos, offset = position
+
+        f = self._get_chunk_io(chunk_pos)
         f.seek(offset)
 
         # Skip any CONNECTION records
@@ -2904,6 +3439,15 @@ def _human_readable_frequency(freq):
 
     return '-'
 
+def _check_compression(compression, compression_level):
+    if compression == Compression.NONE:
+        if compression_level is not None:
+            raise ValueError('compression level given without compression')
+        return
+    if compression not in _codecs:
+        raise ValueError('compression must be one of: %s' % ', '.join(get_compressions()))
+    _codecs[compression].check_level(compression_level)
+
 class _CompressorFileFacade(object):
     """
     A file facade for sequential compressors (e.g., bz2.BZ2Compressor).
@@ -2924,6 +3468,134 @@ class _CompressorFileFacade(object):
         if len(compressed) > 0:
             self.file.write(compressed)
 
+_PARALLEL_BATCH_BYTES = 1024 * 1024
+_PARALLEL_BATCH_COUNT = 1000
+
+_message_worker_state = None
+
+def _init_message_worker(message_types, map_fn):
+    global _message_worker_state
+    _message_worker_state = (message_types, map_fn)
+
+def _deserialize_batch(batch, wrap, state=None):
+    """
+    Deserialize a batch of (topic, md5sum, data, time, connection header) records and apply
+    the map function to them.  If wrap, the messages are returned as BagMessage tuples.
+    """
+    message_types, map_fn = state or _message_worker_state
+
+    results = []
+    for topic, md5sum, data, t, connection_header in batch:
+        msg = message_types[md5sum]()
+        msg.deserialize(data)
+        if map_fn is not None or wrap:
+            if connection_header is not None:
+                msg = BagMessageWithConnectionHeader(topic, msg, t, connection_header)
+            else:
+                msg = BagMessage(topic, msg, t)
+            if map_fn is not None:
+                msg = map_fn(msg)
+        results.append(msg)
+
+    return results
+
+def _transcode_chunk(chunk, in_compression, in_encryptor, out_compression, out_compression_level, out_encryptor):
+    chunk = in_encryptor.decrypt_chunk(chunk)
+    if in_compression != Compression.NONE:
+        chunk = get_codec(in_compression).decompress(chunk)
+    uncompressed_size = len(chunk)
+    if out_compression != Compression.NONE:
+        chunk = get_codec(out_compression).compress(chunk, out_compression_level)
+    return out_encryptor.encrypt_chunk(chunk), uncompressed_size
+
+def _copy_chunks(inbag, outbag, workers=None, progress=None):
+    """
+    Copy all chunks of a bag to a new bag, changing their compression and
+    encryption to those of the output bag.  The chunk contents and the index
+    entries are copied without parsing the messages.
+
+    Chunks are decrypted, decompressed, compressed and encrypted on a pool of
+    worker threads (the codecs and cipher release the GIL) and written in order.
+    @param inbag: indexed bag to copy [2.0+]
+    @type  inbag: Bag
+    @param outbag: empty bag opened for writing, with the compression and encryptor set
+    @type  outbag: Bag
+    @param workers: number of worker threads [optional, default number of CPUs]
+    @type  workers: int
+    @param progress: called with the number of uncompressed bytes copied so far [optional]
+    @type  progress: function taking int
+    @raise ROSBagException: if the bags can't be copied this way
+    """
+    import multiprocessing
+    from multiprocessing.pool import ThreadPool
+
+    workers = workers or multiprocessing.cpu_count()
+
+    if inbag.version != 200:
+        raise ROSBagException('chunks can only be copied from version 2.0 bags')
+    if outbag._chunks or outbag._connections:
+        raise ROSBagException('chunks can only be copied to an empty bag')
+
+    # Group the index entries by chunk
+    chunk_entries = collections.defaultdict(lambda: collections.defaultdict(list))
+    for connection_id, entries in inbag._connection_indexes.items():
+        for entry in entries:
+            chunk_entries[entry.chunk_pos][connection_id].append(entry)
+
+    for connection_info in inbag._connections.values():
+        outbag._connections[connection_info.id] = connection_info
+        outbag._topic_connections.setdefault(connection_info.topic, connection_info)
+
+    outbag.flush()
+    outbag._file.seek(0, os.SEEK_END)
+
+    def read_chunk(chunk_info):
+        chunk_header = inbag._chunk_headers[chunk_info.pos]
+        inbag._file.seek(chunk_header.data_pos)
+        return _read(inbag._file, chunk_header.compressed_size), chunk_header.compression
+
+    pool = ThreadPool(workers)
+    try:
+        pending = collections.deque()
+        chunk_infos = iter(sorted(inbag._chunks, key=lambda c: c.pos))
+        copied_bytes = 0
+        while True:
+            # Keep a bounded number of chunks in flight
+            while len(pending) < 2 * workers:
+                chunk_info = next(chunk_infos, None)
+                if chunk_info is None:
+                    break
+                chunk, compression = read_chunk(chunk_info)
+                args = (chunk, compression, inbag._encryptor, outbag._compression, outbag._compression_level, outbag._encryptor)
+                pending.append((chunk_info, pool.apply_async(_transcode_chunk, args)))
+            if not pending:
+                break
+
+            in_chunk_info, result = pending.popleft()
+            chunk, uncompressed_size = result.get()
+
+            chunk_info = _ChunkInfo(outbag._file.tell(), in_chunk_info.start_time, in_chunk_info.end_time)
+            chunk_info.connection_counts = dict(in_chunk_info.connection_counts)
+            chunk_info.connection_bytes  = dict(in_chunk_info.connection_bytes)
+
+            chunk_header = _ChunkHeader(outbag._compression, len(chunk), uncompressed_size)
+            outbag._write_chunk_header(chunk_header)
+            chunk_header.data_pos = outbag._file.tell()
+            outbag._file.write(chunk)
+
+            outbag._chunks.append(chunk_info)
+            outbag._chunk_headers[chunk_info.pos] = chunk_header
+
+            for connection_id, entries in sorted(chunk_entries[in_chunk_info.pos].items()):
+                outbag._write_connection_index_record(connection_id, entries)
+                outbag._connection_indexes.setdefault(connection_id, []).extend(_IndexEntry200(e.time, chunk_info.pos, e.offset) for e in entries)
+
+            copied_bytes += uncompressed_size
+            if progress:
+                progress(copied_bytes)
+    finally:
+        pool.terminate()
+
 def _median(values):
     values_len = len(values)
     if values_len == 0:
@@ -0,0 +1,359 @@
+# Software License Agreement (BSD License)
+#
+# Copyright (c) 2010, Willow Garage, Inc.
+# All rights reserved.
+#
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions
+# are met:
+#
+#  * Redistributions of source code must retain the above copyright
+#    notice, this list of conditions and the following disclaimer.
+#  * Redistributions in binary form must reproduce the above
+#    copyright notice, this list of conditions and the following
+#    disclaimer in the documentation and/or other materials provided
+#    with the distribution.
+#  * Neither the name of Willow Garage, Inc. nor the names of its
+#    contributors may be used to endorse or promote products derived
+#    from this software without specific prior written permission.
+#
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS
+# "AS IS" AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT
+# LIMITED TO, THE IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS
+# FOR A PARTICULAR PURPOSE ARE DISCLAIMED. IN NO EVENT SHALL THE
+# COPYRIGHT OWNER OR CONTRIBUTORS BE LIABLE FOR ANY DIRECT, INDIRECT,
+# INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL DAMAGES (INCLUDING,
+# BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES;
+# LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER
+# CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT
+# LIABILITY, OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN
+# ANY WAY OUT OF THE USE OF THIS SOFTWARE, EVEN IF ADVISED OF THE
+# POSSIBILITY OF SUCH DAMAGE.
+
+"""
+Catalog of bag file contents.
+
+Stores the connections and chunk infos of many bag files in a SQLite
+database, so that cross-bag queries don't need to open every bag.
+"""
+
+from __future__ import print_function
+
+import collections
+import multiprocessing
+import os
+import sqlite3
+
+import genpy
+
+from .bag import Bag, ROSBagException
+
+CatalogChunk = collections.namedtuple('CatalogChunk', 'bag chunk_pos start_time end_time message_count')
+CatalogRange = collections.namedtuple('CatalogRange', 'bag topics start_time end_time chunk_positions message_count')
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS bags (
+    id         INTEGER PRIMARY KEY,
+    path       TEXT UNIQUE NOT NULL,
+    mtime      REAL NOT NULL,
+    size       INTEGER NOT NULL,
+    version    INTEGER,
+    start_time INTEGER,
+    end_time   INTEGER,
+    error      TEXT
+);
+CREATE TABLE IF NOT EXISTS connections (
+    bag_id   INTEGER NOT NULL REFERENCES bags(id) ON DELETE CASCADE,
+    conn_id  INTEGER NOT NULL,
+    topic    TEXT NOT NULL,
+    datatype TEXT NOT NULL,
+    md5sum   TEXT NOT NULL,
+    PRIMARY KEY (bag_id, conn_id)
+);
+CREATE TABLE IF NOT EXISTS chunks (
+    bag_id      INTEGER NOT NULL REFERENCES bags(id) ON DELETE CASCADE,
+    chunk_pos   INTEGER NOT NULL,
+    start_time  INTEGER NOT NULL,
+    end_time    INTEGER NOT NULL,
+    compression TEXT,
+    PRIMARY KEY (bag_id, chunk_pos)
+);
+CREATE TABLE IF NOT EXISTS chunk_connections (
+    bag_id    INTEGER NOT NULL REFERENCES bags(id) ON DELETE CASCADE,
+    chunk_pos INTEGER NOT NULL,
+    conn_id   INTEGER NOT NULL,
+    count     INTEGER NOT NULL,
+    PRIMARY KEY (bag_id, chunk_pos, conn_id)
+);
+CREATE INDEX IF NOT EXISTS connections_topic ON connections(topic);
+CREATE INDEX IF NOT EXISTS chunks_time ON chunks(start_time, end_time);
+"""
+
+def _to_nsec(t):
+    if t is None:
+        return None
+    if isinstance(t, (int, float)):
+        return int(t * 1e9)
+    return t.to_nsec()
+
+def _scan_bag(path):
+    """
+    Read the connection and chunk info records of a bag file.  Runs in a worker
+    process, so only returns plain picklable values.
+    @return: (path, version, connections, chunks, error) where connections is a list of
+      (conn_id, topic, datatype, md5sum) and chunks a list of
+      (chunk_pos, start_nsec, end_nsec, compression, {conn_id: count})
+    @rtype: tuple
+    """
+    try:
+        # skip_index: only the file header, connection records, chunk info records
+        # and chunk headers are read; the per-chunk index records are not touched
+        with Bag(path, 'r', skip_index=True) as bag:
+            connections = [(c.id, c.topic, c.datatype, c.md5sum) for c in bag._connections.values()]
+            chunks = []
+            for chunk_info in bag._chunks:
+                chunk_header = bag._chunk_headers.get(chunk_info.pos)
+                chunks.append((chunk_info.pos,
+                               chunk_info.start_time.to_nsec(),
+                               chunk_info.end_time.to_nsec(),
+                               chunk_header.compression if chunk_header else None,
+                               dict(chunk_info.connection_counts)))
+            return (path, bag.version, connections, chunks, None)
+    except (ROSBagException, IOError, OSError) as ex:
+        return (path, None, [], [], str(ex) or ex.__class__.__name__)
+
+class BagCatalog(object):
+    """
+    SQLite catalog of the contents of a directory tree of bag files.
+
+    Only the bag headers and chunk infos are read when cataloging, so building
+    the catalog is cheap even for very large bags.  Refreshing is incremental:
+    bags are only rescanned if their modification time or size changed.
+    """
+    def __init__(self, db_path):
+        """
+        Open (and create, if needed) a catalog database.
+        @param db_path: filename of the SQLite database
+        @type  db_path: str
+        """
+        self._db_path = db_path
+        self._db = sqlite3.connect(db_path)
+        self._db.execute('PRAGMA foreign_keys = ON')
+        self._db.executescript(_SCHEMA)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def close(self):
+        """
+        Close the catalog database.  Closing an already closed catalog does nothing.
+        """
+        if self._db:
+            self._db.close()
+            self._db = None
+
+    def refresh(self, root, workers=None, progress=None):
+        """
+        Scan a directory tree for bag files and update the catalog.  New and modified
+        bags are scanned in parallel; bags which have been removed are dropped from the catalog.
+        @param root: directory to scan
+        @type  root: str
+        @param workers: number of worker processes [optional, defaults to the number of CPUs]
+        @type  workers: int
+        @param progress: function called with the path of each bag after it is scanned [optional]
+        @type  progress: function taking (str)
+        @return: number of bags (re)scanned
+        @rtype: int
+        """
+        root = os.path.abspath(root)
+
+        on_disk = {}
+        for dirpath, _, filenames in os.walk(root):
+            for filename in filenames:
+                if not filename.endswith('.bag') or '.orig.' in filename:
+                    continue
+                path = os.path.join(dirpath, filename)
+                try:
+                    st = os.stat(path)
+                except OSError:
+                    continue
+                on_disk[path] = (st.st_mtime, st.st_size)
+
+        cataloged = {}
+        prefix = os.path.join(root, '')
+        for path, mtime, size in self._db.execute('SELECT path, mtime, size FROM bags WHERE substr(path, 1, ?) = ?', (len(prefix), prefix)):
+            cataloged[path] = (mtime, size)
+
+        with self._db:
+            for path in set(cataloged) - set(on_disk):
+                self._db.execute('DELETE FROM bags WHERE path = ?', (path,))
+
+        stale = sorted(path for path, stat in on_disk.items() if cataloged.get(path) != stat)
+        if not stale:
+            return 0
+
+        if workers == 1 or len(stale) == 1:
+            results = (_scan_bag(path) for path in stale)
+            pool = None
+        else:
+            pool = multiprocessing.Pool(workers)
+            results = pool.imap_unordered(_scan_bag, stale)
+
+        try:
+            for result in results:
+                self._store(result, on_disk[result[0]])
+                if progress:
+                    progress(result[0])
+        finally:
+            if pool:
+                pool.close()
+                pool.join()
+
+        return len(stale)
+
+    def bags(self):
+        """
+        @return: paths of the cataloged bags (excluding bags which couldn't be read)
+        @rtype: list of str
+        """
+        return [row[0] for row in self._db.execute('SELECT path FROM bags WHERE error IS NULL ORDER BY path')]
+
+    def errors(self):
+        """
+        @return: paths of the bags which couldn't be read and the corresponding errors
+        @rtype: list of (str, str)
+        """
+        return list(self._db.execute('SELECT path, error FROM bags WHERE error IS NOT NULL ORDER BY path'))
+
+    def topics(self):
+        """
+        @return: topics and datatypes of all cataloged connections
+        @rtype: list of (str, str)
+        """
+        return list(self._db.execute('SELECT DISTINCT topic, datatype FROM connections ORDER BY topic'))
+
+    def query_chunks(self, topics=None, start_time=None, end_time=None):
+        """
+        Find the chunks containing messages on the given topics in the given time range.
+        @param topics: list of topics or a single topic [optional]
+        @type  topics: list(str) or str
+        @param start_time: earliest timestamp of message [optional]
+        @type  start_time: U{genpy.Time} or float
+        @param end_time: latest timestamp of message [optional]
+        @type  end_time: U{genpy.Time} or float
+        @return: chunks ordered by bag and position; message_count only counts messages on the given topics
+        @rtype: list of CatalogChunk
+        """
+        sql, params = self._chunk_query(topics, start_time, end_time)
+        return [CatalogChunk(path, chunk_pos, genpy.Time(0, start), genpy.Time(0, end), count)
+                for path, chunk_pos, start, end, count in self._db.execute(sql, params)]
+
+    def query(self, topics=None, start_time=None, end_time=None, min_frequency=None):
+        """
+        Find the bags containing messages on the given topics in the given time range.
+
+        Each result can be passed straight into a bag read, e.g.::
+
+          for r in catalog.query('/camera/image', t0, t1, min_frequency=10.0):
+              with rosbag.Bag(r.bag) as bag:
+                  for msg in bag.read_messages(r.topics, r.start_time, r.end_time):
+                      ...
+
+        @param topics: list of topics or a single topic [optional]
+        @type  topics: list(str) or str
+        @param start_time: earliest timestamp of message [optional]
+        @type  start_time: U{genpy.Time} or float
+        @param end_time: latest timestamp of message [optional]
+        @type  end_time: U{genpy.Time} or float
+        @param min_frequency: minimum mean message rate (Hz) on the matching chunks of a bag [optional]
+        @type  min_frequency: float
+        @return: one range per matching bag, ordered by start time
+        @rtype: list of CatalogRange
+        """
+        if topics and isinstance(topics, str):
+            topics = [topics]
+
+        ranges = collections.OrderedDict()
+        for chunk in self.query_chunks(topics, start_time, end_time):
+            if chunk.bag not in ranges:
+                ranges[chunk.bag] = [chunk.start_time, chunk.end_time, [], 0]
+            r = ranges[chunk.bag]
+            r[0] = min(r[0], chunk.start_time)
+            r[1] = max(r[1], chunk.end_time)
+            r[2].append(chunk.chunk_pos)
+            r[3] += chunk.message_count
+
+        if start_time is not None:
+            start_time = genpy.Time(0, _to_nsec(start_time))
+        if end_time is not None:
+            end_time = genpy.Time(0, _to_nsec(end_time))
+
+        results = []
+        for path, (start, end, chunk_positions, count) in ranges.items():
+            if min_frequency is not None:
+                duration = (end - start).to_sec()
+                if count < 2 or duration <= 0.0 or (count - 1) / duration < min_frequency:
+                    continue
+
+            # Clip to the requested range
+            if start_time is not None and start < start_time:
+                start = start_time
+            if end_time is not None and end > end_time:
+                end = end_time
+
+            results.append(CatalogRange(path, list(topics) if topics else None, start, end, chunk_positions, count))
+
+        return sorted(results, key=lambda r: (r.start_time.to_nsec(), r.bag))
+
+    ### Implementation ###
+
+    def _chunk_query(self, topics, start_time, end_time):
+        where = ['b.error IS NULL']
+        params = []
+        if topics:
+            if isinstance(topics, str):
+                topics = [topics]
+            where.append('c.topic IN (%s)' % ', '.join('?' * len(topics)))
+            params.extend(topics)
+        if start_time is not None:
+            where.append('ch.end_time >= ?')
+            params.append(_to_nsec(start_time))
+        if end_time is not None:
+            where.append('ch.start_time <= ?')
+            params.append(_to_nsec(end_time))
+
+        sql = """
+            SELECT b.path, ch.chunk_pos, ch.start_time, ch.end_time, SUM(cc.count)
+            FROM chunks ch
+            JOIN bags b               ON b.id = ch.bag_id
+            JOIN chunk_connections cc ON cc.bag_id = ch.bag_id AND cc.chunk_pos = ch.chunk_pos
+            JOIN connections c        ON c.bag_id = cc.bag_id AND c.conn_id = cc.conn_id
+            WHERE %s
+            GROUP BY b.path, ch.chunk_pos
+            ORDER BY b.path, ch.chunk_pos
+        """ % ' AND '.join(where)
+
+        return sql, params
+
+    def _store(self, result, stat):
+        path, version, connections, chunks, error = result
+        mtime, size = stat
+
+        start_time = min(c[1] for c in chunks) if chunks else None
+        end_time   = max(c[2] for c in chunks) if chunks else None
+
+        with self._db:
+            self._db.execute('DELETE FROM bags WHERE path = ?', (path,))
+            cur = self._db.execute('INSERT INTO bags (path, mtime, size, version, start_time, end_time, error) VALUES (?, ?, ?, ?, ?, ?, ?)',
+                                   (path, mtime, size, version, start_time, end_time, error))
+            bag_id = cur.lastrowid
+
+            self._db.executemany('INSERT INTO connections (bag_id, conn_id, topic, datatype, md5sum) VALUES (?, ?, ?, ?, ?)',
+                                 [(bag_id,) + c for c in connections])
+            self._db.executemany('INSERT INTO chunks (bag_id, chunk_pos, start_time, end_time, compression) VALUES (?, ?, ?, ?, ?)',
+                                 [(bag_id, pos, start, end, compression) for pos, start, end, compression, _ in chunks])
+            self._db.executemany('INSERT INTO chunk_connections (bag_id, chunk_pos, conn_id, count) VALUES (?, ?, ?, ?)',
+                                 [(bag_id, pos, conn_id, count) for pos, _, _, _, counts in chunks for conn_id, count in counts.items()])
@@ -0,0 +1,402 @@
+# Software License Agreement (BSD License)
+#
+# Copyright (c) 2010, Willow Garage, Inc.
+# All rights reserved.
+#
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions
+# are met:
+#
+#  * Redistributions of source code must retain the above copyright
+#    notice, this list of conditions and the following disclaimer.
+#  * Redistributions in binary form must reproduce the above
+#    copyright notice, this list of conditions and the following
+#    disclaimer in the documentation and/or other materials provided
+#    with the distribution.
+#  * Neither the name of Willow Garage, Inc. nor the names of its
+#    contributors may be used to endorse or promote products derived
+#    from this software without specific prior written permission.
+#
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS
+# "AS IS" AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT
+# LIMITED TO, THE IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS
+# FOR A PARTICULAR PURPOSE ARE DISCLAIMED. IN NO EVENT SHALL THE
+# COPYRIGHT OWNER OR CONTRIBUTORS BE LIABLE FOR ANY DIRECT, INDIRECT,
+# INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL DAMAGES (INCLUDING,
+# BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES;
+# LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER
+# CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT
+# LIABILITY, OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN
+# ANY WAY OUT OF THE USE OF THIS SOFTWARE, EVEN IF ADVISED OF THE
+# POSSIBILITY OF SUCH DAMAGE.
+
+"""
+Python playback of bag files into the local rospy graph.
+
+Messages are published without being deserialized: the serialized bytes
+read from the bag are written directly to the subscriber connections.
+"""
+
+from __future__ import print_function
+
+import collections
+import heapq
+import math
+import threading
+import time
+
+try:
+    import Queue as queue  # Python 2.x
+except ImportError:
+    import queue  # Python 3.x
+
+import genpy
+import rospy
+
+from .bag import Bag, ROSBagException, _read_str_field
+
+PlaybackStats = collections.namedtuple('PlaybackStats', 'messages late mean_jitter stddev_jitter max_jitter')
+
+class TimeSource:
+    """
+    Clocks that playback can be timed against
+    """
+    WALL = 'wall'
+    ROS  = 'ros'
+
+_END = object()
+
+class _RawMessage(rospy.AnyMsg):
+    """
+    Base class of the per-connection message classes used for publishing.
+    Instances carry the serialized message in _buff.
+    """
+    __slots__ = []
+
+    def __init__(self, buff=None):
+        self._buff = buff
+
+def _make_raw_class(datatype, md5sum, msg_def):
+    """
+    Create a message class advertising the datatype of a bag connection but
+    publishing already serialized data.
+    """
+    return type('_RawMessage_%s' % datatype.replace('/', '_'), (_RawMessage,),
+                {'__slots__': [], '_type': datatype, '_md5sum': md5sum, '_full_text': msg_def})
+
+class _JitterStats(object):
+    """
+    Streaming mean/variance (Welford) of the difference between the
+    scheduled and actual publish time.
+    """
+    def __init__(self, late_threshold):
+        self.late_threshold = late_threshold
+        self.count = 0
+        self.late  = 0
+        self.mean  = 0.0
+        self.m2    = 0.0
+        self.max   = 0.0
+
+    def add(self, jitter):
+        self.count += 1
+        delta = jitter - self.mean
+        self.mean += delta / self.count
+        self.m2 += delta * (jitter - self.mean)
+        if jitter > self.max:
+            self.max = jitter
+        if jitter > self.late_threshold:
+            self.late += 1
+
+    def get(self):
+        stddev = math.sqrt(self.m2 / (self.count - 1)) if self.count > 1 else 0.0
+        return PlaybackStats(self.count, self.late, self.mean, stddev, self.max)
+
+class BagPlayer(object):
+    """
+    Plays back one or more bag files using rospy publishers, preserving the
+    relative timing of the messages.
+
+    Messages are read from the bags as raw records on a prefetch thread and
+    published without deserialization, using one publisher per topic and type.
+    Playback is timed against the wall clock or the ROS clock (e.g. /clock when
+    use_sim_time is set).  rospy.init_node() must have been called.
+    """
+    def __init__(self, bags, topics=None, start_offset=0.0, duration=None, rate=1.0,
+                 time_source=TimeSource.WALL, publish_clock=False, clock_frequency=100.0,
+                 queue_size=100, prefetch=1000, prefix='', advertise_delay=0.2, late_threshold=0.01):
+        """
+        @param bags: filenames of bags (or opened L{Bag} instances) to play back
+        @type  bags: list of str or L{Bag}
+        @param topics: topics to play back [optional, default all]
+        @type  topics: list(str)
+        @param start_offset: seconds into the bags to start playback at
+        @type  start_offset: float
+        @param duration: seconds of the bags to play back [optional]
+        @type  duration: float
+        @param rate: multiply the publish rate by this factor
+        @type  rate: float
+        @param time_source: clock to time playback against, see L{TimeSource}
+        @type  time_source: str
+        @param publish_clock: if True, publish the bag time on /clock while playing (wall time source only)
+        @type  publish_clock: bool
+        @param clock_frequency: frequency (Hz) at which to publish /clock
+        @type  clock_frequency: float
+        @param queue_size: queue size of the publishers
+        @type  queue_size: int
+        @param prefetch: maximum number of messages read ahead of playback
+        @type  prefetch: int
+        @param prefix: prefix prepended to all published topics
+        @type  prefix: str
+        @param advertise_delay: seconds to wait after advertising new topics (to allow subscribers to connect)
+        @type  advertise_delay: float
+        @param late_threshold: publishes later than this many seconds are counted as late
+        @type  late_threshold: float
+        @raise ValueError: if any argument is invalid
+        """
+        if rate <= 0.0:
+            raise ValueError('rate must be greater than zero')
+        if time_source not in (TimeSource.WALL, TimeSource.ROS):
+            raise ValueError('time_source must be one of: %s, %s' % (TimeSource.WALL, TimeSource.ROS))
+        if publish_clock and time_source != TimeSource.WALL:
+            raise ValueError('cannot publish /clock when playback is timed against the ROS clock')
+        if prefetch < 1:
+            raise ValueError('prefetch must be at least 1')
+
+        self._bag_args        = bags if isinstance(bags, (list, tuple)) else [bags]
+        self._topics          = [topics] if isinstance(topics, str) else topics
+        self._start_offset    = start_offset
+        self._duration        = duration
+        self._rate            = rate
+        self._time_source     = time_source
+        self._publish_clock   = publish_clock
+        self._clock_period    = 1.0 / clock_frequency
+        self._queue_size      = queue_size
+        self._prefetch        = prefetch
+        self._prefix          = prefix.rstrip('/')
+        self._advertise_delay = advertise_delay
+
+        self._publishers   = {}    # (topic, md5sum) -> Publisher
+        self._raw_classes  = {}    # (datatype, md5sum) -> _RawMessage subclass
+        self._clock_pub    = None
+        self._clock_class  = None
+
+        self._queue        = None
+        self._reader       = None
+        self._reader_error = None
+        self._thread       = None
+        self._stop_event   = threading.Event()
+        self._stats        = _JitterStats(late_threshold)
+
+    @property
+    def stats(self):
+        """
+        Get the jitter statistics of the messages published so far.  Jitter is the
+        difference in seconds between the actual and the scheduled publish time.
+        @rtype: PlaybackStats
+        """
+        return self._stats.get()
+
+    def play(self):
+        """
+        Play back the bags, blocking until all messages are published or
+        L{stop()} is called.
+        @raise ROSBagException: if an error occurs reading the bags
+        """
+        self._stop_event.clear()
+
+        bags = [b if isinstance(b, Bag) else Bag(b) for b in self._bag_args]
+        try:
+            bag_start = min(b.get_start_time() for b in bags)
+
+            start_time = genpy.Time.from_sec(bag_start + self._start_offset)
+            end_time = genpy.Time.from_sec(start_time.to_sec() + self._duration) if self._duration is not None else None
+
+            self._queue = queue.Queue(self._prefetch)
+            self._reader_error = None
+            self._reader = threading.Thread(target=self._read, args=(bags, start_time, end_time), name='rosbag_prefetch')
+            self._reader.daemon = True
+            self._reader.start()
+
+            self._run(start_time.to_sec())
+        finally:
+            self._stop_event.set()
+            if self._reader:
+                # Unblock the reader if it is waiting for space in the queue
+                try:
+                    while True:
+                        self._queue.get_nowait()
+                except queue.Empty:
+                    pass
+                self._reader.join()
+                self._reader = None
+            for b, arg in zip(bags, self._bag_args):
+                if b is not arg:
+                    b.close()
+
+        if self._reader_error is not None:
+            raise self._reader_error
+
+    def start(self):
+        """
+        Play back the bags on a background thread.
+        """
+        if self._thread is not None and self._thread.is_alive():
+            raise ROSBagException('playback is already running')
+        self._thread = threading.Thread(target=self.play, name='rosbag_player')
+        self._thread.daemon = True
+        self._thread.start()
+
+    def stop(self):
+        """
+        Stop playback.  Blocks until a background playback has finished.
+        """
+        self._stop_event.set()
+        if self._thread is not None and self._thread is not threading.current_thread():
+            self._thread.join()
+            self._thread = None
+
+    def wait(self, timeout=None):
+        """
+        Wait for a background playback to finish.
+        @return: True if playback has finished
+        @rtype: bool
+        """
+        if self._thread is not None:
+            self._thread.join(timeout)
+            return not self._thread.is_alive()
+        return True
+
+    def close(self):
+        """
+        Stop playback and unregister all publishers.
+        """
+        self.stop()
+        for pub in self._publishers.values():
+            pub.unregister()
+        self._publishers.clear()
+        if self._clock_pub:
+            self._clock_pub.unregister()
+            self._clock_pub = None
+
+    ### Implementation ###
+
+    def _read(self, bags, start_time, end_time):
+        try:
+            readers = [self._decorate(i, b.read_messages(self._topics, start_time, end_time, raw=True, return_connection_header=True))
+                       for i, b in enumerate(bags)]
+            for _, _, m in heapq.merge(*readers):
+                while not self._stop_event.is_set():
+                    try:
+                        self._queue.put(m, timeout=0.1)
+                        break
+                    except queue.Full:
+                        pass
+                if self._stop_event.is_set():
+                    return
+        except Exception as ex:
+            self._reader_error = ex
+        finally:
+            # A stopped player doesn't read the queue anymore, so don't block
+            try:
+                self._queue.put(_END, block=not self._stop_event.is_set(), timeout=1.0)
+            except queue.Full:
+                pass
+
+    @staticmethod
+    def _decorate(index, messages):
+        # Sort key for merging the bags by time; the bag index breaks ties
+        for m in messages:
+            yield (m.timestamp, index, m)
+
+    def _run(self, bag_start):
+        playback_start = None
+
+        while not self._stop_event.is_set() and not rospy.is_shutdown():
+            try:
+                m = self._queue.get(timeout=0.1)
+            except queue.Empty:
+                continue
+            if m is _END:
+                break
+
+            topic, raw_msg, t, header = m
+            pub, advertised = self._get_publisher(topic, raw_msg, header)
+
+            if advertised and self._advertise_delay > 0.0:
+                time.sleep(self._advertise_delay)
+                if playback_start is not None:
+                    # Don't count the advertise delay as playback time
+                    playback_start += self._advertise_delay
+
+            if playback_start is None:
+                playback_start = self._now()
+
+            scheduled = playback_start + (t.to_sec() - bag_start) / self._rate
+            if not self._wait_until(scheduled, playback_start, bag_start):
+                break
+
+            self._stats.add(self._now() - scheduled)
+
+            pub.publish(self._raw_classes[(raw_msg[0], raw_msg[2])](raw_msg[1]))
+
+    def _get_publisher(self, topic, raw_msg, header):
+        datatype, _, md5sum, _, pytype = raw_msg
+
+        key = (topic, md5sum)
+        pub = self._publishers.get(key)
+        if pub is not None:
+            return pub, False
+
+        raw_class = self._raw_classes.get((datatype, md5sum))
+        if raw_class is None:
+            msg_def = header.get('message_definition', pytype._full_text if pytype else '')
+            if isinstance(msg_def, bytes):
+                msg_def = msg_def.decode()
+            raw_class = _make_raw_class(datatype, md5sum, msg_def)
+            self._raw_classes[(datatype, md5sum)] = raw_class
+
+        try:
+            latch = _read_str_field(header, 'latching') == '1'
+        except ROSBagException:
+            latch = False
+
+        pub = rospy.Publisher(self._prefix + topic, raw_class, queue_size=self._queue_size, latch=latch)
+        self._publishers[key] = pub
+        return pub, True
+
+    def _now(self):
+        if self._time_source == TimeSource.WALL:
+            return time.time()
+        return rospy.get_rostime().to_sec()
+
+    def _wait_until(self, scheduled, playback_start, bag_start):
+        """
+        Sleep until the scheduled time, publishing /clock if requested.
+        @return: False if playback was stopped while waiting
+        """
+        while True:
+            if self._stop_event.is_set() or rospy.is_shutdown():
+                return False
+
+            now = self._now()
+            if self._publish_clock:
+                self._publish_bag_time(bag_start + (now - playback_start) * self._rate)
+
+            remaining = scheduled - now
+            if remaining <= 0.0:
+                return True
+
+            if self._time_source == TimeSource.WALL:
+                self._stop_event.wait(min(remaining, self._clock_period) if self._publish_clock else remaining)
+            else:
+                try:
+                    rospy.sleep(min(remaining, 0.1))
+                except rospy.ROSInterruptException:
+                    return False
+
+    def _publish_bag_time(self, bag_time):
+        if self._clock_pub is None:
+            from rosgraph_msgs.msg import Clock
+            self._clock_pub = rospy.Publisher('/clock', Clock, queue_size=1)
+            self._clock_class = Clock
+        self._clock_pub.publish(self._clock_class(clock=rospy.Time.from_sec(bag_time)))
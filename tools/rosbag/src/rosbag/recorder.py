@@ -0,0 +1,333 @@
+# Software License Agreement (BSD License)
+#
+# Copyright (c) 2010, Willow Garage, Inc.
+# All rights reserved.
+#
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions
+# are met:
+#
+#  * Redistributions of source code must retain the above copyright
+#    notice, this list of conditions and the following disclaimer.
+#  * Redistributions in binary form must reproduce the above
+#    copyright notice, this list of conditions and the following
+#    disclaimer in the documentation and/or other materials provided
+#    with the distribution.
+#  * Neither the name of Willow Garage, Inc. nor the names of its
+#    contributors may be used to endorse or promote products derived
+#    from this software without specific prior written permission.
+#
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS
+# "AS IS" AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT
+# LIMITED TO, THE IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS
+# FOR A PARTICULAR PURPOSE ARE DISCLAIMED. IN NO EVENT SHALL THE
+# COPYRIGHT OWNER OR CONTRIBUTORS BE LIABLE FOR ANY DIRECT, INDIRECT,
+# INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL DAMAGES (INCLUDING,
+# BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES;
+# LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER
+# CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT
+# LIABILITY, OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN
+# ANY WAY OUT OF THE USE OF THIS SOFTWARE, EVEN IF ADVISED OF THE
+# POSSIBILITY OF SUCH DAMAGE.
+
+
+"""
+Python recording of topics from the local rospy graph into bag files.
+
+Messages are subscribed to as L{rospy.AnyMsg}, so they are never
+deserialized: the received bytes and the connection header are queued
+and written to the bag by a background thread.
+"""
+
+from __future__ import print_function
+
+import collections
+import os
+import re
+import threading
+
+import rospy
+
+from .bag import Bag, Compression, ROSBagException
+
+TopicStats = collections.namedtuple('TopicStats', 'messages bytes dropped')
+
+class _RawSubscriptions(object):
+    """
+    Subscribes as L{rospy.AnyMsg} to every published topic matching a set of
+    regular expressions, polling the master for new topics.  Subclasses
+    implement _callback(msg, topic).
+    """
+    def __init__(self, topics, exclude, discovery_period, queue_size):
+        if topics is None:
+            topics = ['.*']
+        elif isinstance(topics, str):
+            topics = [topics]
+
+        self._topic_patterns   = [re.compile('(?:%s)$' % t) for t in topics]
+        self._exclude_pattern  = re.compile('(?:%s)$' % exclude) if exclude else None
+        self._discovery_period = discovery_period
+        self._queue_size       = queue_size
+
+        self._subscribers      = {}    # topic -> Subscriber
+        self._discovery        = None
+        self._discovery_stop   = threading.Event()
+
+    def _is_selected(self, topic):
+        if self._exclude_pattern and self._exclude_pattern.match(topic):
+            return False
+        return any(p.match(topic) for p in self._topic_patterns)
+
+    def _subscribe(self):
+        self._discovery_stop.clear()
+        self._discover()
+        self._discovery = threading.Thread(target=self._discover_loop, name='rosbag_discovery')
+        self._discovery.daemon = True
+        self._discovery.start()
+
+    def _unsubscribe(self):
+        self._discovery_stop.set()
+        if self._discovery is not None:
+            self._discovery.join()
+            self._discovery = None
+
+        for sub in self._subscribers.values():
+            sub.unregister()
+        self._subscribers.clear()
+
+    def _discover_loop(self):
+        while not self._discovery_stop.wait(self._discovery_period):
+            self._discover()
+
+    def _discover(self):
+        try:
+            published = rospy.get_published_topics()
+        except Exception as ex:
+            rospy.logwarn('unable to get published topics: %s' % ex)
+            return
+
+        for topic, _ in published:
+            if topic in self._subscribers or not self._is_selected(topic) or self._discovery_stop.is_set():
+                continue
+            self._subscribers[topic] = rospy.Subscriber(topic, rospy.AnyMsg, self._callback, callback_args=topic,
+                                                        queue_size=self._queue_size)
+
+    def _callback(self, msg, topic):
+        raise NotImplementedError()
+
+class Recorder(_RawSubscriptions):
+    """
+    Records topics to bag files from within a rospy node.
+
+    Subscriptions are made to every published topic matching the topic
+    patterns; the master is polled for new topics while recording.  Received
+    messages are buffered in memory (up to buffer_size bytes) and written by
+    a background thread, so slow disk writes don't block the subscriber
+    threads.  If the buffer is full the oldest queued message is dropped and
+    counted.  rospy.init_node() must have been called.
+    """
+    def __init__(self, filename, topics=None, exclude=None, compression=Compression.NONE,
+                 chunk_threshold=768 * 1024, buffer_size=256 * 1024 * 1024,
+                 split_size=None, split_duration=None, discovery_period=1.0, queue_size=100):
+        """
+        @param filename: name of the bag file to record to.  When splitting, the index of the split is inserted before the extension.
+        @type  filename: str
+        @param topics: regular expressions matching the topics to record (full match) [optional, default all topics]
+        @type  topics: list(str)
+        @param exclude: regular expression matching topics not to record (full match) [optional]
+        @type  exclude: str
+        @param compression: compression to use for the bag, see L{Compression}
+        @type  compression: str
+        @param chunk_threshold: minimum number of uncompressed bytes per chunk
+        @type  chunk_threshold: int
+        @param buffer_size: maximum number of message bytes queued for writing
+        @type  buffer_size: int
+        @param split_size: start a new bag once the current bag reaches this many bytes [optional]
+        @type  split_size: int
+        @param split_duration: start a new bag once the current bag spans this many seconds [optional]
+        @type  split_duration: float
+        @param discovery_period: seconds between queries to the master for new topics
+        @type  discovery_period: float
+        @param queue_size: queue size of the subscribers
+        @type  queue_size: int
+        @raise ValueError: if any argument is invalid
+        """
+        if buffer_size <= 0:
+            raise ValueError('buffer_size must be greater than zero')
+        if split_size is not None and split_size <= 0:
+            raise ValueError('split_size must be greater than zero')
+        if split_duration is not None and split_duration <= 0.0:
+            raise ValueError('split_duration must be greater than zero')
+
+        _RawSubscriptions.__init__(self, topics, exclude, discovery_period, queue_size)
+
+        self._filename         = filename
+        self._compression      = compression
+        self._chunk_threshold  = chunk_threshold
+        self._buffer_size      = buffer_size
+        self._split_size       = split_size
+        self._split_duration   = split_duration
+
+        self._stats        = {}                     # topic -> [messages, bytes, dropped]
+        self._filenames    = []
+
+        self._queue        = collections.deque()    # (topic, buff, header, time)
+        self._queued_bytes = 0
+        self._lock         = threading.Lock()
+        self._queue_cond   = threading.Condition(self._lock)
+        self._stop_event   = threading.Event()
+
+        self._writer       = None
+        self._writer_error = None
+
+    def __enter__(self):
+        self.start()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.stop()
+
+    @property
+    def filenames(self):
+        """
+        Get the filenames of the bags written so far.
+        @rtype: list(str)
+        """
+        with self._lock:
+            return list(self._filenames)
+
+    @property
+    def stats(self):
+        """
+        Get the number of recorded messages and bytes, and dropped messages, per topic.
+        @rtype: dict of str to TopicStats
+        """
+        with self._lock:
+            return dict((topic, TopicStats(*s)) for topic, s in self._stats.items())
+
+    @property
+    def dropped(self):
+        """
+        Get the total number of messages dropped because the buffer was full.
+        @rtype: int
+        """
+        with self._lock:
+            return sum(s[2] for s in self._stats.values())
+
+    def start(self):
+        """
+        Subscribe to the matching topics and start writing.
+        """
+        if self._writer is not None:
+            raise ROSBagException('recorder is already running')
+
+        self._stop_event.clear()
+        self._writer_error = None
+
+        self._writer = threading.Thread(target=self._write, name='rosbag_record_writer')
+        self._writer.daemon = True
+        self._writer.start()
+
+        self._subscribe()
+
+    def stop(self):
+        """
+        Unsubscribe, write all queued messages and close the bag.
+        @raise ROSBagException: if an error occurred writing the bag
+        """
+        if self._writer is None:
+            return
+
+        self._unsubscribe()
+
+        self._stop_event.set()
+        with self._queue_cond:
+            self._queue_cond.notify()
+        self._writer.join()
+        self._writer = None
+
+        if self._writer_error is not None:
+            raise ROSBagException('error writing bag: %s' % self._writer_error)
+
+    ### Implementation ###
+
+    def _callback(self, msg, topic):
+        t = rospy.get_rostime()
+        buff = msg._buff
+
+        with self._queue_cond:
+            stats = self._stats.get(topic)
+            if stats is None:
+                stats = self._stats[topic] = [0, 0, 0]
+
+            if len(buff) > self._buffer_size:
+                stats[2] += 1
+                return
+
+            # Make room by dropping the oldest queued messages
+            while self._queued_bytes + len(buff) > self._buffer_size:
+                dropped_topic, dropped_buff, _, _ = self._queue.popleft()
+                self._queued_bytes -= len(dropped_buff)
+                self._stats[dropped_topic][2] += 1
+
+            self._queue.append((topic, buff, msg._connection_header, t))
+            self._queued_bytes += len(buff)
+            self._queue_cond.notify()
+
+    def _write(self):
+        bag = None
+        bag_start = None
+        try:
+            while True:
+                with self._queue_cond:
+                    while not self._queue and not self._stop_event.is_set():
+                        self._queue_cond.wait(0.1)
+                    if not self._queue:
+                        break
+                    # Write everything queued so far without holding the lock
+                    batch = list(self._queue)
+                    self._queue.clear()
+                    self._queued_bytes = 0
+
+                for topic, buff, header, t in batch:
+                    if bag is None:
+                        bag = self._open_bag()
+                        bag_start = t
+                    elif self._split_duration is not None and (t - bag_start).to_sec() >= self._split_duration:
+                        self._close_bag(bag)
+                        bag = self._open_bag()
+                        bag_start = t
+
+                    bag.write(topic, (header['type'], buff, header['md5sum'], None), t, raw=True, connection_header=header)
+
+                    with self._lock:
+                        stats = self._stats[topic]
+                        stats[0] += 1
+                        stats[1] += len(buff)
+
+                    if self._split_size is not None and bag.size >= self._split_size:
+                        self._close_bag(bag)
+                        bag = None
+        except Exception as ex:
+            self._writer_error = ex
+            rospy.logerr('error writing bag: %s' % ex)
+        finally:
+            if bag is not None:
+                self._close_bag(bag)
+
+    def _open_bag(self):
+        if self._split_size is None and self._split_duration is None:
+            filename = self._filename
+        else:
+            base, ext = os.path.splitext(self._filename)
+            filename = '%s_%d%s' % (base, len(self._filenames), ext)
+
+        with self._lock:
+            self._filenames.append(filename)
+
+        # Write to a temporary file while recording, as the C++ recorder does
+        return Bag(filename + '.active', 'w', compression=self._compression, chunk_threshold=self._chunk_threshold)
+
+    def _close_bag(self, bag):
+        bag.close()
+        os.rename(bag.filename, bag.filename[:-len('.active')])
@@ -48,6 +48,8 @@ import roslib.message
 import roslib.packages
 
 from .bag import Bag, Compression, ROSBagException, ROSBagFormatException, ROSBagUnindexedException, ROSBagEncryptNotSupportedException, ROSBagEncryptException
+from .bag import get_codec, get_compressions, _copy_chunks
+from .catalog import BagCatalog
 from .migration import MessageMigrator, fixbag2, checkbag
 
 def print_trans(old, new, indent):
@@ -591,12 +593,22 @@ def compress_cmd(argv):
     parser.add_option('-q', '--quiet',      action='store_true',  dest='quiet',       help='suppress noncritical messages')
     parser.add_option('-j', '--bz2',        action='store_const', dest='compression', help='use BZ2 compression', const=Compression.BZ2, default=Compression.BZ2)
     parser.add_option(      '--lz4',        action='store_const', dest='compression', help='use lz4 compression', const=Compression.LZ4)
+    parser.add_option(      '--zlib',       action='store_const', dest='compression', help='use zlib compression (not readable by the C++ API)', const=Compression.ZLIB)
+    parser.add_option(      '--lzma',       action='store_const', dest='compression', help='use LZMA compression (not readable by the C++ API)', const=Compression.LZMA)
+    parser.add_option('-l', '--level',      action='store',       dest='level',       help='compression level (default depends on the compression)', type='int', metavar='LEVEL')
     (options, args) = parser.parse_args(argv)
 
     if len(args) < 1:
         parser.error('You must specify at least one bag file.')
 
-    op = lambda inbag, outbag, quiet: change_compression_op(inbag, outbag, options.compression, options.quiet)
+    if options.compression not in get_compressions():
+        parser.error('%s compression is not available.' % options.compression)
+    try:
+        get_codec(options.compression).check_level(options.level)
+    except ValueError as ex:
+        parser.error(str(ex))
+
+    op = lambda inbag, outbag, quiet: change_compression_op(inbag, outbag, options.compression, options.quiet, options.level)
 
     bag_op(args, False, True, lambda b: False, op, options.output_dir, options.force, options.quiet)
 
@@ -642,12 +654,13 @@ def encrypt_cmd(argv):
     parser.add_option("-r", "--param",      action='store',       dest="param",       default='*', help='encryptor plugin parameter')
     parser.add_option('-j', '--bz2',        action='store_const', dest='compression', help='use BZ2 compression', const=Compression.BZ2, default=Compression.NONE)
     parser.add_option(      '--lz4',        action='store_const', dest='compression', help='use lz4 compression', const=Compression.LZ4)
+    parser.add_option(      '--jobs',       action='store',       dest='jobs',        help='number of chunks to encrypt in parallel (default: number of CPUs)', type='int', metavar='N')
     (options, args) = parser.parse_args(argv)
 
     if len(args) < 1:
         parser.error('You must specify at least one bag file.')
 
-    op = lambda inbag, outbag, quiet: change_encryption_op(inbag, outbag, options.plugin, options.param, options.compression, options.quiet)
+    op = lambda inbag, outbag, quiet: change_encryption_op(inbag, outbag, options.plugin, options.param, options.compression, options.quiet, options.jobs)
 
     bag_op(args, False, True, lambda b: False, op, options.output_dir, options.force, options.quiet)
 
@@ -659,15 +672,56 @@ def decrypt_cmd(argv):
     parser.add_option('-q', '--quiet',      action='store_true',  dest='quiet',       help='suppress noncritical messages')
     parser.add_option('-j', '--bz2',        action='store_const', dest='compression', help='use BZ2 compression', const=Compression.BZ2, default=Compression.NONE)
     parser.add_option(      '--lz4',        action='store_const', dest='compression', help='use lz4 compression', const=Compression.LZ4)
+    parser.add_option(      '--jobs',       action='store',       dest='jobs',        help='number of chunks to decrypt in parallel (default: number of CPUs)', type='int', metavar='N')
     (options, args) = parser.parse_args(argv)
 
     if len(args) < 1:
         parser.error('You must specify at least one bag file.')
 
-    op = lambda inbag, outbag, quiet: change_encryption_op(inbag, outbag, 'rosbag/NoEncryptor', '*', options.compression, options.quiet)
+    op = lambda inbag, outbag, quiet: change_encryption_op(inbag, outbag, 'rosbag/NoEncryptor', '*', options.compression, options.quiet, options.jobs)
     # Note the second paramater is True: Python Bag class cannot read index information from encrypted bag files
     bag_op(args, True, False, lambda b: False, op, options.output_dir, options.force, options.quiet)
 
+def catalog_cmd(argv):
+    parser = optparse.OptionParser(usage='rosbag catalog [options] DIR1 [DIR2 ...]',
+                                   description='Build or query a catalog of the bag files in one or more directories.')
+    parser.add_option('-d', '--db',         action='store',      dest='db',        default=None,  help='catalog database FILE (default: DIR1/.rosbag_catalog.db)', metavar='FILE')
+    parser.add_option('-j', '--jobs',       action='store',      dest='jobs',      default=None,  type='int', help='scan bags using N worker processes (default: number of CPUs)', metavar='N')
+    parser.add_option('-n', '--no-refresh', action='store_true', dest='no_refresh', default=False, help='query the catalog without rescanning the directories')
+    parser.add_option('-t', '--topic',      action='append',     dest='topics',    default=[],    help='only list bags containing TOPIC (may be repeated)', metavar='TOPIC')
+    parser.add_option('-s', '--start',      action='store',      dest='start',     default=None,  type='float', help='only list bags with messages after SEC seconds since the epoch', metavar='SEC')
+    parser.add_option('-e', '--end',        action='store',      dest='end',       default=None,  type='float', help='only list bags with messages before SEC seconds since the epoch', metavar='SEC')
+    parser.add_option(      '--min-hz',     action='store',      dest='min_hz',    default=None,  type='float', help='only list bags where the selected topics have a mean rate of at least HZ', metavar='HZ')
+    parser.add_option(      '--chunks',     action='store_true', dest='chunks',    default=False, help='list matching chunk positions instead of bags')
+    parser.add_option('-q', '--quiet',      action='store_true', dest='quiet',     default=False, help='suppress noncritical messages')
+    (options, args) = parser.parse_args(argv)
+
+    if len(args) < 1:
+        parser.error('You must specify at least one directory.')
+    for arg in args:
+        if not os.path.isdir(arg):
+            parser.error('%s is not a directory.' % arg)
+
+    db = options.db or os.path.join(args[0], '.rosbag_catalog.db')
+
+    with BagCatalog(db) as catalog:
+        if not options.no_refresh:
+            for arg in args:
+                count = catalog.refresh(arg, workers=options.jobs)
+                if not options.quiet:
+                    print('Scanned %d bag%s in %s' % (count, '' if count == 1 else 's', arg), file=sys.stderr)
+            if not options.quiet:
+                for path, error in catalog.errors():
+                    print('ERROR reading %s: %s' % (path, error), file=sys.stderr)
+
+        topics = options.topics or None
+        if options.chunks:
+            for c in catalog.query_chunks(topics, options.start, options.end):
+                print('%s %d %.6f %.6f %d' % (c.bag, c.chunk_pos, c.start_time.to_sec(), c.end_time.to_sec(), c.message_count))
+        else:
+            for r in catalog.query(topics, options.start, options.end, options.min_hz):
+                print('%s %.6f %.6f %d' % (r.bag, r.start_time.to_sec(), r.end_time.to_sec(), r.message_count))
+
 def bag_op(inbag_filenames, allow_unindexed, open_inbag, copy_fn, op, output_dir=None, force=False, quiet=False):
     for inbag_filename in inbag_filenames:
         if open_inbag:
@@ -782,8 +836,12 @@ def bag_op(inbag_filenames, allow_unindexed, open_inbag, copy_fn, op, output_dir
         except (ROSBagException, IOError) as ex:
             print('ERROR operating on %s: %s' % (inbag_filename, str(ex)), file=sys.stderr)
 
-def change_compression_op(inbag, outbag, compression, quiet):
+# Encryptors which are implemented by the Python API
+_PYTHON_ENCRYPTORS = ['rosbag/AesCbcEncryptor', 'rosbag/NoEncryptor']
+
+def change_compression_op(inbag, outbag, compression, quiet, compression_level=None):
     outbag.compression = compression
+    outbag.compression_level = compression_level
 
     if quiet:
         for topic, msg, t, conn_header in inbag.read_messages(raw=True, return_connection_header=True):
@@ -847,7 +905,25 @@ def reindex_op(inbag, outbag, quiet):
                 pass
             meter.finish()
 
-def change_encryption_op(inbag, outbag, plugin, param, compression, quiet):
+def change_encryption_op(inbag, outbag, plugin, param, compression, quiet, jobs=None):
+    if plugin in _PYTHON_ENCRYPTORS and sys.platform != 'win32':
+        # Re-encrypt the chunks in Python, on a pool of worker threads
+        if type(inbag) is str:
+            with Bag(inbag) as bag:
+                change_encryption_op(bag, outbag, plugin, param, compression, quiet, jobs)
+            return
+
+        outbag.compression = compression
+        outbag.set_encryptor(plugin if plugin != 'rosbag/NoEncryptor' else None, param)
+
+        if quiet:
+            _copy_chunks(inbag, outbag, jobs)
+        else:
+            meter = ProgressMeter(outbag.filename, inbag._uncompressed_size)
+            _copy_chunks(inbag, outbag, jobs, meter.step)
+            meter.finish()
+        return
+
     # Output file must be closed before written by the encrypt process
     outbag.close()
 
@@ -1013,6 +1089,7 @@ def rosbagmain(argv=None):
     cmds.add_cmd('compress', compress_cmd, 'Compress one or more bag files.')
     cmds.add_cmd('decompress', decompress_cmd, 'Decompress one or more bag files.')
     cmds.add_cmd('reindex', reindex_cmd, 'Reindexes one or more bag files.')
+    cmds.add_cmd('catalog', catalog_cmd, 'Build or query a catalog of the bag files in one or more directories.')
     if sys.platform != 'win32':
         cmds.add_cmd('encrypt', encrypt_cmd, 'Encrypt one or more bag files.')
         cmds.add_cmd('decrypt', decrypt_cmd, 'Decrypt one or more bag files.')
@@ -0,0 +1,286 @@
+# Software License Agreement (BSD License)
+#
+# Copyright (c) 2010, Willow Garage, Inc.
+# All rights reserved.
+#
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions
+# are met:
+#
+#  * Redistributions of source code must retain the above copyright
+#    notice, this list of conditions and the following disclaimer.
+#  * Redistributions in binary form must reproduce the above
+#    copyright notice, this list of conditions and the following
+#    disclaimer in the documentation and/or other materials provided
+#    with the distribution.
+#  * Neither the name of Willow Garage, Inc. nor the names of its
+#    contributors may be used to endorse or promote products derived
+#    from this software without specific prior written permission.
+#
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS
+# "AS IS" AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT
+# LIMITED TO, THE IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS
+# FOR A PARTICULAR PURPOSE ARE DISCLAIMED. IN NO EVENT SHALL THE
+# COPYRIGHT OWNER OR CONTRIBUTORS BE LIABLE FOR ANY DIRECT, INDIRECT,
+# INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL DAMAGES (INCLUDING,
+# BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES;
+# LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER
+# CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT
+# LIABILITY, OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN
+# ANY WAY OUT OF THE USE OF THIS SOFTWARE, EVEN IF ADVISED OF THE
+# POSSIBILITY OF SUCH DAMAGE.
+
+
+"""
+In-memory snapshots of recent traffic, written to a bag file on demand.
+"""
+
+from __future__ import print_function
+
+import array
+import collections
+import heapq
+import threading
+
+import genpy
+import rospy
+
+from .bag import Bag, Compression
+from .recorder import _RawSubscriptions
+
+SnapshotStats = collections.namedtuple('SnapshotStats', 'messages bytes dropped')
+
+class _MessageRing(object):
+    """
+    Fixed-capacity ring of serialized messages for a single topic.
+
+    Message data is copied into a preallocated bytearray and the time, offset,
+    length and connection header of each message are kept in preallocated
+    arrays, so storing a message doesn't allocate.  Messages are stored contiguously; when one
+    doesn't fit the oldest messages are evicted.
+    """
+    def __init__(self, max_bytes, max_messages, duration):
+        self.data     = bytearray(max_bytes)
+        self.times    = array.array('q', [0]) * max_messages
+        self.offsets  = array.array('q', [0]) * max_messages
+        self.lengths  = array.array('q', [0]) * max_messages
+        self.headers  = [None] * max_messages
+        self.duration = duration    # nsec
+
+        self.head      = 0          # slot of the oldest message
+        self.count     = 0
+        self.write_pos = 0
+        self.size      = 0          # bytes stored
+        self.dropped   = 0          # messages evicted before they expired
+
+    def add(self, buff, t, header):
+        """
+        @param buff: serialized message
+        @type  buff: bytes
+        @param t: receipt time (nsec)
+        @type  t: int
+        @param header: connection header the message was received on
+        @type  header: dict
+        """
+        n = len(buff)
+        capacity = len(self.data)
+        if n > capacity:
+            self.dropped += 1
+            return
+
+        # Evict messages which are too old, and make room for the new one
+        while self.count > 0 and t - self.times[self.head] > self.duration:
+            self._pop(expired=True)
+        if self.count == len(self.times):
+            self._pop()
+
+        while True:
+            if self.count == 0:
+                pos = 0
+                break
+            oldest = self.offsets[self.head]
+            if self.write_pos > oldest:
+                # Free space is at the end and at the start of the buffer
+                if self.write_pos + n <= capacity:
+                    pos = self.write_pos
+                    break
+                if n <= oldest:
+                    pos = 0
+                    break
+            elif self.write_pos + n <= oldest:
+                pos = self.write_pos
+                break
+            self._pop()
+
+        self.data[pos:pos + n] = buff
+        slot = (self.head + self.count) % len(self.times)
+        self.times[slot]   = t
+        self.offsets[slot] = pos
+        self.lengths[slot] = n
+        self.headers[slot] = header
+        self.count += 1
+        self.size += n
+        self.write_pos = pos + n
+
+    def _pop(self, expired=False):
+        self.size -= self.lengths[self.head]
+        self.headers[self.head] = None
+        self.head = (self.head + 1) % len(self.times)
+        self.count -= 1
+        if not expired:
+            self.dropped += 1
+
+    def copy(self, start_time):
+        """
+        Copy the messages received at or after start_time.
+        @return: list of (time, connection header, serialized message)
+        @rtype: list of (int, dict, bytes)
+        """
+        data = memoryview(self.data)
+        messages = []
+        for i in range(self.count):
+            slot = (self.head + i) % len(self.times)
+            if self.times[slot] >= start_time:
+                offset = self.offsets[slot]
+                messages.append((self.times[slot], self.headers[slot], data[offset:offset + self.lengths[slot]].tobytes()))
+        return messages
+
+class Snapshotter(_RawSubscriptions):
+    """
+    Keeps the most recent messages of a set of topics in memory and writes
+    them to a bag file when L{snapshot()} is called.
+
+    Each topic has a ring buffer bounded by time, bytes and number of
+    messages, preallocated when the topic is first received.  Nothing is
+    written to disk until a snapshot is taken.  rospy.init_node() must have
+    been called.
+    """
+    def __init__(self, duration=30.0, max_bytes=64 * 1024 * 1024, max_messages=100000, topics=None, exclude=None,
+                 discovery_period=1.0, queue_size=100):
+        """
+        @param duration: seconds of messages to keep per topic
+        @type  duration: float
+        @param max_bytes: maximum number of message bytes to keep per topic
+        @type  max_bytes: int
+        @param max_messages: maximum number of messages to keep per topic
+        @type  max_messages: int
+        @param topics: regular expressions matching the topics to buffer (full match) [optional, default all topics]
+        @type  topics: list(str)
+        @param exclude: regular expression matching topics not to buffer (full match) [optional]
+        @type  exclude: str
+        @param discovery_period: seconds between queries to the master for new topics
+        @type  discovery_period: float
+        @param queue_size: queue size of the subscribers
+        @type  queue_size: int
+        @raise ValueError: if any argument is invalid
+        """
+        if duration <= 0.0:
+            raise ValueError('duration must be greater than zero')
+        if max_bytes <= 0:
+            raise ValueError('max_bytes must be greater than zero')
+        if max_messages <= 0:
+            raise ValueError('max_messages must be greater than zero')
+
+        _RawSubscriptions.__init__(self, topics, exclude, discovery_period, queue_size)
+
+        self._duration     = int(duration * 1e9)
+        self._max_bytes    = max_bytes
+        self._max_messages = max_messages
+
+        self._rings = {}    # topic -> _MessageRing
+        self._lock  = threading.Lock()
+
+    def __enter__(self):
+        self.start()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.stop()
+
+    @property
+    def stats(self):
+        """
+        Get the number of buffered messages and bytes per topic, and the number of messages
+        dropped or evicted early because the ring was full.
+        @rtype: dict of str to SnapshotStats
+        """
+        with self._lock:
+            return dict((topic, SnapshotStats(r.count, r.size, r.dropped)) for topic, r in self._rings.items())
+
+    def start(self):
+        """
+        Subscribe to the matching topics and start buffering.
+        """
+        self._subscribe()
+
+    def stop(self):
+        """
+        Unsubscribe.  Buffered messages are kept until L{clear()} is called.
+        """
+        self._unsubscribe()
+
+    def clear(self):
+        """
+        Discard all buffered messages.
+        """
+        with self._lock:
+            self._rings.clear()
+
+    def add(self, topic, buff, t, connection_header):
+        """
+        Buffer a serialized message.
+        @param topic: topic the message was received on
+        @type  topic: str
+        @param buff: serialized message
+        @type  buff: bytes
+        @param t: time the message was received
+        @type  t: U{genpy.Time}
+        @param connection_header: header of the connection, with at least the type, md5sum and message_definition fields
+        @type  connection_header: dict
+        """
+        with self._lock:
+            ring = self._rings.get(topic)
+            if ring is None:
+                ring = self._rings[topic] = _MessageRing(self._max_bytes, self._max_messages, self._duration)
+            ring.add(buff, t.to_nsec(), connection_header)
+
+    def snapshot(self, filename, topics=None, compression=Compression.NONE):
+        """
+        Write the buffered messages to a bag file.  Only messages within
+        duration of the most recently received message are written.
+        @param filename: name of the bag file to write
+        @type  filename: str
+        @param topics: topics to write [optional, default all buffered topics]
+        @type  topics: list(str)
+        @param compression: compression to use for the bag, see L{Compression}
+        @type  compression: str
+        @return: number of messages written
+        @rtype: int
+        """
+        if isinstance(topics, str):
+            topics = [topics]
+
+        # Copy the rings, so the bag can be written without blocking the subscribers
+        with self._lock:
+            rings = [(topic, r) for topic, r in self._rings.items() if r.count > 0 and (topics is None or topic in topics)]
+            if rings:
+                end_time = max(r.times[(r.head + r.count - 1) % len(r.times)] for _, r in rings)
+            copies = [(topic, r.copy(end_time - self._duration)) for topic, r in rings]
+
+        def decorate(index, topic, messages):
+            for seq, (t, header, buff) in enumerate(messages):
+                yield (t, index, seq, topic, header, buff)
+
+        count = 0
+        with Bag(filename, 'w', compression=compression) as bag:
+            for t, _, _, topic, header, buff in heapq.merge(*[decorate(i, *c) for i, c in enumerate(copies)]):
+                msg = (header['type'], buff, header['md5sum'], None)
+                bag.write(topic, msg, genpy.Time(t // 1000000000, t % 1000000000), raw=True, connection_header=header)
+                count += 1
+
+        return count
+
+    ### Implementation ###
+
+    def _callback(self, msg, topic):
+        self.add(topic, msg._buff, rospy.get_rostime(), msg._connection_header)
@@ -0,0 +1,76 @@
+import unittest
+import tempfile
+import os
+import shutil
+
+import genpy
+
+import rosbag
+
+class TestBagCatalog(unittest.TestCase):
+    def setUp(self):
+        self.bag_dir = tempfile.mkdtemp(prefix='rosbag_catalog_tests')
+        self.db = os.path.join(self.bag_dir, 'catalog.db')
+
+    def tearDown(self):
+        shutil.rmtree(self.bag_dir)
+
+    def _write_bag(self, name, start, count=100, period=0.05):
+        from std_msgs.msg import Int32
+
+        fname = os.path.join(self.bag_dir, name)
+        if not os.path.isdir(os.path.dirname(fname)):
+            os.makedirs(os.path.dirname(fname))
+
+        with rosbag.Bag(fname, 'w', chunk_threshold=256) as bag:
+            for i in range(count):
+                topic = '/fast' if i % 2 == 0 else '/slow' if i % 10 == 1 else '/other'
+                bag.write(topic, Int32(data=i), genpy.Time.from_sec(start + i * period))
+
+        return fname
+
+    def test_refresh_is_incremental(self):
+        a = self._write_bag('a.bag', 10.0)
+        self._write_bag('sub/b.bag', 100.0)
+
+        with rosbag.BagCatalog(self.db) as catalog:
+            self.assertEqual(catalog.refresh(self.bag_dir), 2)
+            self.assertEqual(catalog.refresh(self.bag_dir), 0)
+
+            os.remove(a)
+            self.assertEqual(catalog.refresh(self.bag_dir), 0)
+            self.assertEqual([os.path.basename(p) for p in catalog.bags()], ['b.bag'])
+
+    def test_unreadable_bags_are_reported(self):
+        with open(os.path.join(self.bag_dir, 'broken.bag'), 'w') as f:
+            f.write('not a bag')
+
+        with rosbag.BagCatalog(self.db) as catalog:
+            catalog.refresh(self.bag_dir, workers=1)
+            self.assertEqual(catalog.bags(), [])
+            self.assertEqual(len(catalog.errors()), 1)
+
+    def test_query(self):
+        a = self._write_bag('a.bag', 10.0)
+        b = self._write_bag('b.bag', 100.0)
+
+        with rosbag.BagCatalog(self.db) as catalog:
+            catalog.refresh(self.bag_dir)
+
+            self.assertEqual([r.bag for r in catalog.query('/fast')], [a, b])
+            self.assertEqual([r.bag for r in catalog.query('/fast', start_time=50.0)], [b])
+            self.assertEqual(catalog.query('/missing'), [])
+
+            # /fast is published at 10 Hz, /slow at 2 Hz
+            self.assertEqual(len(catalog.query('/fast', min_frequency=5.0)), 2)
+            self.assertEqual(len(catalog.query('/slow', min_frequency=5.0)), 0)
+
+            r = catalog.query('/fast', 11.0, 12.0)[0]
+            self.assertEqual(r.bag, a)
+            with rosbag.Bag(r.bag) as bag:
+                msgs = list(bag.read_messages(r.topics, r.start_time, r.end_time))
+            self.assertEqual(len(msgs), 11)
+
+            chunks = catalog.query_chunks('/fast', 11.0, 12.0)
+            self.assertEqual(sorted(c.chunk_pos for c in chunks), sorted(r.chunk_positions))
+            self.assertTrue(all(c.bag == a for c in chunks))
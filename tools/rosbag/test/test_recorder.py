@@ -0,0 +1,113 @@
+import io
+import os
+import shutil
+import tempfile
+import time
+import unittest
+
+import rospy
+
+import rosbag
+
+class TestRecorder(unittest.TestCase):
+    def setUp(self):
+        rospy.rostime.set_rostime_initialized(True)
+        self.bag_dir = tempfile.mkdtemp(prefix='rosbag_recorder_tests')
+
+    def tearDown(self):
+        # back to wall clock time
+        rospy.rostime._rostime_current = None
+        shutil.rmtree(self.bag_dir)
+
+    def _msg(self, data):
+        msg = rospy.AnyMsg()
+        msg._buff = data
+        msg._connection_header = {'type': 'std_msgs/String', 'md5sum': '992ce8a1687cec8c8bd883ec73ca41d1'}
+        return msg
+
+    def test_topic_selection(self):
+        recorder = rosbag.Recorder('test.bag', topics=['/camera/.*', '/odom'], exclude='.*/compressed')
+        self.assertTrue(recorder._is_selected('/camera/image'))
+        self.assertTrue(recorder._is_selected('/odom'))
+        self.assertFalse(recorder._is_selected('/odom_filtered'))
+        self.assertFalse(recorder._is_selected('/camera/image/compressed'))
+
+        recorder = rosbag.Recorder('test.bag')
+        self.assertTrue(recorder._is_selected('/anything'))
+
+    def test_full_buffer_drops_oldest(self):
+        recorder = rosbag.Recorder('test.bag', buffer_size=10)
+        recorder._callback(self._msg(b'aaaa'), '/a')
+        recorder._callback(self._msg(b'bbbb'), '/b')
+        recorder._callback(self._msg(b'cccc'), '/b')
+        recorder._callback(self._msg(b'd' * 11), '/a')
+
+        self.assertEqual([m[1] for m in recorder._queue], [b'bbbb', b'cccc'])
+        self.assertEqual(recorder.dropped, 2)
+        self.assertEqual(recorder.stats['/a'], (0, 0, 2))
+        self.assertEqual(recorder.stats['/b'], (0, 0, 0))
+
+    def test_invalid_arguments(self):
+        self.assertRaises(ValueError, rosbag.Recorder, 'test.bag', buffer_size=0)
+        self.assertRaises(ValueError, rosbag.Recorder, 'test.bag', split_size=0)
+        self.assertRaises(ValueError, rosbag.Recorder, 'test.bag', split_duration=-1.0)
+
+    def _record(self, recorder, messages):
+        """
+        Feed (time, topic, msg) to a running recorder as its subscribers would, then stop it.
+        """
+        # no master: only the messages fed here are recorded
+        recorder._discover = lambda: None
+        recorder.start()
+        try:
+            for t, topic, msg in messages:
+                buff = io.BytesIO()
+                msg.serialize(buff)
+                raw = rospy.AnyMsg()
+                raw._buff = buff.getvalue()
+                raw._connection_header = {'topic': topic, 'type': msg._type, 'md5sum': msg._md5sum,
+                                          'message_definition': msg._full_text}
+                rospy.rostime._set_rostime(rospy.Time.from_sec(t))
+                recorder._callback(raw, topic)
+                if t == messages[0][0] and recorder._split_size is None:
+                    # the bag is written under a temporary name while recording
+                    end = time.time() + 5.0
+                    while not recorder.filenames and time.time() < end:
+                        time.sleep(0.01)
+                    self.assertTrue(os.path.exists(recorder.filenames[0] + '.active'))
+                    self.assertFalse(os.path.exists(recorder.filenames[0]))
+        finally:
+            recorder.stop()
+        self.assertEqual(sorted(os.listdir(self.bag_dir)), sorted(os.path.basename(f) for f in recorder.filenames))
+
+    def _contents(self, filename):
+        with rosbag.Bag(filename) as bag:
+            return [(t.to_sec(), topic, msg.data) for topic, msg, t in bag.read_messages()]
+
+    def test_record(self):
+        from std_msgs.msg import Int32, String
+
+        filename = os.path.join(self.bag_dir, 'test.bag')
+        recorder = rosbag.Recorder(filename)
+        messages = [(100.0 + i, '/ints', Int32(data=i)) for i in range(3)] + [(104.0, '/strings', String(data='x'))]
+        self._record(recorder, messages)
+        self.assertEqual(recorder.filenames, [filename])
+        self.assertEqual(self._contents(filename), [(t, topic, msg.data) for t, topic, msg in messages])
+        self.assertEqual(recorder.stats['/ints'], (3, 12, 0))
+
+    def test_split_by_duration(self):
+        from std_msgs.msg import Int32
+
+        recorder = rosbag.Recorder(os.path.join(self.bag_dir, 'test.bag'), split_duration=1.0)
+        self._record(recorder, [(100.0 + i * 0.4, '/ints', Int32(data=i)) for i in range(5)])
+        self.assertEqual(recorder.filenames, [os.path.join(self.bag_dir, 'test_%d.bag' % i) for i in range(2)])
+        self.assertEqual([[m[2] for m in self._contents(f)] for f in recorder.filenames], [[0, 1, 2], [3, 4]])
+
+    def test_split_by_size(self):
+        from std_msgs.msg import Int32
+
+        # every bag is larger than split_size once a message is written
+        recorder = rosbag.Recorder(os.path.join(self.bag_dir, 'test.bag'), split_size=1)
+        self._record(recorder, [(100.0 + i, '/ints', Int32(data=i)) for i in range(3)])
+        self.assertEqual(recorder.filenames, [os.path.join(self.bag_dir, 'test_%d.bag' % i) for i in range(3)])
+        self.assertEqual([[m[2] for m in self._contents(f)] for f in recorder.filenames], [[0], [1], [2]])
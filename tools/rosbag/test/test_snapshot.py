@@ -0,0 +1,90 @@
+import io
+import os
+import shutil
+import tempfile
+import unittest
+
+import genpy
+
+import rosbag
+from rosbag.snapshot import _MessageRing
+
+class TestSnapshotter(unittest.TestCase):
+    def setUp(self):
+        self.bag_dir = tempfile.mkdtemp(prefix='rosbag_snapshot_tests')
+
+    def tearDown(self):
+        shutil.rmtree(self.bag_dir)
+
+    def _contents(self, ring):
+        return [(t, m) for t, _, m in ring.copy(0)]
+
+    def test_ring_evicts_by_time(self):
+        ring = _MessageRing(max_bytes=100, max_messages=10, duration=10)
+        for t in range(0, 30, 5):
+            ring.add(b'%d' % t, t, None)
+        self.assertEqual(self._contents(ring), [(15, b'15'), (20, b'20'), (25, b'25')])
+        self.assertEqual(ring.dropped, 0)
+
+    def test_ring_evicts_by_size(self):
+        ring = _MessageRing(max_bytes=10, max_messages=3, duration=100)
+        ring.add(b'aaaa', 1, None)
+        ring.add(b'bbbb', 2, None)
+        ring.add(b'cccc', 3, None)    # wraps around, evicting aaaa
+        self.assertEqual(self._contents(ring), [(2, b'bbbb'), (3, b'cccc')])
+        ring.add(b'dd', 4, None)
+        ring.add(b'ee', 5, None)      # slot limit
+        self.assertEqual(self._contents(ring), [(3, b'cccc'), (4, b'dd'), (5, b'ee')])
+        self.assertEqual(ring.size, 8)
+        ring.add(b'f' * 11, 6, None)  # too large
+        self.assertEqual(ring.dropped, 3)
+
+    def test_snapshot(self):
+        from std_msgs.msg import Int32, String
+
+        snapshotter = rosbag.Snapshotter(duration=1.0)
+        for i in range(40):
+            t = genpy.Time.from_sec(100.0 + i * 0.05)
+            for msg in [Int32(data=i), String(data='msg %d' % i)]:
+                topic = '/' + msg._type
+                header = {'topic': topic, 'type': msg._type, 'md5sum': msg._md5sum, 'message_definition': msg._full_text}
+                buff = io.BytesIO()
+                msg.serialize(buff)
+                snapshotter.add(topic, buff.getvalue(), t, header)
+
+        fname = os.path.join(self.bag_dir, 'snapshot.bag')
+        self.assertEqual(snapshotter.snapshot(fname), 42)
+
+        with rosbag.Bag(fname) as bag:
+            self.assertEqual(bag.get_message_count(), 42)
+            msgs = list(bag.read_messages('/std_msgs/Int32'))
+        self.assertEqual([m.message.data for m in msgs], list(range(19, 40)))
+        self.assertEqual(msgs[0].timestamp, genpy.Time.from_sec(100.95))
+
+        self.assertEqual(snapshotter.snapshot(fname, topics=['/std_msgs/String']), 21)
+
+    def test_snapshot_connection_headers(self):
+        from std_msgs.msg import Int32
+
+        # messages keep the connection header they were received on
+        snapshotter = rosbag.Snapshotter(duration=10.0)
+        headers = []
+        for i in range(6):
+            header = {'topic': '/int', 'type': Int32._type, 'md5sum': Int32._md5sum,
+                      'message_definition': Int32._full_text, 'callerid': '/pub%d' % (i % 2)}
+            headers.append(header)
+            buff = io.BytesIO()
+            Int32(data=i).serialize(buff)
+            snapshotter.add('/int', buff.getvalue(), genpy.Time(100 + i), header)
+        ring = snapshotter._rings['/int']
+        self.assertEqual([h for _, h, _ in ring.copy(0)], headers)
+        self.assertEqual([h for _, h, _ in ring.copy(103 * 10**9)], headers[3:])
+
+        # the bag has a connection per topic, described by the header of
+        # the oldest message written
+        fname = os.path.join(self.bag_dir, 'snapshot.bag')
+        self.assertEqual(snapshotter.snapshot(fname), 6)
+        with rosbag.Bag(fname) as bag:
+            msgs = list(bag.read_messages(return_connection_header=True))
+        self.assertEqual([m.message.data for m in msgs], list(range(6)))
+        self.assertEqual(set(m.connection_header['callerid'] for m in msgs), set([b'/pub0']))